@@ -0,0 +1,128 @@
+"""
+Batch analysis of a tcpflow output directory.
+tcpflow writes every direction of a TCP connection to a file named after it: <source ip>.<port>-<destination ip>.<port>
+with the address parts zero padded, e.g. 192.168.001.010.54321-192.168.001.020.05672, and a cN suffix when the same
+address pair is reused. The two directions of every connection are paired, the client being the side that talks to
+the AMQP port, and the connections are analyzed in a pool of worker processes, one output file per connection plus
+a combined summary.
+"""
+import os
+import re
+
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from amqp_constants import AMQP_PORT
+from amqp_output import get_writer, open_output, OUTPUT_SUFFIXES
+from amqp_protocol import ProtocolDetective
+from amqp_protocol_parser import open_dump, MalformedMessage, CLIENT, SERVER
+
+SUMMARY_FILE = "summary.txt"
+
+_tcpflow_name = re.compile(r'^(?P<source>.+)\.(?P<source_port>\d{5})-(?P<destination>.+)\.(?P<destination_port>\d{5})'
+                           r'(?P<suffix>c\d+)?$')
+
+# client_file or server_file is None when only one direction was captured
+TcpflowConnection = namedtuple('TcpflowConnection', 'name client_file server_file')
+ConnectionSummary = namedtuple('ConnectionSummary', 'name client_frames server_frames out_of_order gaps error')
+
+
+def parse_tcpflow_name(filename):
+    """Returns (source, source port, destination, destination port, suffix) or None for other files"""
+    match = _tcpflow_name.match(os.path.basename(filename))
+    if match is None:
+        return None
+    return (match.group('source'), int(match.group('source_port')),
+            match.group('destination'), int(match.group('destination_port')), match.group('suffix') or '')
+
+
+def find_tcpflow_connections(directory, ports=(AMQP_PORT,)):
+    """Pair the tcpflow files of the directory into connections, sorted by name"""
+    directions = {}  # (client, client port, server, server port, suffix) -> {source: path}
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        endpoints = parse_tcpflow_name(filename)
+        if endpoints is None or not os.path.isfile(path):
+            continue
+        source, source_port, destination, destination_port, suffix = endpoints
+        if destination_port in ports:
+            directions.setdefault((source, source_port, destination, destination_port, suffix), {})[CLIENT] = path
+        elif source_port in ports:
+            directions.setdefault((destination, destination_port, source, source_port, suffix), {})[SERVER] = path
+    connections = []
+    for (client, client_port, server, server_port, suffix), paths in sorted(directions.items()):
+        name = "%s.%05d-%s.%05d%s" % (client, client_port, server, server_port, suffix)
+        connections.append(TcpflowConnection(name, paths.get(CLIENT), paths.get(SERVER)))
+    return connections
+
+
+def _iter_counted(messages, counts, source):
+    for message in messages:
+        counts[source] += 1
+        yield message
+
+
+def analyze_tcpflow_connection(connection, output_directory, recover=False, output_format='text', resync=False,
+                               use_mmap=False):
+    """
+    Analyze one connection and write its messages to <output directory>/<name>.txt (.jsonl or .csv for the record
+    formats), returns its summary. The dumps are streamed into the analysis, read from a memory mapping with
+    use_mmap. recover skips damaged parts of the dumps, resync recovers from protocol mismatches. Any error ends only
+    this connection, its summary has the error and the frames counted up to it.
+    """
+    counts = {CLIENT: 0, SERVER: 0}
+    parsers = []
+    out_of_order = 0
+    try:
+        streams = []
+        for filename, source in ((connection.client_file, CLIENT), (connection.server_file, SERVER)):
+            if filename is None:
+                streams.append([])
+                continue
+            parser, messages = open_dump(filename, source, recover, use_mmap)
+            parsers.append(parser)
+            streams.append(_iter_counted(messages, counts, source))
+        output_file = os.path.join(output_directory, connection.name + OUTPUT_SUFFIXES[output_format])
+        with get_writer(open_output(output_file), output_format) as writer:
+            for message in ProtocolDetective(*streams, recover=resync).iter_messages():
+                out_of_order += message.out_of_order
+                writer.write(message)
+    except Exception as e:
+        error = str(e) if isinstance(e, MalformedMessage) else "%s: %s" % (type(e).__name__, e)
+    else:
+        error = None
+    return ConnectionSummary(connection.name, counts[CLIENT], counts[SERVER], out_of_order,
+                             sum(len(parser.gaps) for parser in parsers), error)
+
+
+def analyze_tcpflow_directory(directory, output_directory, ports=(AMQP_PORT,), recover=False, workers=None,
+                              output_format='text', resync=False, use_mmap=False):
+    """
+    Analyze every connection of the directory in a pool of worker processes (one per core by default),
+    returns the summaries in connection name order and writes them to <output directory>/summary.txt
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    connections = find_tcpflow_connections(directory, ports)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = OrderedDict((connection.name, executor.submit(analyze_tcpflow_connection, connection,
+                                                                output_directory, recover, output_format,
+                                                                resync, use_mmap))
+                              for connection in connections)
+        summaries = [future.result() for future in futures.values()]
+    with open(os.path.join(output_directory, SUMMARY_FILE), 'w') as summary_stream:
+        write_summary(summaries, summary_stream)
+    return summaries
+
+
+def write_summary(summaries, output_stream):
+    print("%-50s %10s %10s %12s %5s  %s" % ("connection", "client", "server", "out of order", "gaps", "error"),
+          file=output_stream)
+    for summary in summaries:
+        print("%-50s %10d %10d %12d %5d  %s" % (summary.name, summary.client_frames, summary.server_frames,
+                                                summary.out_of_order, summary.gaps, summary.error or ""),
+              file=output_stream)
+    print("%d connections, %d frames, %d out of order, %d failed" % (
+        len(summaries),
+        sum(summary.client_frames + summary.server_frames for summary in summaries),
+        sum(summary.out_of_order for summary in summaries),
+        sum(1 for summary in summaries if summary.error)), file=output_stream)
@@ -0,0 +1,136 @@
+"""
+Per channel analysis of a connection.
+AMQP multiplexes channels on one connection, every channel is a conversation of its own. The frames are split by
+channel, channel 0 is matched against the connection rules and every other channel against the channel rules,
+optionally in a pool of worker processes, and the per channel orders are merged back into one message sequence.
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from amqp_protocol import ProtocolDetective
+from amqp_protocol_grammar import compile_step
+from amqp_protocol_parser import CLIENT, SERVER
+
+CONNECTION_CHANNEL = 0
+CONNECTION_RULE = "connection"
+CHANNEL_RULE = "use-connection"  # a channel number can be opened and closed several times
+
+
+class MessageToken(object):
+    """The part of a message the detective looks at, cheap to send to a worker process"""
+    __slots__ = ('source', 'index', 'type', 'method', 'out_of_order')
+
+    def __init__(self, source, index, message_type, method):
+        self.source = source
+        self.index = index  # position of the message in its source stream
+        self.type = message_type
+        self.method = method
+        self.out_of_order = False
+
+    def __str__(self):
+        return "%s: %s" % (self.source, self.method)
+
+
+def get_channel(message):
+    return getattr(message, 'channel', CONNECTION_CHANNEL)  # the protocol header has no channel
+
+
+def split_by_channel(client_messages, server_messages):
+    """Returns an OrderedDict of channel -> (client tokens, server tokens)"""
+    channels = OrderedDict()
+    for source, messages, side in ((CLIENT, client_messages, 0), (SERVER, server_messages, 1)):
+        for index, message in enumerate(messages):
+            channel = get_channel(message)
+            if channel not in channels:
+                channels[channel] = ([], [])
+            channels[channel][side].append(MessageToken(source, index, message.type, message.method))
+    return channels
+
+
+def analyze_channel(channel, client_tokens, server_tokens, resync=False):
+    """Returns the channel order as a list of (source, index, out_of_order)"""
+    rule = CONNECTION_RULE if channel == CONNECTION_CHANNEL else CHANNEL_RULE
+    tokens = ProtocolDetective(client_tokens, server_tokens, compile_step(rule), resync).analyze()
+    return [(token.source, token.index, token.out_of_order) for token in tokens]
+
+
+def merge_channel_orders(client_messages, server_messages, channel_orders):
+    """
+    Interleave the client and server streams so that both keep their own order and every channel keeps the order
+    found by its analysis. The other channels only run while the connection is open: between connection.open-ok
+    and the connection.close of channel 0. When the orders contradict each other the head of the client stream is
+    forced out and marked out of order. The marks are set on the messages of the result as they are taken from the
+    streams, so sequences building a new message on every index (e.g. an AMQPFrameStore) keep them too.
+    """
+    streams = ((CLIENT, client_messages), (SERVER, server_messages))
+    ranks = {}  # (source, index) -> (channel, position in the channel order, out of order)
+    for channel, channel_order in channel_orders.items():
+        for position, (source, index, out_of_order) in enumerate(channel_order):
+            ranks[source, index] = channel, position, out_of_order
+    open_end, close_start = _get_connection_bounds(streams, channel_orders.get(CONNECTION_CHANNEL, ()))
+    channel_messages = len(ranks) - len(channel_orders.get(CONNECTION_CHANNEL, ()))  # not merged yet
+    next_positions = dict.fromkeys(channel_orders, 0)
+    next_positions.setdefault(CONNECTION_CHANNEL, 0)
+    stream_positions = [0, 0]
+    result = []
+    while stream_positions[0] < len(client_messages) or stream_positions[1] < len(server_messages):
+        forced = False
+        for side, (source, messages) in enumerate(streams):
+            if stream_positions[side] < len(messages):
+                channel, position, out_of_order = ranks[source, stream_positions[side]]
+                if position > next_positions[channel]:
+                    continue
+                if channel == CONNECTION_CHANNEL:
+                    if position < close_start or not channel_messages:
+                        break
+                elif next_positions[CONNECTION_CHANNEL] >= open_end:
+                    break
+        else:  # the orders are contradicting each other
+            side = 0 if stream_positions[0] < len(client_messages) else 1
+            source, messages = streams[side]
+            channel, position, out_of_order = ranks[source, stream_positions[side]]
+            forced = True
+        source, messages = streams[side]
+        message = messages[stream_positions[side]]
+        if out_of_order or forced:
+            message.out_of_order = True
+        result.append(message)
+        stream_positions[side] += 1
+        next_positions[channel] = max(next_positions[channel], position + 1)
+        if channel != CONNECTION_CHANNEL:
+            channel_messages -= 1
+    return result
+
+
+def _get_connection_bounds(streams, connection_order):
+    """
+    The positions in the channel 0 order just after connection.open-ok and of the first connection.close,
+    0 and past the end when the connection has none of them
+    """
+    open_end, close_start = 0, len(connection_order)
+    for position, (source, index, _) in enumerate(connection_order):
+        method = streams[source == SERVER][1][index].method
+        if method == "connection.open-ok" and not open_end:
+            open_end = position + 1
+        elif method == "connection.close":
+            close_start = position
+            break
+    return open_end, close_start
+
+
+def analyze_by_channel(client_messages, server_messages, workers=None, resync=False):
+    """
+    Analyze every channel separately, in a pool of worker processes if workers is more than 1.
+    With resync the channels recover locally from protocol mismatches.
+    """
+    channels = split_by_channel(client_messages, server_messages)
+    if workers and workers > 1 and len(channels) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = OrderedDict((channel, executor.submit(analyze_channel, channel, client_tokens, server_tokens,
+                                                              resync))
+                                  for channel, (client_tokens, server_tokens) in channels.items())
+            channel_orders = OrderedDict((channel, future.result()) for channel, future in futures.items())
+    else:
+        channel_orders = OrderedDict((channel, analyze_channel(channel, client_tokens, server_tokens, resync))
+                                     for channel, (client_tokens, server_tokens) in channels.items())
+    return merge_channel_orders(client_messages, server_messages, channel_orders)
@@ -1,4 +1,5 @@
 ACCESS_REFUSED = 403
+AMQP_PORT = 5672
 CHANNEL_ERROR = 504
 COMMAND_INVALID = 503
 CONNECTION_FORCED = 320
@@ -36,6 +37,8 @@ AMQP_METHODS = {
             41: "connection.open-ok",
             50: "connection.close",
             51: "connection.close-ok",
+            60: "connection.blocked",
+            61: "connection.unblocked",
         },
     20:
         {
@@ -0,0 +1,180 @@
+"""
+Content reassembly.
+A published, delivered, returned or fetched message is a content method frame followed on the same channel by a
+content HEADER frame and as many BODY frames as it takes to carry the frame_body_size announced by the header.
+The assembler joins them into one ContentMessage per (source, channel), every other frame is passed through in
+stream order.
+"""
+import io
+import tempfile
+
+from collections import deque
+
+from amqp_constants import FRAME_METHOD, FRAME_HEADER, FRAME_BODY
+from amqp_messages import AMQPFrame, _as_bytes
+from amqp_method_decoders import CONTENT_METHODS
+
+DEFAULT_SPILL_THRESHOLD = 1024 * 1024
+
+
+class ContentBody(object):
+    """
+    The body of a content message. Payloads that are views into the dump (zero copy parsing) are kept as views,
+    the data stays where it is. Copied payloads are buffered in memory up to the spill threshold and moved to
+    a temporary file once the body grows past it.
+    """
+    def __init__(self, spill_threshold=DEFAULT_SPILL_THRESHOLD):
+        self.spill_threshold = spill_threshold
+        self.size = 0
+        self._views = []
+        self._buffer = None  # BytesIO, or the temporary file once spilled
+        self.spilled = False
+
+    def append(self, payload):
+        if isinstance(payload, memoryview) and self._buffer is None:
+            self._views.append(payload)
+        else:
+            if self._buffer is None:
+                self._buffer = io.BytesIO()
+                for view in self._views:
+                    self._buffer.write(view)
+                self._views = []
+            self._buffer.write(_as_bytes(payload) or b'')
+            if not self.spilled and self._buffer.tell() > self.spill_threshold:
+                self._spill()
+        self.size += len(payload)
+
+    def _spill(self):
+        spill_file = tempfile.TemporaryFile()
+        spill_file.write(self._buffer.getbuffer())
+        self._buffer = spill_file
+        self.spilled = True
+
+    def read(self):
+        if self._buffer is None:
+            return b''.join(self._views)
+        self._buffer.seek(0)
+        data = self._buffer.read()
+        self._buffer.seek(0, io.SEEK_END)
+        return data
+
+    def close(self):
+        """Release the memory or the temporary file holding the body"""
+        if self._buffer is not None:
+            self._buffer.close()
+        self._buffer = None
+        self._views = []
+
+
+class ContentMessage(object):
+    """A content method frame with its content header and body"""
+    def __init__(self, method_frame, spill_threshold=DEFAULT_SPILL_THRESHOLD):
+        self.method_frame = method_frame
+        self.header_frame = None
+        self.body_frames = 0
+        self.body = ContentBody(spill_threshold)
+
+    @property
+    def source(self):
+        return self.method_frame.source
+
+    @property
+    def channel(self):
+        return self.method_frame.channel
+
+    @property
+    def method(self):
+        return self.method_frame.method
+
+    @property
+    def timestamp(self):
+        return self.method_frame.timestamp
+
+    @property
+    def body_size(self):
+        """The size announced by the content header, None until it is received"""
+        return self.header_frame.frame_body_size if self.header_frame is not None else None
+
+    @property
+    def properties(self):
+        return self.header_frame.properties if self.header_frame is not None else None
+
+    @property
+    def complete(self):
+        return self.header_frame is not None and self.body.size >= self.body_size
+
+    @property
+    def out_of_order(self):
+        return self.method_frame.out_of_order or (self.header_frame is not None and self.header_frame.out_of_order)
+
+    def __str__(self):
+        out_of_order_marker = "(!) " if self.out_of_order else ""
+        if self.header_frame is None:
+            content = "no content header"
+        else:
+            content = "%s, body %d/%d bytes in %d frames%s" % (
+                self.header_frame.parsed_payload, self.body.size, self.body_size, self.body_frames,
+                ", spilled to disk" if self.body.spilled else "")
+        return '%s%s: |CONTENT|%d|%s|%s|%s|' % (out_of_order_marker, self.source, self.channel,
+                                                self.method_frame.parsed_payload, content,
+                                                'END' if self.complete else 'INCOMPLETE')
+
+
+class ContentAssembler(object):
+    """
+    Joins the content frames of a message stream into ContentMessages. A content message takes the place of its
+    method frame in the stream and is handed out once its body is complete, or as incomplete when another method
+    interrupts it on the same channel or the stream ends. The messages behind it wait until then, so the output
+    keeps the order of the stream.
+    """
+    def __init__(self, spill_threshold=DEFAULT_SPILL_THRESHOLD):
+        self.spill_threshold = spill_threshold
+        self._pending = {}  # (source, channel) -> ContentMessage being assembled
+        self._queue = deque()  # messages in stream order, not handed out yet
+
+    def assemble(self, messages):
+        for message in messages:
+            for assembled_message in self.add(message):
+                yield assembled_message
+        for assembled_message in self.close():
+            yield assembled_message
+
+    def add(self, frame):
+        """Returns the messages that are ready after the frame, in stream order"""
+        if not isinstance(frame, AMQPFrame) or frame.type not in (FRAME_METHOD, FRAME_HEADER, FRAME_BODY):
+            self._queue.append(frame)  # protocol headers and heartbeats
+            return self._get_ready()
+        key = frame.source, frame.channel
+        content_message = self._pending.get(key)
+        if frame.type == FRAME_METHOD:
+            self._pending.pop(key, None)  # an interrupted content message is ready as it is
+            if (frame.class_id, frame.method_id) in CONTENT_METHODS:
+                frame = self._pending[key] = ContentMessage(frame, self.spill_threshold)
+            self._queue.append(frame)
+            return self._get_ready()
+        if content_message is None or (frame.type == FRAME_HEADER) != (content_message.header_frame is None):
+            self._queue.append(frame)  # content frames that don't belong to a content method
+            return self._get_ready()
+        if frame.type == FRAME_HEADER:
+            content_message.header_frame = frame
+        else:
+            content_message.body.append(frame.payload)
+            content_message.body_frames += 1
+        if content_message.complete:
+            del self._pending[key]
+        return self._get_ready()
+
+    def close(self):
+        """The stream ended, returns the messages still waiting, incomplete content messages included"""
+        self._pending.clear()
+        return self._get_ready()
+
+    def _get_ready(self):
+        ready = []
+        while self._queue and not self._is_pending(self._queue[0]):
+            ready.append(self._queue.popleft())
+        return ready
+
+    def _is_pending(self, message):
+        return isinstance(message, ContentMessage) and \
+            self._pending.get((message.source, message.channel)) is message
@@ -1,6 +1,7 @@
 import struct
 
 from collections import OrderedDict
+from collections.abc import Mapping
 from datetime import datetime
 
 
@@ -141,4 +142,232 @@ data_type_extraction_methods = {
     'T': extract_timestamp,
     'F': extract_field_table,
     'V': extract_void
-}
\ No newline at end of file
+}
+
+# Offset based decoding: every decode_* function takes the buffer (bytes, bytearray, memoryview or mmap) and the
+# offset to start from, and returns the decoded value together with the offset just past it. Nothing is re-sliced.
+
+_octet = struct.Struct("B")
+_short_short_int = struct.Struct("b")
+_boolean = struct.Struct("?")
+_short_uint = struct.Struct("!H")
+_short_int = struct.Struct("!h")
+_long_uint = struct.Struct("!L")
+_long_int = struct.Struct("!l")
+_long_long_uint = struct.Struct("!Q")
+_long_long_int = struct.Struct("!q")
+_float = struct.Struct("!f")
+_double = struct.Struct("!d")
+_decimal = struct.Struct("!BL")
+
+
+def decode_octet(buffer, offset):
+    return _octet.unpack_from(buffer, offset)[0], offset + 1
+
+
+def decode_short_short_int(buffer, offset):
+    return _short_short_int.unpack_from(buffer, offset)[0], offset + 1
+
+
+decode_short_short_uint = decode_octet
+
+
+def decode_boolean(buffer, offset):
+    return _boolean.unpack_from(buffer, offset)[0], offset + 1
+
+
+def decode_short_uint(buffer, offset):
+    return _short_uint.unpack_from(buffer, offset)[0], offset + 2
+
+
+def decode_short_int(buffer, offset):
+    return _short_int.unpack_from(buffer, offset)[0], offset + 2
+
+
+def decode_long_uint(buffer, offset):
+    return _long_uint.unpack_from(buffer, offset)[0], offset + 4
+
+
+def decode_long_int(buffer, offset):
+    return _long_int.unpack_from(buffer, offset)[0], offset + 4
+
+
+def decode_long_long_uint(buffer, offset):
+    return _long_long_uint.unpack_from(buffer, offset)[0], offset + 8
+
+
+def decode_long_long_int(buffer, offset):
+    return _long_long_int.unpack_from(buffer, offset)[0], offset + 8
+
+
+def decode_float(buffer, offset):
+    return _float.unpack_from(buffer, offset)[0], offset + 4
+
+
+def decode_double(buffer, offset):
+    return _double.unpack_from(buffer, offset)[0], offset + 8
+
+
+def decode_decimal(buffer, offset):
+    scale, result = _decimal.unpack_from(buffer, offset)
+    return float(result) / 10**scale, offset + 5
+
+
+def decode_short_string(buffer, offset):
+    end = offset + 1 + buffer[offset]
+    assert len(buffer) >= end
+    return str(buffer[offset + 1:end], 'utf-8'), end
+
+
+def decode_long_string(buffer, offset):
+    start = offset + 4
+    end = start + _long_uint.unpack_from(buffer, offset)[0]
+    assert len(buffer) >= end
+    return str(buffer[start:end], 'utf-8'), end
+
+
+def decode_timestamp(buffer, offset):
+    timestamp = _long_long_uint.unpack_from(buffer, offset)[0]
+    return datetime.strftime(datetime.utcfromtimestamp(timestamp), '%Y-%m-%d %H:%M:%S.%f'), offset + 8
+
+
+def decode_field_array(buffer, offset):
+    end = offset + 4 + _long_uint.unpack_from(buffer, offset)[0]
+    assert len(buffer) >= end
+    offset += 4
+    result = []
+    while offset < end:
+        element, offset = decode_field_value(buffer, offset + 1, buffer[offset])
+        result.append(element)
+    return result, offset
+
+
+def decode_field_table(buffer, offset):
+    end = offset + 4 + _long_uint.unpack_from(buffer, offset)[0]
+    assert len(buffer) >= end
+    offset += 4
+    result = OrderedDict()
+    while offset < end:
+        key_end = offset + 1 + buffer[offset]
+        field_name = str(buffer[offset + 1:key_end], 'utf-8')
+        result[field_name], offset = decode_field_value(buffer, key_end + 1, buffer[key_end])
+    return result, offset
+
+
+def decode_void(buffer, offset):
+    return '', offset
+
+
+data_type_decoding_methods = {
+    ord('t'): decode_boolean,
+    ord('b'): decode_short_short_int,
+    ord('B'): decode_short_short_uint,
+    ord('U'): decode_short_int,
+    ord('u'): decode_short_uint,
+    ord('I'): decode_long_int,
+    ord('i'): decode_long_uint,
+    ord('L'): decode_long_long_int,
+    ord('l'): decode_long_long_uint,
+    ord('f'): decode_float,
+    ord('d'): decode_double,
+    ord('D'): decode_decimal,
+    ord('s'): decode_short_string,
+    ord('S'): decode_long_string,
+    ord('A'): decode_field_array,
+    ord('T'): decode_timestamp,
+    ord('F'): decode_field_table,
+    ord('V'): decode_void
+}
+
+
+def decode_field_value(buffer, offset, value_type):
+    try:
+        decode = data_type_decoding_methods[value_type]
+    except KeyError:
+        raise ValueError("Unknown field value type: %r" % chr(value_type)) from None
+    return decode(buffer, offset)
+
+
+_fixed_field_value_sizes = {
+    ord('t'): 1,
+    ord('b'): 1,
+    ord('B'): 1,
+    ord('U'): 2,
+    ord('u'): 2,
+    ord('I'): 4,
+    ord('i'): 4,
+    ord('L'): 8,
+    ord('l'): 8,
+    ord('f'): 4,
+    ord('d'): 8,
+    ord('D'): 5,
+    ord('T'): 8,
+    ord('V'): 0
+}
+
+
+def skip_field_value(buffer, offset, value_type):
+    """Returns the offset just past a field value of the given type without decoding it"""
+    size = _fixed_field_value_sizes.get(value_type)
+    if size is not None:
+        return offset + size
+    if value_type == ord('s'):
+        return offset + 1 + buffer[offset]
+    if value_type in (ord('S'), ord('A'), ord('F')):
+        return offset + 4 + _long_uint.unpack_from(buffer, offset)[0]
+    raise ValueError("Unknown field value type: %r" % chr(value_type))
+
+
+class LazyFieldTable(Mapping):
+    """
+    Field table that only scans the offsets of its keys when created.
+    Values are decoded when they are looked up, nested tables are lazy tables themselves.
+    Containment checks and iteration over the keys never decode a value, values that can't be decoded (e.g. long
+    strings that are not UTF-8) are kept as raw bytes.
+    """
+    def __init__(self, buffer, offset):
+        end = offset + 4 + _long_uint.unpack_from(buffer, offset)[0]
+        assert len(buffer) >= end
+        offset += 4
+        self._buffer = buffer
+        self._value_offsets = OrderedDict()
+        self._values = {}
+        while offset < end:
+            key_end = offset + 1 + buffer[offset]
+            value_type = buffer[key_end]
+            self._value_offsets[str(buffer[offset + 1:key_end], 'utf-8')] = value_type, key_end + 1
+            offset = skip_field_value(buffer, key_end + 1, value_type)
+        self.end = offset
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        value_type, value_offset = self._value_offsets[key]
+        try:
+            if value_type == ord('F'):
+                value = LazyFieldTable(self._buffer, value_offset)
+            else:
+                value = decode_field_value(self._buffer, value_offset, value_type)[0]
+        except (struct.error, AssertionError, IndexError, ValueError):
+            value = bytes(self._buffer[value_offset:skip_field_value(self._buffer, value_offset, value_type)])
+        self._values[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self._value_offsets
+
+    def __iter__(self):
+        return iter(self._value_offsets)
+
+    def __len__(self):
+        return len(self._value_offsets)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+def decode_lazy_field_table(buffer, offset):
+    table = LazyFieldTable(buffer, offset)
+    return table, table.end
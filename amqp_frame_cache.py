@@ -0,0 +1,142 @@
+"""
+On disk cache of the frame columns of parsed dumps.
+The columns of an AMQPFrameStore are saved in a cache directory under the sha256 of the dump, the source and the
+cache version. The next run over the same dump maps the cache file and casts the columns out of the mapping instead
+of parsing the dump again. Files written by another cache version or on a platform with another byte order or
+column item sizes are ignored and replaced, the least recently used files are evicted by age and total size.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+
+from amqp_frame_store import AMQPFrameStore
+
+CACHE_VERSION = 2  # bumped whenever the parser or the layout of the cache files changes
+CACHE_SUFFIX = ".frames"
+DEFAULT_MAX_SIZE = 1024 ** 3
+DEFAULT_MAX_AGE = 30 * 24 * 3600  # seconds
+
+COLUMNS = ('types', 'channels', 'class_ids', 'method_ids', 'offsets', 'lengths')
+
+_MAGIC = b'AMQPFRMS'
+# magic, version, byte order, frame count, dump size, then the type code and item size of every column
+_header_struct = struct.Struct("<8sHcQQ" + "cB" * len(COLUMNS))
+_ALIGNMENT = 8
+
+
+def _aligned(offset):
+    return offset + (-offset % _ALIGNMENT)
+
+
+class FrameCache(object):
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def get_path(self, buffer, source):
+        digest = hashlib.sha256(buffer).hexdigest()
+        return os.path.join(self.directory, "%s-%s-v%d%s" % (digest, source.lower(), CACHE_VERSION, CACHE_SUFFIX))
+
+    def get_store(self, buffer, source):
+        """The frame store of the dump, loaded from the cache or scanned and saved to it"""
+        path = self.get_path(buffer, source)
+        store = self.load(path, buffer, source)
+        if store is None:
+            store = AMQPFrameStore.from_buffer(buffer, source)
+            self.save(path, store)
+            self.evict()
+        return store
+
+    def load(self, path, buffer, source):
+        """The store with columns cast from the mapped cache file, None when there is no usable file"""
+        try:
+            with open(path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # missing or empty file
+            return None
+        columns = _get_columns(memoryview(mapping), len(buffer))
+        if columns is None:
+            return None
+        os.utime(path)  # the eviction order is the order of the last use
+        store = AMQPFrameStore(buffer, source)
+        for name, column in zip(COLUMNS, columns):
+            setattr(store, name, column)
+        return store
+
+    def save(self, path, store):
+        """Write the columns to a temporary file renamed into place, concurrent runs never see partial files"""
+        columns = [getattr(store, name) for name in COLUMNS]
+        header = [_MAGIC, CACHE_VERSION, sys.byteorder[0].encode(), len(store), len(store.buffer)]
+        for column in columns:
+            header += [column.typecode.encode(), column.itemsize]
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_header_struct.pack(*header))
+                for column in columns:
+                    f.write(b'\x00' * (-f.tell() % _ALIGNMENT))
+                    f.write(column.tobytes())
+            os.replace(temporary_path, path)
+        except OSError:
+            os.unlink(temporary_path)
+            raise
+
+    def evict(self):
+        """Remove the cache files older than max_age, then the least recently used ones above max_size"""
+        entries = []
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:  # evicted by a concurrent run
+                continue
+            if self.max_age is not None and now - stat.st_mtime > self.max_age:
+                _remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self.max_size is None or total_size <= self.max_size:
+                break
+            _remove(path)
+            total_size -= size
+
+
+def _get_columns(view, dump_size):
+    if len(view) < _header_struct.size:
+        return None
+    header = _header_struct.unpack_from(view, 0)
+    magic, version, byteorder, count, size = header[:5]
+    if (magic, version, byteorder, size) != (_MAGIC, CACHE_VERSION, sys.byteorder[0].encode(), dump_size):
+        return None
+    offset = _header_struct.size
+    columns = []
+    reference_store = AMQPFrameStore(b'', None)
+    for index, name in enumerate(COLUMNS):
+        typecode, itemsize = header[5 + 2 * index].decode(), header[6 + 2 * index]
+        reference_column = getattr(reference_store, name)
+        if (typecode, itemsize) != (reference_column.typecode, reference_column.itemsize):
+            return None
+        offset = _aligned(offset)
+        end = offset + count * itemsize
+        if end > len(view):
+            return None
+        columns.append(view[offset:end].cast(typecode))
+        offset = end
+    return columns
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
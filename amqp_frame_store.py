@@ -0,0 +1,74 @@
+from array import array
+
+from amqp_constants import FRAME_METHOD
+from amqp_messages import AMQPFrame, _method_header_struct
+from amqp_protocol_parser import _get_frame_bounds, _get_protocol_header, MalformedMessage, CLIENT, \
+    PROTOCOL_HEADER_SIZE
+
+PROTOCOL_HEADER_TYPE = 0
+
+
+class AMQPFrameStore(object):
+    """
+    Columnar storage for captures with millions of frames.
+    Only the frame type, channel, class/method ids and the payload offset and length are kept per frame,
+    in array backed columns (19 bytes per frame). AMQPFrame objects are created on demand when indexing the store,
+    their payloads are views into the dump buffer.
+    """
+    def __init__(self, buffer, source):
+        self.buffer = memoryview(buffer)
+        self.source = source
+        self.types = array('B')
+        self.channels = array('H')
+        self.class_ids = array('H')
+        self.method_ids = array('H')
+        self.offsets = array('Q')
+        self.lengths = array('I')  # frame payload sizes are 32 bit
+
+    @classmethod
+    def from_buffer(cls, buffer, source):
+        store = cls(buffer, source)
+        store.scan()
+        return store
+
+    def scan(self):
+        buffer = self.buffer
+        offset = 0
+        if self.source == CLIENT and buffer[:4] == b'AMQP':
+            self.append(PROTOCOL_HEADER_TYPE, 0, 0, 0, 0, PROTOCOL_HEADER_SIZE)
+            offset = PROTOCOL_HEADER_SIZE
+        while offset < len(buffer):
+            frame_bounds = _get_frame_bounds(buffer, offset)
+            if frame_bounds is None:
+                raise MalformedMessage("Truncated frame")
+            frame_type, channel_id, payload_start, payload_end = frame_bounds
+            class_id = method_id = 0
+            if frame_type == FRAME_METHOD:
+                class_id, method_id = _method_header_struct.unpack_from(buffer, payload_start)
+            self.append(frame_type, channel_id, class_id, method_id, payload_start, payload_end - payload_start)
+            offset = payload_end + 1
+
+    def append(self, frame_type, channel_id, class_id, method_id, payload_offset, payload_len):
+        self.types.append(frame_type)
+        self.channels.append(channel_id)
+        self.class_ids.append(class_id)
+        self.method_ids.append(method_id)
+        self.offsets.append(payload_offset)
+        self.lengths.append(payload_len)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        frame_type = self.types[index]
+        payload_offset = self.offsets[index]
+        if frame_type == PROTOCOL_HEADER_TYPE:
+            return _get_protocol_header(self.buffer, payload_offset)
+        return AMQPFrame(self.source,
+                         frame_type,
+                         self.channels[index],
+                         self.buffer[payload_offset:payload_offset + self.lengths[index]])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
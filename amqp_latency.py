@@ -0,0 +1,226 @@
+"""
+Request/reply latency.
+The grammar pairs every synchronous request with its replies: a rule step sent by one side directly followed by a
+step of the other side, e.g. C:queue.declare S:queue.declare-ok or S:connection.start C:connection.start-ok.
+Walking the messages in capture order, every request waits on its channel until one of its replies arrives and the
+difference of their capture timestamps is counted in log scale histograms per method pair and per channel, so the
+memory stays bounded by the number of method pairs and channels, not by the capture size. Requests sent with
+no-wait get no reply and are not counted. The analyzers of several connections merge into one for the whole capture.
+"""
+import math
+
+from collections import deque, OrderedDict
+
+from amqp_channels import get_channel
+from amqp_constants import FRAME_METHOD
+from amqp_frame_store import PROTOCOL_HEADER_TYPE
+from amqp_protocol_grammar import PROTOCOL_GRAMMAR, ATOMIC, SEQUENCE
+from amqp_timeline import _get_timestamp
+
+MAX_PENDING_REQUESTS = 1024  # per channel and request method, the oldest requests are given up as unanswered
+PERCENTILES = (50, 90, 99, 99.9)
+CONTENT_FRAMES = ("HEADER", "BODY")
+
+
+def get_request_replies(grammar=PROTOCOL_GRAMMAR):
+    """Returns {(source, request method): set of (source, reply method)} for the rules of the grammar"""
+    request_replies = OrderedDict()
+    visited = set()
+    nodes = [grammar]
+    while nodes:
+        node = nodes.pop()
+        if id(node) in visited:
+            continue
+        visited.add(id(node))
+        nodes.extend(node.children)
+        if node.kind != SEQUENCE:
+            continue
+        for request, reply in zip(node.children, node.children[1:]):
+            if request.kind == reply.kind == ATOMIC and request.source != reply.source and \
+                    request.method not in CONTENT_FRAMES and reply.method not in CONTENT_FRAMES:
+                request_replies.setdefault((request.source, request.method), set()).add((reply.source, reply.method))
+    return request_replies
+
+
+class LogHistogram(object):
+    """
+    Counts values in buckets whose bounds grow geometrically, buckets_per_octave of them for every doubling.
+    Percentiles are the upper bound of the bucket they fall in, within 2 ** (1 / buckets_per_octave) of the exact
+    value (9% for the default 8), count, mean, min and max are exact.
+    """
+    def __init__(self, buckets_per_octave=8, minimum=1e-6):
+        self.buckets_per_octave = buckets_per_octave
+        self.minimum = minimum  # values below fall in the first bucket
+        self.buckets = {}  # bucket index -> count
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        index = 0
+        if value > self.minimum:
+            index = int(math.floor(math.log2(value / self.minimum) * self.buckets_per_octave))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def get_bounds(self, index):
+        return (self.minimum * 2 ** (index / self.buckets_per_octave),
+                self.minimum * 2 ** ((index + 1) / self.buckets_per_octave))
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(percent / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return max(self.min, min(self.max, self.get_bounds(index)[1]))
+
+    def merge(self, other):
+        """Add the values counted by a histogram with the same buckets"""
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def __iter__(self):
+        """(lower bound, upper bound, count) of the buckets with values, in increasing order"""
+        for index in sorted(self.buckets):
+            yield self.get_bounds(index) + (self.buckets[index],)
+
+
+class LatencyAnalyzer(object):
+    """Matches the replies to the pending requests of their channel, oldest first"""
+    def __init__(self, grammar=PROTOCOL_GRAMMAR):
+        self.request_replies = get_request_replies(grammar)
+        self.reply_requests = {}  # (source, reply method) -> [(source, request method)]
+        for request, replies in self.request_replies.items():
+            for reply in replies:
+                self.reply_requests.setdefault(reply, []).append(request)
+        self._pending = {}  # (channel, source, request method) -> deque of request timestamps
+        self.by_method = {}  # (request method, reply method) -> LogHistogram
+        self.by_channel = {}  # (channel, request method, reply method) -> LogHistogram
+        self.unanswered = {}  # request method -> count
+        self.unexpected_replies = {}  # reply method -> count
+
+    def analyze(self, messages):
+        for message in messages:
+            self.add(message)
+        self.close()
+        return self
+
+    def add(self, message):
+        if message.type not in (FRAME_METHOD, PROTOCOL_HEADER_TYPE):
+            return  # the protocol header is answered by connection.start
+        key = message.source, message.method
+        if key in self.request_replies and not _is_no_wait(message):
+            pending = self._pending.setdefault((get_channel(message), message.source, message.method),
+                                               deque(maxlen=MAX_PENDING_REQUESTS))
+            if len(pending) == pending.maxlen:
+                _increment(self.unanswered, message.method)
+            pending.append(_get_timestamp(message))
+        if key in self.reply_requests:
+            self._add_reply(message)
+
+    def _add_reply(self, message):
+        channel = get_channel(message)
+        oldest = None
+        for source, method in self.reply_requests[message.source, message.method]:
+            pending = self._pending.get((channel, source, method))
+            if pending and (oldest is None or pending[0] < oldest[0][0]):
+                oldest = pending, method
+        if oldest is None:
+            _increment(self.unexpected_replies, message.method)
+            return
+        pending, request_method = oldest
+        latency = _get_timestamp(message) - pending.popleft()
+        for histograms, key in ((self.by_method, (request_method, message.method)),
+                                (self.by_channel, (channel, request_method, message.method))):
+            if key not in histograms:
+                histograms[key] = LogHistogram()
+            histograms[key].add(latency)
+
+    def close(self):
+        """The requests still waiting for a reply are counted as unanswered"""
+        for (_, _, method), pending in self._pending.items():
+            if pending:
+                self.unanswered[method] = self.unanswered.get(method, 0) + len(pending)
+        self._pending.clear()
+
+    def merge(self, other):
+        """
+        Add the latencies of a closed analyzer, e.g. of another connection of the capture. Channel numbers are only
+        meaningful within their connection, the per channel histograms are not merged.
+        """
+        for key, histogram in other.by_method.items():
+            if key not in self.by_method:
+                self.by_method[key] = LogHistogram(histogram.buckets_per_octave, histogram.minimum)
+            self.by_method[key].merge(histogram)
+        for counts, other_counts in ((self.unanswered, other.unanswered),
+                                     (self.unexpected_replies, other.unexpected_replies)):
+            for method, count in other_counts.items():
+                counts[method] = counts.get(method, 0) + count
+        return self
+
+
+def _is_no_wait(message):
+    args = message.args if message.type == FRAME_METHOD else None
+    return isinstance(args, dict) and args.get('no_wait', False)
+
+
+def _increment(counts, key):
+    counts[key] = counts.get(key, 0) + 1
+
+
+def _milliseconds(seconds):
+    return "%.3f" % (seconds * 1000)
+
+
+def _get_heading(title):
+    return "%-60s %8s %10s %10s %s" % (title, "count", "min", "mean",
+                                       " ".join("%10s" % ("p%g" % percent) for percent in PERCENTILES + (100,)))
+
+
+def _get_row(name, histogram):
+    return "%-60s %8d %10s %10s %s" % (name, histogram.count, _milliseconds(histogram.min),
+                                       _milliseconds(histogram.mean),
+                                       " ".join("%10s" % _milliseconds(histogram.percentile(percent))
+                                                for percent in PERCENTILES + (100,)))
+
+
+def format_latency_report(analyzer, histogram_width=40):
+    """The lines of the report: percentiles per method pair and per channel, then the histogram of every pair"""
+    yield _get_heading("latency (ms)")
+    for (request, reply), histogram in sorted(analyzer.by_method.items()):
+        yield _get_row("%s -> %s" % (request, reply), histogram)
+    if analyzer.by_channel:
+        yield ""
+        yield _get_heading("latency per channel (ms)")
+    for (channel, request, reply), histogram in sorted(analyzer.by_channel.items()):
+        yield _get_row("%d %s -> %s" % (channel, request, reply), histogram)
+    for (request, reply), histogram in sorted(analyzer.by_method.items()):
+        yield ""
+        yield "%s -> %s" % (request, reply)
+        largest = max(count for _, _, count in histogram)
+        for lower, upper, count in histogram:
+            yield "%12s - %-12s %8d %s" % (_milliseconds(lower), _milliseconds(upper), count,
+                                           "#" * max(1, int(round(count * histogram_width / largest))))
+    for title, counts in (("unanswered requests", analyzer.unanswered),
+                          ("replies without request", analyzer.unexpected_replies)):
+        if counts:
+            yield ""
+            yield "%s: %s" % (title, ", ".join("%s %d" % (method, count) for method, count in sorted(counts.items())))
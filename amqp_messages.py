@@ -1,5 +1,9 @@
+import struct
+
 from amqp_constants import *
 from amqp_data_types import *
+from amqp_method_decoders import METHOD_DECODERS
+from amqp_properties import decode_properties
 
 FRAME_TYPES = {
     0: "PROTOCOL_HEADER",
@@ -10,41 +14,140 @@ FRAME_TYPES = {
 }
 
 
-def parse_payload(amqp_frame):
-    payload_string = None
+def _as_bytes(payload):
+    """Payloads can be views into the parsed dump, copy them only when they have to be rendered"""
+    if isinstance(payload, memoryview):
+        return payload.tobytes()
+    return payload
+
+
+_method_header_struct = struct.Struct("!HH")
+_content_header_struct = struct.Struct("!HHQ")
+
+
+def decode_payload(amqp_frame):
+    amqp_frame.class_id = amqp_frame.method_id = None
+    amqp_frame.weight = amqp_frame.frame_body_size = amqp_frame.property_flags = None
     payload = amqp_frame.payload
     if amqp_frame.type == FRAME_METHOD:
-        amqp_frame.class_id, payload = extract_short_uint(payload)
-        amqp_frame.method_id, payload = extract_short_uint(payload)
-        amqp_frame.args = payload
-        payload_string = "%s(%s)" % (AMQP_METHODS[amqp_frame.class_id][amqp_frame.method_id], payload)
+        amqp_frame.class_id, amqp_frame.method_id = _method_header_struct.unpack_from(payload, 0)
+    elif amqp_frame.type == FRAME_HEADER:
+        amqp_frame.class_id, amqp_frame.weight, amqp_frame.frame_body_size = \
+            _content_header_struct.unpack_from(payload, 0)
+        amqp_frame.property_flags = payload[12:]
+
+
+def decode_arguments(amqp_frame):
+    """
+    Decode the method arguments into an OrderedDict with the spec compiled decoders.
+    Arguments that can't be decoded (unknown methods, damaged frames) are kept as raw bytes.
+    """
+    amqp_frame.args = None
+    if amqp_frame.type == FRAME_METHOD:
+        amqp_frame.args = amqp_frame.payload[4:]
+        decoder = METHOD_DECODERS.get((amqp_frame.class_id, amqp_frame.method_id))
+        if decoder is not None:
+            try:
+                amqp_frame.args = decoder(amqp_frame.payload, 4)[0]
+            except (struct.error, AssertionError, IndexError, UnicodeDecodeError, KeyError, ValueError):
+                pass
+
+
+def decode_content_properties(amqp_frame):
+    """Decode the properties of a content header, they are kept as raw bytes if they can't be decoded"""
+    amqp_frame.properties = None
     if amqp_frame.type == FRAME_HEADER:
-        amqp_frame.class_id, payload = extract_short_uint(payload)
-        amqp_frame.weight, payload = extract_short_uint(payload)
-        amqp_frame.frame_body_size, payload = extract_long_uint(payload)
-        amqp_frame.property_flags = payload
-        payload_string = "%s.HEADER(weight=%d, frame_body_size=%d, property_flags=%s)" % (
+        amqp_frame.properties = amqp_frame.property_flags
+        try:
+            amqp_frame.properties = decode_properties(amqp_frame.class_id, amqp_frame.payload, 12)[0]
+        except (struct.error, AssertionError, IndexError, UnicodeDecodeError, KeyError, ValueError):
+            pass
+
+
+def _render_arguments(args):
+    if isinstance(args, dict):
+        return ", ".join("%s=%r" % (name, value) for name, value in args.items())
+    return _as_bytes(args)
+
+
+def _render_properties(properties):
+    if isinstance(properties, dict):
+        return _render_arguments(properties)
+    return "property_flags=%r" % _as_bytes(properties)
+
+
+# attributes filled in on first access
+LAZY_ATTRIBUTES = {
+    'class_id': decode_payload,
+    'method_id': decode_payload,
+    'weight': decode_payload,
+    'frame_body_size': decode_payload,
+    'property_flags': decode_payload,
+    'args': decode_arguments,
+    'properties': decode_content_properties,
+}
+
+
+def render_payload(amqp_frame):
+    payload_string = None
+    if amqp_frame.type == FRAME_METHOD:
+        payload_string = "%s(%s)" % (amqp_frame.method, _render_arguments(amqp_frame.args))
+    if amqp_frame.type == FRAME_HEADER:
+        payload_string = "%s.HEADER(weight=%d, frame_body_size=%d, %s)" % (
             list(AMQP_METHODS[amqp_frame.class_id].values())[0].split(".")[0],
             amqp_frame.weight,
             amqp_frame.frame_body_size,
-            repr(payload)
+            _render_properties(amqp_frame.properties)
         )
     if amqp_frame.type == FRAME_BODY:
-        payload_string = payload
+        payload_string = _as_bytes(amqp_frame.payload)
     return payload_string
 
 
+def parse_payload(amqp_frame):
+    decode_payload(amqp_frame)
+    decode_arguments(amqp_frame)
+    decode_content_properties(amqp_frame)
+    return render_payload(amqp_frame)
+
+
 class AMQPFrame(object):
+    """
+    The payload is decoded the first time one of the LAZY_ATTRIBUTES is accessed and rendered to a string the
+    first time the frame is printed, so frames that are only filtered or counted cost neither.
+    """
+    __slots__ = ('_source', 'type', 'channel', 'payload_len', 'payload', 'timestamp', '_method', '_parsed_payload',
+                 '_out_of_order', 'class_id', 'method_id', 'args', 'weight', 'frame_body_size', 'property_flags',
+                 'properties')
+
     def __init__(self, source, frame_type, channel_id, payload):
         self._source = source  # client or server
         self.type = frame_type
-        self.frame_type_string = FRAME_TYPES[frame_type]
         self.channel = channel_id
         self.payload_len = len(payload)
         self.payload = payload
-        self.parsed_payload = parse_payload(self)
+        self.timestamp = None  # capture time of the frame, when known
+        self._method = None
+        self._parsed_payload = None
         self._out_of_order = False
 
+    def __getattr__(self, name):
+        # only called for attributes that are not set yet
+        if name in LAZY_ATTRIBUTES:
+            LAZY_ATTRIBUTES[name](self)
+            return getattr(self, name)
+        raise AttributeError("%r object has no attribute %r" % (type(self).__name__, name))
+
+    @property
+    def frame_type_string(self):
+        return FRAME_TYPES[self.type]
+
+    @property
+    def parsed_payload(self):
+        if self._parsed_payload is None:
+            self._parsed_payload = render_payload(self)
+        return self._parsed_payload
+
     @property
     def out_of_order(self):
         return self._out_of_order
@@ -61,12 +164,14 @@ class AMQPFrame(object):
 
     @property
     def method(self):
-        if self.type == FRAME_METHOD:
-            return AMQP_METHODS[self.class_id][self.method_id]
-        elif self.type == FRAME_HEADER:
-            return "HEADER"
-        elif self.type == FRAME_BODY:
-            return "BODY"
+        if self._method is None:
+            if self.type == FRAME_METHOD:
+                self._method = AMQP_METHODS[self.class_id][self.method_id]
+            elif self.type == FRAME_HEADER:
+                self._method = "HEADER"
+            elif self.type == FRAME_BODY:
+                self._method = "BODY"
+        return self._method
 
     def __eq__(self, other):
         try:
@@ -83,7 +188,7 @@ class AMQPFrame(object):
         return "AMQPFrame(%s, %s, %d, %s)" % (self._source,
                                               self.type,
                                               self.channel,
-                                              self.payload)
+                                              _as_bytes(self.payload))
 
     def __str__(self):
         out_of_order_marker = "(!) " if self._out_of_order else ""
@@ -97,12 +202,15 @@ class AMQPFrame(object):
 
 
 class AMQPProtocolHeader(object):
+    __slots__ = ('proto_id', 'major', 'minor', 'type', 'rev', 'timestamp', '_out_of_order')
+
     def __init__(self, proto_id, proto_version_major, proto_version_minor, proto_version_revision):
         self.proto_id = proto_id
         self.major = proto_version_major
         self.minor = proto_version_minor
         self.type = 0
         self.rev = proto_version_revision
+        self.timestamp = None
         self._out_of_order = False
 
     @property
@@ -0,0 +1,696 @@
+"""Generated by amqp_spec_parser.py from amqp0-9-1.xml, do not edit."""
+import struct
+
+from collections import OrderedDict
+
+from amqp_data_types import (
+    decode_field_table,
+    decode_lazy_field_table,
+    decode_long_string,
+    decode_octet,
+    decode_short_string,
+    decode_timestamp,
+)
+
+
+_decode_connection_start_0 = struct.Struct("!BB")
+
+
+def decode_connection_start(buffer, offset):
+    result = OrderedDict()
+    result['version_major'], result['version_minor'] = _decode_connection_start_0.unpack_from(buffer, offset)
+    offset += 2
+    result['server_properties'], offset = decode_field_table(buffer, offset)
+    result['mechanisms'], offset = decode_long_string(buffer, offset)
+    result['locales'], offset = decode_long_string(buffer, offset)
+    return result, offset
+
+
+def decode_connection_start_ok(buffer, offset):
+    result = OrderedDict()
+    result['client_properties'], offset = decode_field_table(buffer, offset)
+    result['mechanism'], offset = decode_short_string(buffer, offset)
+    result['response'], offset = decode_long_string(buffer, offset)
+    result['locale'], offset = decode_short_string(buffer, offset)
+    return result, offset
+
+
+def decode_connection_secure(buffer, offset):
+    result = OrderedDict()
+    result['challenge'], offset = decode_long_string(buffer, offset)
+    return result, offset
+
+
+def decode_connection_secure_ok(buffer, offset):
+    result = OrderedDict()
+    result['response'], offset = decode_long_string(buffer, offset)
+    return result, offset
+
+
+_decode_connection_tune_0 = struct.Struct("!HLH")
+
+
+def decode_connection_tune(buffer, offset):
+    result = OrderedDict()
+    result['channel_max'], result['frame_max'], result['heartbeat'] = _decode_connection_tune_0.unpack_from(buffer, offset)
+    offset += 8
+    return result, offset
+
+
+_decode_connection_tune_ok_0 = struct.Struct("!HLH")
+
+
+def decode_connection_tune_ok(buffer, offset):
+    result = OrderedDict()
+    result['channel_max'], result['frame_max'], result['heartbeat'] = _decode_connection_tune_ok_0.unpack_from(buffer, offset)
+    offset += 8
+    return result, offset
+
+
+def decode_connection_open(buffer, offset):
+    result = OrderedDict()
+    result['virtual_host'], offset = decode_short_string(buffer, offset)
+    _, offset = decode_short_string(buffer, offset)
+    offset += 1
+    return result, offset
+
+
+def decode_connection_open_ok(buffer, offset):
+    result = OrderedDict()
+    _, offset = decode_short_string(buffer, offset)
+    return result, offset
+
+
+_decode_connection_close_0 = struct.Struct("!H")
+_decode_connection_close_1 = struct.Struct("!HH")
+
+
+def decode_connection_close(buffer, offset):
+    result = OrderedDict()
+    result['reply_code'], = _decode_connection_close_0.unpack_from(buffer, offset)
+    offset += 2
+    result['reply_text'], offset = decode_short_string(buffer, offset)
+    result['class_id'], result['method_id'] = _decode_connection_close_1.unpack_from(buffer, offset)
+    offset += 4
+    return result, offset
+
+
+def decode_connection_close_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+def decode_connection_blocked(buffer, offset):
+    result = OrderedDict()
+    result['reason'], offset = decode_short_string(buffer, offset)
+    return result, offset
+
+
+def decode_connection_unblocked(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+def decode_channel_open(buffer, offset):
+    result = OrderedDict()
+    _, offset = decode_short_string(buffer, offset)
+    return result, offset
+
+
+def decode_channel_open_ok(buffer, offset):
+    result = OrderedDict()
+    _, offset = decode_long_string(buffer, offset)
+    return result, offset
+
+
+_decode_channel_flow_0 = struct.Struct("!B")
+
+
+def decode_channel_flow(buffer, offset):
+    result = OrderedDict()
+    bits_0, = _decode_channel_flow_0.unpack_from(buffer, offset)
+    result['active'] = bool(bits_0 & 1)
+    offset += 1
+    return result, offset
+
+
+_decode_channel_flow_ok_0 = struct.Struct("!B")
+
+
+def decode_channel_flow_ok(buffer, offset):
+    result = OrderedDict()
+    bits_0, = _decode_channel_flow_ok_0.unpack_from(buffer, offset)
+    result['active'] = bool(bits_0 & 1)
+    offset += 1
+    return result, offset
+
+
+_decode_channel_close_0 = struct.Struct("!H")
+_decode_channel_close_1 = struct.Struct("!HH")
+
+
+def decode_channel_close(buffer, offset):
+    result = OrderedDict()
+    result['reply_code'], = _decode_channel_close_0.unpack_from(buffer, offset)
+    offset += 2
+    result['reply_text'], offset = decode_short_string(buffer, offset)
+    result['class_id'], result['method_id'] = _decode_channel_close_1.unpack_from(buffer, offset)
+    offset += 4
+    return result, offset
+
+
+def decode_channel_close_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+_decode_exchange_declare_0 = struct.Struct("!B")
+
+
+def decode_exchange_declare(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['exchange'], offset = decode_short_string(buffer, offset)
+    result['type'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_exchange_declare_0.unpack_from(buffer, offset)
+    result['passive'] = bool(bits_0 & 1)
+    result['durable'] = bool(bits_0 & 2)
+    result['auto_delete'] = bool(bits_0 & 4)
+    result['internal'] = bool(bits_0 & 8)
+    result['no_wait'] = bool(bits_0 & 16)
+    offset += 1
+    result['arguments'], offset = decode_field_table(buffer, offset)
+    return result, offset
+
+
+def decode_exchange_declare_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+_decode_exchange_delete_0 = struct.Struct("!B")
+
+
+def decode_exchange_delete(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['exchange'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_exchange_delete_0.unpack_from(buffer, offset)
+    result['if_unused'] = bool(bits_0 & 1)
+    result['no_wait'] = bool(bits_0 & 2)
+    offset += 1
+    return result, offset
+
+
+def decode_exchange_delete_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+_decode_exchange_bind_0 = struct.Struct("!B")
+
+
+def decode_exchange_bind(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['destination'], offset = decode_short_string(buffer, offset)
+    result['source'], offset = decode_short_string(buffer, offset)
+    result['routing_key'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_exchange_bind_0.unpack_from(buffer, offset)
+    result['no_wait'] = bool(bits_0 & 1)
+    offset += 1
+    result['arguments'], offset = decode_field_table(buffer, offset)
+    return result, offset
+
+
+def decode_exchange_bind_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+_decode_exchange_unbind_0 = struct.Struct("!B")
+
+
+def decode_exchange_unbind(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['destination'], offset = decode_short_string(buffer, offset)
+    result['source'], offset = decode_short_string(buffer, offset)
+    result['routing_key'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_exchange_unbind_0.unpack_from(buffer, offset)
+    result['no_wait'] = bool(bits_0 & 1)
+    offset += 1
+    result['arguments'], offset = decode_field_table(buffer, offset)
+    return result, offset
+
+
+def decode_exchange_unbind_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+_decode_queue_declare_0 = struct.Struct("!B")
+
+
+def decode_queue_declare(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['queue'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_queue_declare_0.unpack_from(buffer, offset)
+    result['passive'] = bool(bits_0 & 1)
+    result['durable'] = bool(bits_0 & 2)
+    result['exclusive'] = bool(bits_0 & 4)
+    result['auto_delete'] = bool(bits_0 & 8)
+    result['no_wait'] = bool(bits_0 & 16)
+    offset += 1
+    result['arguments'], offset = decode_field_table(buffer, offset)
+    return result, offset
+
+
+_decode_queue_declare_ok_0 = struct.Struct("!LL")
+
+
+def decode_queue_declare_ok(buffer, offset):
+    result = OrderedDict()
+    result['queue'], offset = decode_short_string(buffer, offset)
+    result['message_count'], result['consumer_count'] = _decode_queue_declare_ok_0.unpack_from(buffer, offset)
+    offset += 8
+    return result, offset
+
+
+_decode_queue_bind_0 = struct.Struct("!B")
+
+
+def decode_queue_bind(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['queue'], offset = decode_short_string(buffer, offset)
+    result['exchange'], offset = decode_short_string(buffer, offset)
+    result['routing_key'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_queue_bind_0.unpack_from(buffer, offset)
+    result['no_wait'] = bool(bits_0 & 1)
+    offset += 1
+    result['arguments'], offset = decode_field_table(buffer, offset)
+    return result, offset
+
+
+def decode_queue_bind_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+def decode_queue_unbind(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['queue'], offset = decode_short_string(buffer, offset)
+    result['exchange'], offset = decode_short_string(buffer, offset)
+    result['routing_key'], offset = decode_short_string(buffer, offset)
+    result['arguments'], offset = decode_field_table(buffer, offset)
+    return result, offset
+
+
+def decode_queue_unbind_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+_decode_queue_purge_0 = struct.Struct("!B")
+
+
+def decode_queue_purge(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['queue'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_queue_purge_0.unpack_from(buffer, offset)
+    result['no_wait'] = bool(bits_0 & 1)
+    offset += 1
+    return result, offset
+
+
+_decode_queue_purge_ok_0 = struct.Struct("!L")
+
+
+def decode_queue_purge_ok(buffer, offset):
+    result = OrderedDict()
+    result['message_count'], = _decode_queue_purge_ok_0.unpack_from(buffer, offset)
+    offset += 4
+    return result, offset
+
+
+_decode_queue_delete_0 = struct.Struct("!B")
+
+
+def decode_queue_delete(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['queue'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_queue_delete_0.unpack_from(buffer, offset)
+    result['if_unused'] = bool(bits_0 & 1)
+    result['if_empty'] = bool(bits_0 & 2)
+    result['no_wait'] = bool(bits_0 & 4)
+    offset += 1
+    return result, offset
+
+
+_decode_queue_delete_ok_0 = struct.Struct("!L")
+
+
+def decode_queue_delete_ok(buffer, offset):
+    result = OrderedDict()
+    result['message_count'], = _decode_queue_delete_ok_0.unpack_from(buffer, offset)
+    offset += 4
+    return result, offset
+
+
+_decode_basic_qos_0 = struct.Struct("!LHB")
+
+
+def decode_basic_qos(buffer, offset):
+    result = OrderedDict()
+    result['prefetch_size'], result['prefetch_count'], bits_0 = _decode_basic_qos_0.unpack_from(buffer, offset)
+    result['global'] = bool(bits_0 & 1)
+    offset += 7
+    return result, offset
+
+
+def decode_basic_qos_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+_decode_basic_consume_0 = struct.Struct("!B")
+
+
+def decode_basic_consume(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['queue'], offset = decode_short_string(buffer, offset)
+    result['consumer_tag'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_basic_consume_0.unpack_from(buffer, offset)
+    result['no_local'] = bool(bits_0 & 1)
+    result['no_ack'] = bool(bits_0 & 2)
+    result['exclusive'] = bool(bits_0 & 4)
+    result['no_wait'] = bool(bits_0 & 8)
+    offset += 1
+    result['arguments'], offset = decode_field_table(buffer, offset)
+    return result, offset
+
+
+def decode_basic_consume_ok(buffer, offset):
+    result = OrderedDict()
+    result['consumer_tag'], offset = decode_short_string(buffer, offset)
+    return result, offset
+
+
+_decode_basic_cancel_0 = struct.Struct("!B")
+
+
+def decode_basic_cancel(buffer, offset):
+    result = OrderedDict()
+    result['consumer_tag'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_basic_cancel_0.unpack_from(buffer, offset)
+    result['no_wait'] = bool(bits_0 & 1)
+    offset += 1
+    return result, offset
+
+
+def decode_basic_cancel_ok(buffer, offset):
+    result = OrderedDict()
+    result['consumer_tag'], offset = decode_short_string(buffer, offset)
+    return result, offset
+
+
+_decode_basic_publish_0 = struct.Struct("!B")
+
+
+def decode_basic_publish(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['exchange'], offset = decode_short_string(buffer, offset)
+    result['routing_key'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_basic_publish_0.unpack_from(buffer, offset)
+    result['mandatory'] = bool(bits_0 & 1)
+    result['immediate'] = bool(bits_0 & 2)
+    offset += 1
+    return result, offset
+
+
+_decode_basic_return_0 = struct.Struct("!H")
+
+
+def decode_basic_return(buffer, offset):
+    result = OrderedDict()
+    result['reply_code'], = _decode_basic_return_0.unpack_from(buffer, offset)
+    offset += 2
+    result['reply_text'], offset = decode_short_string(buffer, offset)
+    result['exchange'], offset = decode_short_string(buffer, offset)
+    result['routing_key'], offset = decode_short_string(buffer, offset)
+    return result, offset
+
+
+_decode_basic_deliver_0 = struct.Struct("!QB")
+
+
+def decode_basic_deliver(buffer, offset):
+    result = OrderedDict()
+    result['consumer_tag'], offset = decode_short_string(buffer, offset)
+    result['delivery_tag'], bits_0 = _decode_basic_deliver_0.unpack_from(buffer, offset)
+    result['redelivered'] = bool(bits_0 & 1)
+    offset += 9
+    result['exchange'], offset = decode_short_string(buffer, offset)
+    result['routing_key'], offset = decode_short_string(buffer, offset)
+    return result, offset
+
+
+_decode_basic_get_0 = struct.Struct("!B")
+
+
+def decode_basic_get(buffer, offset):
+    result = OrderedDict()
+    offset += 2
+    result['queue'], offset = decode_short_string(buffer, offset)
+    bits_0, = _decode_basic_get_0.unpack_from(buffer, offset)
+    result['no_ack'] = bool(bits_0 & 1)
+    offset += 1
+    return result, offset
+
+
+_decode_basic_get_ok_0 = struct.Struct("!QB")
+_decode_basic_get_ok_1 = struct.Struct("!L")
+
+
+def decode_basic_get_ok(buffer, offset):
+    result = OrderedDict()
+    result['delivery_tag'], bits_0 = _decode_basic_get_ok_0.unpack_from(buffer, offset)
+    result['redelivered'] = bool(bits_0 & 1)
+    offset += 9
+    result['exchange'], offset = decode_short_string(buffer, offset)
+    result['routing_key'], offset = decode_short_string(buffer, offset)
+    result['message_count'], = _decode_basic_get_ok_1.unpack_from(buffer, offset)
+    offset += 4
+    return result, offset
+
+
+def decode_basic_get_empty(buffer, offset):
+    result = OrderedDict()
+    _, offset = decode_short_string(buffer, offset)
+    return result, offset
+
+
+_decode_basic_ack_0 = struct.Struct("!QB")
+
+
+def decode_basic_ack(buffer, offset):
+    result = OrderedDict()
+    result['delivery_tag'], bits_0 = _decode_basic_ack_0.unpack_from(buffer, offset)
+    result['multiple'] = bool(bits_0 & 1)
+    offset += 9
+    return result, offset
+
+
+_decode_basic_reject_0 = struct.Struct("!QB")
+
+
+def decode_basic_reject(buffer, offset):
+    result = OrderedDict()
+    result['delivery_tag'], bits_0 = _decode_basic_reject_0.unpack_from(buffer, offset)
+    result['requeue'] = bool(bits_0 & 1)
+    offset += 9
+    return result, offset
+
+
+_decode_basic_recover_async_0 = struct.Struct("!B")
+
+
+def decode_basic_recover_async(buffer, offset):
+    result = OrderedDict()
+    bits_0, = _decode_basic_recover_async_0.unpack_from(buffer, offset)
+    result['requeue'] = bool(bits_0 & 1)
+    offset += 1
+    return result, offset
+
+
+_decode_basic_recover_0 = struct.Struct("!B")
+
+
+def decode_basic_recover(buffer, offset):
+    result = OrderedDict()
+    bits_0, = _decode_basic_recover_0.unpack_from(buffer, offset)
+    result['requeue'] = bool(bits_0 & 1)
+    offset += 1
+    return result, offset
+
+
+def decode_basic_recover_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+_decode_basic_nack_0 = struct.Struct("!QB")
+
+
+def decode_basic_nack(buffer, offset):
+    result = OrderedDict()
+    result['delivery_tag'], bits_0 = _decode_basic_nack_0.unpack_from(buffer, offset)
+    result['multiple'] = bool(bits_0 & 1)
+    result['requeue'] = bool(bits_0 & 2)
+    offset += 9
+    return result, offset
+
+
+def decode_tx_select(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+def decode_tx_select_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+def decode_tx_commit(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+def decode_tx_commit_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+def decode_tx_rollback(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+def decode_tx_rollback_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+_decode_confirm_select_0 = struct.Struct("!B")
+
+
+def decode_confirm_select(buffer, offset):
+    result = OrderedDict()
+    bits_0, = _decode_confirm_select_0.unpack_from(buffer, offset)
+    result['nowait'] = bool(bits_0 & 1)
+    offset += 1
+    return result, offset
+
+
+def decode_confirm_select_ok(buffer, offset):
+    result = OrderedDict()
+    return result, offset
+
+
+METHOD_DECODERS = {
+    (10, 10): decode_connection_start,
+    (10, 11): decode_connection_start_ok,
+    (10, 20): decode_connection_secure,
+    (10, 21): decode_connection_secure_ok,
+    (10, 30): decode_connection_tune,
+    (10, 31): decode_connection_tune_ok,
+    (10, 40): decode_connection_open,
+    (10, 41): decode_connection_open_ok,
+    (10, 50): decode_connection_close,
+    (10, 51): decode_connection_close_ok,
+    (10, 60): decode_connection_blocked,
+    (10, 61): decode_connection_unblocked,
+    (20, 10): decode_channel_open,
+    (20, 11): decode_channel_open_ok,
+    (20, 20): decode_channel_flow,
+    (20, 21): decode_channel_flow_ok,
+    (20, 40): decode_channel_close,
+    (20, 41): decode_channel_close_ok,
+    (40, 10): decode_exchange_declare,
+    (40, 11): decode_exchange_declare_ok,
+    (40, 20): decode_exchange_delete,
+    (40, 21): decode_exchange_delete_ok,
+    (40, 30): decode_exchange_bind,
+    (40, 31): decode_exchange_bind_ok,
+    (40, 40): decode_exchange_unbind,
+    (40, 51): decode_exchange_unbind_ok,
+    (50, 10): decode_queue_declare,
+    (50, 11): decode_queue_declare_ok,
+    (50, 20): decode_queue_bind,
+    (50, 21): decode_queue_bind_ok,
+    (50, 50): decode_queue_unbind,
+    (50, 51): decode_queue_unbind_ok,
+    (50, 30): decode_queue_purge,
+    (50, 31): decode_queue_purge_ok,
+    (50, 40): decode_queue_delete,
+    (50, 41): decode_queue_delete_ok,
+    (60, 10): decode_basic_qos,
+    (60, 11): decode_basic_qos_ok,
+    (60, 20): decode_basic_consume,
+    (60, 21): decode_basic_consume_ok,
+    (60, 30): decode_basic_cancel,
+    (60, 31): decode_basic_cancel_ok,
+    (60, 40): decode_basic_publish,
+    (60, 50): decode_basic_return,
+    (60, 60): decode_basic_deliver,
+    (60, 70): decode_basic_get,
+    (60, 71): decode_basic_get_ok,
+    (60, 72): decode_basic_get_empty,
+    (60, 80): decode_basic_ack,
+    (60, 90): decode_basic_reject,
+    (60, 100): decode_basic_recover_async,
+    (60, 110): decode_basic_recover,
+    (60, 111): decode_basic_recover_ok,
+    (60, 120): decode_basic_nack,
+    (90, 10): decode_tx_select,
+    (90, 11): decode_tx_select_ok,
+    (90, 20): decode_tx_commit,
+    (90, 21): decode_tx_commit_ok,
+    (90, 30): decode_tx_rollback,
+    (90, 31): decode_tx_rollback_ok,
+    (85, 10): decode_confirm_select,
+    (85, 11): decode_confirm_select_ok,
+}
+
+CONTENT_METHODS = frozenset([
+    (60, 40),
+    (60, 50),
+    (60, 60),
+    (60, 71),
+])
+
+CLASS_PROPERTIES = {
+    60: [
+        ('content_type', decode_short_string),
+        ('content_encoding', decode_short_string),
+        ('headers', decode_lazy_field_table),
+        ('delivery_mode', decode_octet),
+        ('priority', decode_octet),
+        ('correlation_id', decode_short_string),
+        ('reply_to', decode_short_string),
+        ('expiration', decode_short_string),
+        ('message_id', decode_short_string),
+        ('timestamp', decode_timestamp),
+        ('type', decode_short_string),
+        ('user_id', decode_short_string),
+        ('app_id', decode_short_string),
+        ('reserved', decode_short_string),
+    ],
+}
@@ -0,0 +1,194 @@
+"""
+Buffered output of the analyzed messages.
+The messages are rendered into batches of lines written with a single write() to a large buffered stream, the stream
+is flushed according to the flush policy: every N messages, at the end of every connection and on close.
+Besides the human readable text the messages can be written as JSON Lines or CSV records for other tools to load,
+the records are built from the frame attributes, not from the text rendering.
+"""
+import csv
+import json
+import sys
+
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from amqp_constants import FRAME_METHOD, FRAME_HEADER
+from amqp_content import ContentMessage
+from amqp_messages import AMQPProtocolHeader, FRAME_TYPES, _as_bytes
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_BATCH_SIZE = 1024  # messages rendered before they are handed to the stream
+
+
+def open_output(filename=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    """The output file opened for writing with a large buffer, or stdout"""
+    if filename is None:
+        return sys.stdout
+    return open(filename, 'w', buffering=buffer_size)
+
+
+class MessageWriter(object):
+    """
+    Writes messages, one line each, to a text stream.
+    flush_every is the number of messages after which the stream is flushed, 0 flushes only at the end of the
+    connections and on close. By default interactive streams are flushed after every message and files only at the
+    end of the connections, so a report is written at the speed of the disk and a terminal still shows every
+    message as soon as it is known.
+    """
+    def __init__(self, stream, flush_every=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.stream = stream
+        if flush_every is None:
+            flush_every = 1 if _is_interactive(stream) else 0
+        self.flush_every = flush_every
+        self.batch_size = min(batch_size, flush_every) if flush_every else batch_size
+        self.written = 0  # messages written so far
+        self._batch = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, message):
+        self.write_line(self.render(message))
+        self.written += 1
+        if self.flush_every and self.written % self.flush_every == 0:
+            self.flush()
+
+    def write_all(self, messages):
+        for message in messages:
+            self.write(message)
+
+    def write_line(self, line):
+        self._batch.append(line)
+        if len(self._batch) >= self.batch_size:
+            self._write_batch()
+
+    def render(self, message):
+        return str(message)
+
+    def start_connection(self, name):
+        self.write_line("Connection %s" % name)
+
+    def end_connection(self):
+        """Everything about a connection is on disk once the next one starts"""
+        self.flush()
+
+    def flush(self):
+        self._write_batch()
+        self.stream.flush()
+
+    def close(self):
+        """Flush the remaining messages, the stream is closed unless it is stdout or stderr"""
+        self.flush()
+        if self.stream not in (sys.stdout, sys.stderr):
+            self.stream.close()
+
+    def _write_batch(self):
+        if self._batch:
+            self._batch.append('')  # the last line ends with a new line too
+            self.stream.write('\n'.join(self._batch))
+            self._batch = []
+
+
+# columns of the JSON Lines and CSV records
+RECORD_FIELDS = ('connection', 'timestamp', 'source', 'frame_type', 'channel', 'method', 'payload_length',
+                 'out_of_order', 'arguments', 'properties')
+
+
+def get_record(message, connection=None):
+    """
+    The record of a frame, protocol header or content message.
+    arguments are the decoded method arguments (the protocol version for protocol headers), properties are the
+    content header properties, the payload_length of a content message is the size of its body.
+    """
+    if isinstance(message, AMQPProtocolHeader):
+        return OrderedDict((('connection', connection), ('timestamp', message.timestamp), ('source', message.source),
+                            ('frame_type', FRAME_TYPES[message.type]), ('channel', 0), ('method', message.method),
+                            ('payload_length', 0), ('out_of_order', message.out_of_order),
+                            ('arguments', OrderedDict((('proto_id', message.proto_id), ('major', message.major),
+                                                       ('minor', message.minor), ('revision', message.rev)))),
+                            ('properties', None)))
+    if isinstance(message, ContentMessage):
+        frame_type, payload_length = "CONTENT", message.body.size
+        arguments, properties = message.method_frame.args, message.properties
+    else:
+        frame_type, payload_length = message.frame_type_string, message.payload_len
+        arguments = message.args if message.type == FRAME_METHOD else None
+        properties = message.properties if message.type == FRAME_HEADER else None
+    return OrderedDict((('connection', connection), ('timestamp', message.timestamp), ('source', message.source),
+                        ('frame_type', frame_type), ('channel', message.channel), ('method', message.method),
+                        ('payload_length', payload_length), ('out_of_order', message.out_of_order),
+                        ('arguments', arguments), ('properties', properties)))
+
+
+def _json_default(value):
+    """Lazy field tables become objects, undecoded bytes become hex strings"""
+    if isinstance(value, Mapping):
+        return OrderedDict(value.items())
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return _as_bytes(value).hex()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def _to_json(value):
+    return json.dumps(value, default=_json_default, separators=(',', ':'))
+
+
+class JSONLinesWriter(MessageWriter):
+    """Writes one JSON object per message"""
+    def __init__(self, stream, flush_every=None, batch_size=DEFAULT_BATCH_SIZE):
+        super(JSONLinesWriter, self).__init__(stream, flush_every, batch_size)
+        self.connection = None
+
+    def render(self, message):
+        return _to_json(get_record(message, self.connection))
+
+    def start_connection(self, name):
+        self.connection = str(name)
+
+
+class _LastLine(object):
+    """The file like target of the csv writer, keeps the row it was given"""
+    line = None
+
+    def write(self, line):
+        self.line = line
+
+
+class CSVWriter(MessageWriter):
+    """Writes a header row and one row per message, arguments and properties are JSON encoded"""
+    def __init__(self, stream, flush_every=None, batch_size=DEFAULT_BATCH_SIZE):
+        super(CSVWriter, self).__init__(stream, flush_every, batch_size)
+        self.connection = None
+        self._row = _LastLine()
+        self._csv = csv.writer(self._row, lineterminator='')
+        self._csv.writerow(RECORD_FIELDS)
+        self.write_line(self._row.line)
+
+    def render(self, message):
+        record = get_record(message, self.connection)
+        for field in ('arguments', 'properties'):
+            if record[field] is not None:
+                record[field] = _to_json(record[field])
+        self._csv.writerow(list(record.values()))
+        return self._row.line
+
+    def start_connection(self, name):
+        self.connection = str(name)
+
+
+OUTPUT_FORMATS = OrderedDict((('text', MessageWriter), ('jsonl', JSONLinesWriter), ('csv', CSVWriter)))
+OUTPUT_SUFFIXES = {'text': '.txt', 'jsonl': '.jsonl', 'csv': '.csv'}
+
+
+def get_writer(stream, output_format='text', flush_every=None):
+    return OUTPUT_FORMATS[output_format](stream, flush_every)
+
+
+def _is_interactive(stream):
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
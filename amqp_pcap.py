@@ -0,0 +1,395 @@
+"""
+Reads AMQP connections straight from pcap/pcapng captures, no tcpflow needed.
+The capture is read in a single pass: the TCP segments to and from the AMQP ports are reassembled per connection and
+direction and fed to incremental frame parsers along with their capture time. Every connection is handed out as soon
+as it is closed, so a capture with thousands of connections only keeps the open ones in memory.
+Only plain TCP over IPv4/IPv6 is understood, IP fragments are skipped.
+"""
+import ipaddress
+import struct
+
+from collections import OrderedDict
+
+from amqp_constants import AMQP_PORT
+from amqp_protocol_parser import AMQPIncrementalParser, MalformedMessage, CLIENT, SERVER
+
+MAX_PENDING_SEGMENT_BYTES = 4 * 1024 * 1024  # out of order data kept waiting for a lost segment before skipping it
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAP_NANOSECOND_MAGIC = 0xa1b23c4d
+PCAPNG_SECTION_HEADER = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+PCAPNG_INTERFACE_DESCRIPTION = 1
+PCAPNG_PACKET = 2  # obsolete, still written by old tools
+PCAPNG_SIMPLE_PACKET = 3
+PCAPNG_ENHANCED_PACKET = 6
+PCAPNG_OPTION_END = 0
+PCAPNG_OPTION_TSRESOL = 9
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+DLT_RAW = (12, 14)  # raw IP on some BSDs
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8)
+NULL_FAMILY_IPV4 = 2
+NULL_FAMILY_IPV6 = (10, 24, 28, 30)  # the value differs between operating systems
+
+IPPROTO_TCP = 6
+IPV6_EXTENSION_HEADERS = (0, 43, 60)  # hop-by-hop, routing, destination options, fragments are not followed
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+_pcap_record_header_formats = {'<': struct.Struct("<LLLL"), '>': struct.Struct(">LLLL")}
+_ipv4_header_struct = struct.Struct("!BxHxxHxB")
+_tcp_header_struct = struct.Struct("!HHLxxxxH")
+
+
+class PcapFormatError(Exception):
+    pass
+
+
+def iter_capture_packets(f):
+    """Yields (timestamp, link type, packet data) for every packet of a pcap or pcapng file object"""
+    magic = f.read(4)
+    if len(magic) < 4:
+        raise PcapFormatError("Capture file too short")
+    if struct.unpack("<L", magic)[0] == PCAPNG_SECTION_HEADER:
+        return _iter_pcapng_packets(f, magic)
+    return _iter_pcap_packets(f, magic)
+
+
+def _iter_pcap_packets(f, magic):
+    for byte_order in '<>':
+        magic_number = struct.unpack(byte_order + "L", magic)[0]
+        if magic_number in (PCAP_MAGIC, PCAP_NANOSECOND_MAGIC):
+            break
+    else:
+        raise PcapFormatError("Not a pcap or pcapng file")
+    resolution = 1e-9 if magic_number == PCAP_NANOSECOND_MAGIC else 1e-6
+    header = f.read(20)
+    if len(header) < 20:
+        raise PcapFormatError("Truncated pcap file header")
+    link_type = struct.unpack(byte_order + "HHlLLL", header)[5] & 0xffff
+    record_header_struct = _pcap_record_header_formats[byte_order]
+    while True:
+        record_header = f.read(record_header_struct.size)
+        if len(record_header) < record_header_struct.size:
+            return  # a capture interrupted while writing ends with a partial record
+        seconds, fraction, captured_length, _ = record_header_struct.unpack(record_header)
+        data = f.read(captured_length)
+        if len(data) < captured_length:
+            return
+        yield seconds + fraction * resolution, link_type, data
+
+
+def _iter_pcapng_packets(f, magic):
+    byte_order = '<'
+    interfaces = []  # (link type, timestamp resolution) by interface id
+    block_header = magic + f.read(4)
+    while len(block_header) == 8:
+        if struct.unpack("<L", block_header[:4])[0] == PCAPNG_SECTION_HEADER:
+            byte_order_magic = f.read(4)
+            byte_order = '<' if struct.unpack("<L", byte_order_magic)[0] == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            block_length = struct.unpack(byte_order + "L", block_header[4:])[0]
+            body = byte_order_magic + f.read(block_length - 16)
+            interfaces = []
+        else:
+            block_length = struct.unpack(byte_order + "L", block_header[4:])[0]
+            body = f.read(block_length - 12)
+        if len(body) < block_length - 12 or len(f.read(4)) < 4:
+            return
+        block_type = struct.unpack(byte_order + "L", block_header[:4])[0]
+        if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+            link_type = struct.unpack_from(byte_order + "H", body)[0]
+            interfaces.append((link_type, _get_pcapng_resolution(body, byte_order)))
+        elif block_type == PCAPNG_ENHANCED_PACKET:
+            interface_id, high, low, captured_length = struct.unpack_from(byte_order + "LLLL", body)
+            link_type, resolution = interfaces[interface_id]
+            yield ((high << 32) | low) * resolution, link_type, body[20:20 + captured_length]
+        elif block_type == PCAPNG_PACKET:
+            interface_id, _, high, low, captured_length = struct.unpack_from(byte_order + "HHLLL", body)
+            link_type, resolution = interfaces[interface_id]
+            yield ((high << 32) | low) * resolution, link_type, body[20:20 + captured_length]
+        elif block_type == PCAPNG_SIMPLE_PACKET:
+            link_type, _ = interfaces[0]
+            yield None, link_type, body[4:]  # simple packets have no timestamp
+        block_header = f.read(8)
+
+
+def _get_pcapng_resolution(body, byte_order):
+    offset = 8  # link type, reserved, snap length
+    while offset + 4 <= len(body):
+        code, length = struct.unpack_from(byte_order + "HH", body, offset)
+        if code == PCAPNG_OPTION_END:
+            break
+        if code == PCAPNG_OPTION_TSRESOL:
+            value = body[offset + 4]
+            return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+def get_ip_packet(link_type, data):
+    """Strip the link layer header, returns the IP packet or None if the packet is not IP"""
+    if link_type == LINKTYPE_ETHERNET:
+        offset = 12
+        ether_type = struct.unpack_from("!H", data, offset)[0] if len(data) >= 14 else None
+        while ether_type in ETHERTYPE_VLAN and len(data) >= offset + 6:
+            offset += 4
+            ether_type = struct.unpack_from("!H", data, offset)[0]
+        if ether_type not in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+            return None
+        return data[offset + 2:]
+    if link_type in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        if len(data) < 4:
+            return None
+        # the family is in the byte order of the capturing host, except for LOOP
+        family = struct.unpack_from("!L" if link_type == LINKTYPE_LOOP else "<L", data)[0]
+        if family > 0xffff:
+            family = struct.unpack_from("!L", data)[0]
+        if family != NULL_FAMILY_IPV4 and family not in NULL_FAMILY_IPV6:
+            return None
+        return data[4:]
+    if link_type == LINKTYPE_LINUX_SLL:
+        if len(data) < 16 or struct.unpack_from("!H", data, 14)[0] not in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+            return None
+        return data[16:]
+    if link_type == LINKTYPE_LINUX_SLL2:
+        if len(data) < 20 or struct.unpack_from("!H", data)[0] not in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+            return None
+        return data[20:]
+    if link_type in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6) or link_type in DLT_RAW:
+        return data
+    return None
+
+
+def get_tcp_segment(ip_packet):
+    """Returns (source address, source port, destination address, destination port, sequence, flags, payload)"""
+    if not ip_packet:
+        return None
+    version = ip_packet[0] >> 4
+    if version == 4:
+        if len(ip_packet) < 20:
+            return None
+        version_length, total_length, fragment, protocol = _ipv4_header_struct.unpack_from(ip_packet)
+        if protocol != IPPROTO_TCP or fragment & 0x3fff:
+            return None  # fragments are not reassembled
+        header_length = (version_length & 0x0f) * 4
+        source, destination = ip_packet[12:16], ip_packet[16:20]
+        tcp_segment = ip_packet[header_length:total_length]  # drops the link layer padding
+    elif version == 6:
+        if len(ip_packet) < 40:
+            return None
+        payload_length = struct.unpack_from("!H", ip_packet, 4)[0]
+        next_header = ip_packet[6]
+        source, destination = ip_packet[8:24], ip_packet[24:40]
+        offset = 40
+        while next_header in IPV6_EXTENSION_HEADERS and len(ip_packet) >= offset + 2:
+            next_header, offset = ip_packet[offset], offset + (ip_packet[offset + 1] + 1) * 8
+        if next_header != IPPROTO_TCP:
+            return None
+        tcp_segment = ip_packet[offset:40 + payload_length]
+    else:
+        return None
+    if len(tcp_segment) < 20:
+        return None
+    source_port, destination_port, sequence, offset_flags = _tcp_header_struct.unpack_from(tcp_segment)
+    payload = tcp_segment[(offset_flags >> 12) * 4:]
+    return source, source_port, destination, destination_port, sequence, offset_flags & 0x1ff, payload
+
+
+class TCPStream(object):
+    """
+    Reassembles one direction of a TCP connection. Segments can come in any order, retransmitted and overlapping
+    data is dropped, data after a hole waits for the missing segment until there is too much of it.
+    """
+    def __init__(self, max_pending=MAX_PENDING_SEGMENT_BYTES):
+        self.start_sequence = None  # initial sequence number, from the SYN
+        self.next_sequence = None
+        self.max_pending = max_pending
+        self.skipped = 0  # bytes lost in holes that were never filled
+        self._pending = {}  # sequence -> (timestamp, data) of the segments after a hole
+        self._pending_size = 0
+
+    def start(self, sequence):
+        """The SYN consumes a sequence number, the data starts right after it. Retransmitted SYNs are ignored."""
+        if sequence == self.start_sequence:
+            return
+        self.start_sequence = sequence
+        self.next_sequence = (sequence + 1) & 0xffffffff
+
+    def add(self, sequence, data, timestamp):
+        """Returns the (data, timestamp) chunks that became contiguous"""
+        if self.next_sequence is None:
+            self.next_sequence = sequence  # the capture started in the middle of the connection
+        chunks = []
+        if self._relative(sequence) > 0:
+            if len(data) > len(self._pending.get(sequence, (None, b''))[1]):
+                self._pending_size += len(data) - len(self._pending.get(sequence, (None, b''))[1])
+                self._pending[sequence] = (timestamp, data)
+            if self._pending_size > self.max_pending:
+                self._skip_hole()
+        else:
+            self._append(sequence, data, timestamp, chunks)
+        self._drain(chunks)
+        return chunks
+
+    def flush(self):
+        """End of the stream, returns the data that was waiting behind holes"""
+        chunks = []
+        while self._pending:
+            self._skip_hole()
+            self._drain(chunks)
+        return chunks
+
+    def _relative(self, sequence):
+        distance = (sequence - self.next_sequence) & 0xffffffff
+        return distance - 0x100000000 if distance & 0x80000000 else distance
+
+    def _append(self, sequence, data, timestamp, chunks):
+        overlap = -self._relative(sequence)
+        if overlap < len(data):
+            data = data[overlap:]
+            chunks.append((data, timestamp))
+            self.next_sequence = (self.next_sequence + len(data)) & 0xffffffff
+
+    def _drain(self, chunks):
+        progress = True
+        while progress and self._pending:
+            progress = False
+            for sequence in list(self._pending):
+                if self._relative(sequence) <= 0:
+                    timestamp, data = self._pending.pop(sequence)
+                    self._pending_size -= len(data)
+                    self._append(sequence, data, timestamp, chunks)
+                    progress = True
+
+    def _skip_hole(self):
+        sequence = min(self._pending, key=self._relative)
+        self.skipped += self._relative(sequence)
+        self.next_sequence = sequence
+
+
+class AMQPConnection(object):
+    """One AMQP connection found in a capture, its messages are the client and server frames in capture order"""
+    def __init__(self, client, server, recover=False):
+        self.client = client  # (address, port)
+        self.server = server
+        self.recover = recover
+        self.messages = []
+        self.error = None  # MalformedMessage that stopped the parsing
+        self._parsers = {CLIENT: AMQPIncrementalParser(CLIENT, recover), SERVER: AMQPIncrementalParser(SERVER, recover)}
+        self._streams = {CLIENT: TCPStream(), SERVER: TCPStream()}
+        self._finished = set()  # the sources that sent a FIN
+
+    def __str__(self):
+        return "%s -> %s" % (_format_endpoint(self.client), _format_endpoint(self.server))
+
+    @property
+    def client_messages(self):
+        return [message for message in self.messages if message.source == CLIENT]
+
+    @property
+    def server_messages(self):
+        return [message for message in self.messages if message.source == SERVER]
+
+    def get_gaps(self, source):
+        return self._parsers[source].gaps
+
+    def get_start_sequence(self, source):
+        """The initial sequence number of the direction, None when the capture missed its SYN"""
+        return self._streams[source].start_sequence
+
+    def get_skipped_bytes(self, source):
+        """Bytes lost in the capture"""
+        return self._streams[source].skipped
+
+    def add_segment(self, source, sequence, flags, payload, timestamp):
+        """Returns True once the connection is closed"""
+        stream = self._streams[source]
+        if flags & TCP_SYN:
+            stream.start(sequence)
+        elif payload:
+            self._feed(source, stream.add(sequence, payload, timestamp))
+        if flags & TCP_FIN:
+            self._finished.add(source)
+        return bool(flags & TCP_RST) or len(self._finished) == 2
+
+    def close(self):
+        for source in (CLIENT, SERVER):
+            self._feed(source, self._streams[source].flush())
+            if self.error is None:
+                try:
+                    self._parsers[source].close()
+                except MalformedMessage as e:
+                    self.error = e
+
+    def _feed(self, source, chunks):
+        if self.error is not None:
+            return
+        try:
+            for data, timestamp in chunks:
+                self.messages.extend(self._parsers[source].feed(data, timestamp))
+        except MalformedMessage as e:
+            self.error = e
+
+
+def _format_endpoint(endpoint):
+    address, port = endpoint
+    address = ipaddress.ip_address(bytes(address))
+    return ("[%s]:%d" if address.version == 6 else "%s:%d") % (address, port)
+
+
+def iter_capture_connections(filename, ports=(AMQP_PORT,), recover=False):
+    """
+    Read a capture in a single pass and yield every AMQP connection to one of the ports once it is closed,
+    the connections still open at the end of the capture are yielded last.
+    """
+    ports = frozenset(ports)
+    connections = OrderedDict()  # (client address, client port, server address, server port) -> open connection
+    closed = set()  # keys of closed connections, late retransmissions must not open them again
+    with open(filename, 'rb') as f:
+        for timestamp, link_type, data in iter_capture_packets(f):
+            segment = get_tcp_segment(get_ip_packet(link_type, data))
+            if segment is None:
+                continue
+            source_address, source_port, destination_address, destination_port, sequence, flags, payload = segment
+            if destination_port in ports:
+                source, key = CLIENT, (source_address, source_port, destination_address, destination_port)
+            elif source_port in ports:
+                source, key = SERVER, (destination_address, destination_port, source_address, source_port)
+            else:
+                continue
+            connection = connections.get(key)
+            if flags & TCP_SYN and not flags & TCP_ACK and \
+                    (connection is None or connection.get_start_sequence(CLIENT) != sequence):
+                # a new connection, the port may be reused, a retransmitted SYN has the same sequence number
+                if connection is not None:
+                    del connections[key]
+                    connection.close()
+                    yield connection
+                closed.discard(key)
+                connection = connections[key] = AMQPConnection((key[0], key[1]), (key[2], key[3]), recover)
+            elif connection is None:
+                if key in closed or not payload:
+                    continue
+                connection = connections[key] = AMQPConnection((key[0], key[1]), (key[2], key[3]), recover)
+            if connection.add_segment(source, sequence, flags, payload, timestamp):
+                del connections[key]
+                closed.add(key)
+                connection.close()
+                yield connection
+    for connection in connections.values():
+        connection.close()
+        yield connection
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+
+from amqp_data_types import decode_short_uint
+from amqp_method_decoders import CLASS_PROPERTIES
+
+PROPERTY_FLAGS_CONTINUATION = 1
+PROPERTIES_PER_FLAG_WORD = 15
+
+# (class_id, property flag words) -> the (name, decoder) pairs of the properties present
+_property_decoder_sequences = {}
+
+
+def get_property_decoders(class_id, property_flag_words):
+    """
+    The decoders for a flag word combination are computed once, afterwards every header with the same flags
+    decodes its properties in a straight loop.
+    """
+    key = (class_id, property_flag_words)
+    try:
+        return _property_decoder_sequences[key]
+    except KeyError:
+        pass
+    class_properties = CLASS_PROPERTIES[class_id]
+    property_decoders = []
+    for word_index, property_flags in enumerate(property_flag_words):
+        for bit_index in range(PROPERTIES_PER_FLAG_WORD):
+            property_index = word_index * PROPERTIES_PER_FLAG_WORD + bit_index
+            if property_flags & (1 << (15 - bit_index)) and property_index < len(class_properties):
+                property_decoders.append(class_properties[property_index])
+    property_decoders = tuple(property_decoders)
+    _property_decoder_sequences[key] = property_decoders
+    return property_decoders
+
+
+def decode_property_flags(buffer, offset):
+    property_flags, offset = decode_short_uint(buffer, offset)
+    property_flag_words = (property_flags,)
+    while property_flags & PROPERTY_FLAGS_CONTINUATION:
+        property_flags, offset = decode_short_uint(buffer, offset)
+        property_flag_words += (property_flags,)
+    return property_flag_words, offset
+
+
+def decode_properties(class_id, buffer, offset):
+    """Decode the property flags and the properties present in a content header into an OrderedDict"""
+    property_flag_words, offset = decode_property_flags(buffer, offset)
+    result = OrderedDict()
+    for name, decoder in get_property_decoders(class_id, property_flag_words):
+        result[name], offset = decoder(buffer, offset)
+    return result, offset
+
@@ -2,146 +2,427 @@ import sys
 
 from itertools import zip_longest
 
-from amqp_protocol_spec import *
 from amqp_constants import FRAME_HEARTBEAT
+from amqp_protocol_parser import CLIENT, SERVER
+from amqp_protocol_grammar import _get_array_name, compile_step, PROTOCOL_GRAMMAR, RESYNC_GRAMMAR, ATOMIC, SEQUENCE, \
+    ALTERNATIVE, OPTIONAL, REPEAT
 
 
-def _get_array_name(protocol_step):
-    """Get one of the arrays from above given their name contained in a parent array"""
-    protocol_step = protocol_step.replace("*", "").replace("?", "")  # strip quantifiers
-    return protocol_step.upper().replace("-", "_")
-
+class ProtocolMismatch(Exception):
+    """The message is formatted from the arguments only when it is displayed, most mismatches are just backtracked"""
+    def __str__(self):
+        if len(self.args) > 1:
+            return self.args[0] % self.args[1:]
+        return super(ProtocolMismatch, self).__str__()
 
-def _is_client_step(step):
-    return step.startswith("C:")
 
+class MessageCursor(object):
+    """
+    Reads a message list or tuple through an index instead of popping from it,
+    the position can be saved and restored.
+    """
+    def __init__(self, messages):
+        self.messages = messages
+        self.position = 0
 
-def _is_server_step(step):
-    return step.startswith("S:")
+    def current(self):
+        return self.messages[self.position]
 
+    def message_at(self, position):
+        return self.messages[position]
 
-def _is_repeatable_step_spec(step):
-    return step.startswith("*")
+    def advance(self):
+        self.position += 1
 
+    def at_end(self):
+        return self.position >= len(self.messages)
 
-def _is_optional_step_spec(step):
-    return step.startswith("?")
+    def release(self):
+        """Messages before the current position will not be read again"""
+        pass
 
+    def remaining(self):
+        for index in range(self.position, len(self.messages)):
+            yield self.messages[index]
 
-def _is_alternative_step_spec(step):
-    return " | " in step
 
+class MessageWindow(MessageCursor):
+    """
+    Cursor over a message iterator (e.g. a stream parser). Messages are pulled from the iterator when the position
+    reaches them and dropped once released, so only the lookahead window is kept in memory.
+    """
+    def __init__(self, messages):
+        super(MessageWindow, self).__init__(iter(messages))
+        self._window = []
+        self._window_start = 0  # position of the first message in the window
 
-def _is_mandatory_step(step):
-    return not (step.startswith("S:") or step.startswith("C:"))
+    def current(self):
+        index = self.position - self._window_start
+        while index >= len(self._window):
+            try:
+                self._window.append(next(self.messages))
+            except StopIteration:
+                raise IndexError("Message stream exhausted")
+        return self._window[index]
 
+    def message_at(self, position):
+        """Only the messages of the window can be read at any position"""
+        return self._window[position - self._window_start]
 
-def message_matches_step(step, message):
-    return message.source.startswith(step[0]) and message.method == step[2:]
+    def at_end(self):
+        try:
+            self.current()
+            return False
+        except IndexError:
+            return True
 
+    def release(self):
+        del self._window[:self.position - self._window_start]
+        self._window_start = self.position
 
-def get_protocol_part(protocol_part_name):
-    return getattr(sys.modules[__name__], _get_array_name(protocol_part_name))
+    def remaining(self):
+        for message in self._window[self.position - self._window_start:]:
+            yield message
+        for message in self.messages:
+            yield message
 
 
-class ProtocolMismatch(Exception):
-    pass
+def _make_cursor(messages):
+    # other sequences (e.g. an AMQPFrameStore) build a new frame on every index, they are read once through a window
+    if isinstance(messages, (list, tuple)):
+        return MessageCursor(messages)
+    return MessageWindow(messages)
 
 
 class ProtocolDetective(object):
-    def __init__(self, client_messages, server_messages):
+    """
+    Finds the order in which the client and server messages were exchanged by matching them against the protocol
+    grammar. The messages can be sequences or iterators, iter_messages() yields every message as soon as its place in
+    the order is final, keeping only the messages that are still being matched in memory.
+    When the messages stop matching the grammar the remaining messages are all marked out of order and alternated.
+    With recover the analysis recovers locally instead: the messages that can't be matched are marked out of order
+    and skipped, and the matching resumes with the units of the resync grammar.
+    """
+    def __init__(self, client_messages, server_messages, grammar=PROTOCOL_GRAMMAR, recover=False,
+                 resync_grammar=RESYNC_GRAMMAR):
+        self.grammar = grammar
+        self.recover = recover
+        self.resync_grammar = resync_grammar
         self.processed_messages = []
+        self._set_cursors(_make_cursor(client_messages), _make_cursor(server_messages))
+        self._matchers = {
+            ATOMIC: self._match_atomic,
+            SEQUENCE: self._match_sequence,
+            ALTERNATIVE: self._match_alternative,
+            OPTIONAL: self._match_optional,
+            REPEAT: self._match_repeat
+        }
+        self._memo = {}  # (node, client position, server position) -> mismatch or match result
+        # (processed messages, cursor, position) of the atomic mismatch that got farthest in a resync unit
+        self._farthest_mismatch = (0, None, None)
+        self._skipped = set()  # (cursor, position) of the messages stepped over by the resynchronized matching
+
+    @classmethod
+    def validator(cls, messages, grammar=PROTOCOL_GRAMMAR, recover=False):
+        """
+        Detective for messages that are already in their exchange order (e.g. merged by capture time): both sources
+        are read through the same cursor so the grammar only checks the order instead of searching for one.
+        """
+        detective = cls((), (), grammar, recover)
+        cursor = _make_cursor(messages)
+        detective._set_cursors(cursor, cursor)
+        return detective
+
+    def _set_cursors(self, client_messages, server_messages):
         self.client_messages = client_messages
         self.server_messages = server_messages
+        self._cursors = {CLIENT: client_messages, SERVER: server_messages}
 
     def analyze(self):
+        return list(self.iter_messages())
+
+    def iter_messages(self):
         try:
-            self._analyze_protocol_part("protocol")
+            for message in self._iter_committed(self.grammar):
+                yield message
+            if not (self.client_messages.at_end() and self.server_messages.at_end()):
+                raise ProtocolMismatch("Messages left after the end of the protocol at: %s", self.grammar.name)
         except ProtocolMismatch as e:
             print(e, file=sys.stderr, flush=True)
-            for client_message, server_message in zip_longest(self.client_messages, self.server_messages):
+            if self.recover:
+                for message in self._iter_resynchronized():
+                    yield message
+                return
+            if self.client_messages is self.server_messages:
+                for message in self.client_messages.remaining():
+                    message.out_of_order = True
+                    yield message
+                return
+            for client_message, server_message in zip_longest(self.client_messages.remaining(),
+                                                              self.server_messages.remaining()):
                 if client_message:
                     client_message.out_of_order = True
-                    self.processed_messages.append(client_message)
+                    yield client_message
                 if server_message:
                     server_message.out_of_order = True
-                    self.processed_messages.append(server_message)
-        return self.processed_messages
+                    yield server_message
 
-    def _analyze_protocol_part(self, step):
-        protocol_table = get_protocol_part(step)
-        for current_step in protocol_table:
-            if _is_alternative_step_spec(current_step):
-                protocol_alternatives = current_step.split(" | ")
-                for protocol_alternative in protocol_alternatives:
-                    if _is_client_step(protocol_alternative):
-                        self._analyze_atomic_step(protocol_alternative, self.client_messages)
-                        break
-                    elif _is_server_step(protocol_alternative):
-                        self._analyze_atomic_step(protocol_alternative, self.server_messages)
-                        break
-                    elif _is_repeatable_step_spec(protocol_alternative) or \
-                            _is_optional_step_spec(protocol_alternative):
-                        raise Exception("Can't have quantifiers applied to an alternative rule. "
-                                        "Use them only in step sequences.")
-                    else:  # non-atomic mandatory alternative
-                        try:
-                            self._analyze_protocol_part(protocol_alternative)
-                            break
-                        except ProtocolMismatch:
-                            pass  # the alternative did not match try the next one
-                else:  # none of the alternatives matched
-                    raise ProtocolMismatch("None of the protocol alternatives matched:\n"
-                                           "alternatives:%s\n"
-                                           "current message: %s" % (protocol_alternatives, current_step))
-            elif _is_optional_step_spec(current_step):
-                self._analyze_optional_step(current_step[1:])
-            elif _is_repeatable_step_spec(current_step):
-                self._analyze_repeatable_step(current_step[1:])
-            elif _is_mandatory_step(current_step):
-                self._analyze_protocol_part(current_step)
-            elif _is_client_step(current_step):
-                self._analyze_atomic_step(current_step, self.client_messages)
-            elif _is_server_step(current_step):
-                self._analyze_atomic_step(current_step, self.server_messages)
+    def _iter_resynchronized(self):
+        """
+        Match the rest of the messages one resync unit at a time. When no unit matches, one message is skipped:
+        it is marked out of order and stepped over like a heartbeat, and the matching resumes.
+        """
+        while not (self.client_messages.at_end() and self.server_messages.at_end()):
+            positions = self.client_messages.position, self.server_messages.position
+            self._farthest_mismatch = (0, None, None)
+            try:
+                self._match(self.resync_grammar)
+            except ProtocolMismatch:
+                self._skip_message()
             else:
-                raise ProtocolMismatch("Invalid protocol step spec: %s" % current_step)
+                if positions == (self.client_messages.position, self.server_messages.position):
+                    self._skip_message()  # the unit matched nothing
+            for message in self._commit():
+                yield message
+
+    def _skip_message(self):
+        """
+        Choose the message to skip. The candidates are the message where the matching got farthest before failing
+        and the messages at the head of the streams, the ones that can't start any unit first. The first candidate
+        whose skipping lets a unit match is skipped, if there is none the head of the farthest failing stream.
+        """
+        cursors = [cursor for cursor in (self.client_messages, self.server_messages) if not cursor.at_end()]
+        if len(cursors) == 2 and cursors[0] is cursors[1]:
+            del cursors[1]
+        for cursor in cursors:
+            if cursor.current().type == FRAME_HEARTBEAT or (cursor, cursor.position) in self._skipped:
+                self._skip_current(cursor)
+                return
+        _, farthest_cursor, farthest_position = self._farthest_mismatch
+        first = self.resync_grammar.first
+        cursors.sort(key=lambda cursor: (cursor is not farthest_cursor,
+                                         (cursor.current().source, cursor.current().method) in first))
+        candidates = [(cursor, cursor.position) for cursor in cursors]
+        if farthest_cursor is not None and (farthest_cursor, farthest_position) not in candidates:
+            candidates.insert(0, (farthest_cursor, farthest_position))
+        for candidate in candidates:
+            if self._can_resume_without(candidate):
+                break
+        else:
+            candidate = cursors[0], cursors[0].position
+        cursor, position = candidate
+        cursor.message_at(position).out_of_order = True
+        self._skipped.add(candidate)
+        self._memo.clear()  # the memoized results did not skip the message
+        if position == cursor.position:
+            self._skip_current(cursor)
 
-    def _analyze_optional_step(self, current_step):
+    def _can_resume_without(self, candidate):
+        self._skipped.add(candidate)
+        self._memo.clear()
+        snapshot = self._snapshot()
         try:
-            if _is_client_step(current_step):
-                self._analyze_atomic_step(current_step, self.client_messages)
-            elif _is_server_step(current_step):
-                self._analyze_atomic_step(current_step, self.server_messages)
-            else:
-                self._analyze_protocol_part(current_step)
+            self._match(self.resync_grammar)
+            return True
+        except ProtocolMismatch:
+            return False
+        finally:
+            self._restore(snapshot)
+            self._skipped.discard(candidate)
+            self._memo.clear()
+
+    def _skip_current(self, cursor):
+        message = cursor.current()
+        if message.type != FRAME_HEARTBEAT:
+            message.out_of_order = True
+        self.processed_messages.append(message)
+        self._skipped.discard((cursor, cursor.position))
+        cursor.advance()
+
+    def _iter_committed(self, node):
+        """
+        Match a node whose failure ends the analysis, committing the matched messages as often as possible:
+        after every step of a sequence and every iteration of a repetition. An iteration is committed to once its
+        first step matched, the steps after it are committed one by one, so e.g. a channel is handed out after
+        channel.open, after every use of the channel and after its close instead of once it is closed. Parts that
+        may have to be backtracked are matched as a whole before being committed.
+        """
+        if node.kind == SEQUENCE:
+            for child in node.children:
+                for message in self._iter_committed(child):
+                    yield message
+        elif node.kind == REPEAT:
+            child = node.children[0]
+            while True:
+                positions = self.client_messages.position, self.server_messages.position
+                try:
+                    steps = self._match_start(child)
+                except ProtocolMismatch:
+                    break
+                for message in self._commit():
+                    yield message
+                for step in steps:
+                    for message in self._iter_committed(step):
+                        yield message
+                if positions == (self.client_messages.position, self.server_messages.position):
+                    break
+        elif node.kind == OPTIONAL and not node.children[0].can_fail:
+            for message in self._iter_committed(node.children[0]):
+                yield message
+        else:
+            self._match(node)
+            for message in self._commit():
+                yield message
+
+    def _match_start(self, node):
+        """
+        Match the first step of a node that no other parse can start with, returns the steps left to match after it.
+        The start goes down the predictive alternatives, the choice of every other one is left to _match and the node
+        is matched as a whole.
+        """
+        if node.kind == SEQUENCE and len(node.children) == 1:
+            return self._match_start(node.children[0])
+        if node.kind == ALTERNATIVE and node.predictive:
+            heads = self._get_heads()
+            for child in node.children:
+                if heads is not None and heads.isdisjoint(child.first):
+                    continue
+                try:
+                    return self._match_start(child)
+                except ProtocolMismatch:
+                    pass
+            raise ProtocolMismatch("None of the protocol alternatives matched:\n"
+                                   "alternatives:%s\n"
+                                   "current message: %s", [child.name for child in node.children], node.name)
+        if node.kind == SEQUENCE and node.children[0].can_fail:
+            self._match(node.children[0])
+            return node.children[1:]
+        self._match(node)
+        return ()
+
+    def _commit(self):
+        """The processed messages will not be backtracked anymore, hand them out and forget them"""
+        messages = self.processed_messages
+        self.processed_messages = []
+        self._memo.clear()
+        self.client_messages.release()
+        self.server_messages.release()
+        if self._skipped:
+            self._skipped = set(skip for skip in self._skipped if skip[1] >= skip[0].position)
+        return messages
+
+    def _analyze_protocol_part(self, step):
+        self._match(compile_step(step))
+
+    def _snapshot(self):
+        return self.client_messages.position, self.server_messages.position, len(self.processed_messages)
+
+    def _restore(self, snapshot):
+        self.client_messages.position, self.server_messages.position, processed_count = snapshot
+        del self.processed_messages[processed_count:]
+
+    def _match(self, node):
+        """
+        Packrat matching: the outcome of every rule at a given pair of stream positions is memoized, so retrying it
+        there (e.g. in the next alternative of a choice) replays the result instead of matching again.
+        A rule that fails restores the stream positions and the processed messages it started with.
+        """
+        if node.kind == ATOMIC:
+            return self._match_atomic(node)
+        snapshot = self._snapshot()
+        key = node, snapshot[0], snapshot[1]
+        memo = self._memo.get(key)
+        if memo is not None:
+            if isinstance(memo, ProtocolMismatch):
+                raise ProtocolMismatch(*memo.args)
+            self.client_messages.position, self.server_messages.position, messages = memo
+            self.processed_messages.extend(messages)
+            return
+        try:
+            self._matchers[node.kind](node)
+        except ProtocolMismatch as e:
+            self._restore(snapshot)
+            self._memo[key] = e
+            raise
+        self._memo[key] = (self.client_messages.position,
+                           self.server_messages.position,
+                           tuple(self.processed_messages[snapshot[2]:]))
+
+    def _match_sequence(self, node):
+        for child in node.children:
+            self._match(child)
+
+    def _match_alternative(self, node):
+        heads = self._get_heads()
+        for child in node.children:
+            if heads is not None and child.can_fail and heads.isdisjoint(child.first):
+                continue  # the alternative can't start with any of the next messages
+            try:
+                self._match(child)
+                return
+            except ProtocolMismatch:
+                pass  # the alternative did not match try the next one
+        raise ProtocolMismatch("None of the protocol alternatives matched:\n"
+                               "alternatives:%s\n"
+                               "current message: %s", [child.name for child in node.children], node.name)
+
+    def _get_heads(self):
+        """The (source, method) of the next message of every stream, None if heartbeats or skips hide them"""
+        heads = set()
+        for messages in (self.client_messages, self.server_messages):
+            try:
+                message = messages.current()
+            except IndexError:
+                continue
+            if message.type == FRAME_HEARTBEAT or self._skipped:
+                return None
+            heads.add((message.source, message.method))
+        return heads
+
+    def _match_optional(self, node):
+        try:
+            self._match(node.children[0])
         except ProtocolMismatch:
             pass  # protocol part can match 0 or 1 time
 
-    def _analyze_repeatable_step(self, current_step):
+    def _match_repeat(self, node):
+        child = node.children[0]
         try:
             while True:
-                if _is_client_step(current_step):
-                    self._analyze_atomic_step(current_step, self.client_messages)
-                elif _is_server_step(current_step):
-                    self._analyze_atomic_step(current_step, self.server_messages)
-                else:
-                    self._analyze_protocol_part(current_step)
+                positions = self.client_messages.position, self.server_messages.position
+                memo_size = len(self._memo)
+                self._match(child)
+                if positions == (self.client_messages.position, self.server_messages.position):
+                    break  # matched without consuming anything, it would loop forever
+                # the results memoized inside a finished iteration are rarely retried, dropping them keeps the memo
+                # proportional to the current iteration instead of the whole stream. The memo only grows while
+                # matching, so they are the entries inserted last, the ones of the enclosing rules are kept.
+                while len(self._memo) > memo_size:
+                    self._memo.popitem()
         except ProtocolMismatch:
             pass  # protocol part can match 0 or more times
 
-    def _analyze_atomic_step(self, current_step, messages):
+    def _match_atomic(self, node):
+        messages = self._cursors[node.source]
+        snapshot = self._snapshot()
         try:
-            message = messages.pop(0)
-            while message.type == FRAME_HEARTBEAT:
+            message = messages.current()
+            skipped = self._skipped
+            while message.type == FRAME_HEARTBEAT or (skipped and (messages, messages.position) in skipped):
                 self.processed_messages.append(message)
-                message = messages.pop(0)
-            if message_matches_step(current_step, message):
+                messages.advance()
+                message = messages.current()
+            if message.source == node.source and message.method == node.method:
                 self.processed_messages.append(message)
-            else:
-                messages.insert(0, message)
-                raise ProtocolMismatch("Atomic step did not match:\n"
-                                       "actual: %s\n"
-                                       "expected: %s" % (message, current_step))
+                messages.advance()
+                return
         except IndexError:
-            raise ProtocolMismatch("Message stream empty but protocol is ongoing at: %s" % current_step)
+            self._restore(snapshot)
+            raise ProtocolMismatch("Message stream empty but protocol is ongoing at: %s", node.name)
+        progress = snapshot[2]
+        if progress and progress >= self._farthest_mismatch[0]:  # the last one tried wins a tie
+            self._farthest_mismatch = progress, messages, messages.position
+        self._restore(snapshot)
+        raise ProtocolMismatch("Atomic step did not match:\n"
+                               "actual: %s\n"
+                               "expected: %s", message, node.name)
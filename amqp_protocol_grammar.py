@@ -0,0 +1,154 @@
+"""
+Compiles the string grammar of amqp_protocol_spec into a tree of GrammarNode objects once, at import time.
+All the string handling (alternatives, quantifiers, rule name lookups, message sources) happens here so that
+matching frames against the grammar is a walk over precomputed nodes.
+
+The rules are deliberately compiled into a tree and not into a state machine. The detective doesn't read one
+sequence of symbols: every atomic step is taken from either the client or the server stream, and their
+interleaving is what it has to find out. A failed alternative gives back the messages it consumed from both
+streams (e.g. get-content before get-empty), and the recovery retries units after skipping single messages. A
+flat automaton would have to enumerate the interleavings and would lose the rule boundaries that the
+backtracking, the memo and the out of order marking work on. What a table driven matcher would precompute is kept
+per node instead: the matcher of every node kind is looked up in a table, and can_fail and the FIRST sets let the
+detective skip alternatives without trying them, and predictive tells which alternatives are chosen by their first
+message, so the online analysis can commit to them as soon as that message matched.
+"""
+import amqp_protocol_spec
+
+from amqp_protocol_parser import CLIENT, SERVER
+
+ATOMIC = 0
+SEQUENCE = 1
+ALTERNATIVE = 2
+OPTIONAL = 3
+REPEAT = 4
+
+MESSAGE_SOURCES = {
+    "C": CLIENT,
+    "S": SERVER
+}
+
+
+class GrammarError(Exception):
+    pass
+
+
+class GrammarNode(object):
+    __slots__ = ('kind', 'name', 'children', 'source', 'method', 'can_fail', 'first', 'predictive')
+
+    def __init__(self, kind, name, children=(), source=None, method=None):
+        self.kind = kind
+        self.name = name  # the step spec or rule name the node was compiled from
+        self.children = tuple(children)
+        self.source = source
+        self.method = method
+        self.can_fail = _can_fail(self)
+        self.first = _get_first(self)
+        self.predictive = _is_predictive(self)
+
+    def __repr__(self):
+        return "GrammarNode(%d, %s)" % (self.kind, self.name)
+
+
+def _can_fail(node):
+    """Optional and repeated steps always match, possibly nothing"""
+    if node.kind == ATOMIC:
+        return True
+    if node.kind == SEQUENCE:
+        return any(child.can_fail for child in node.children)
+    if node.kind == ALTERNATIVE:
+        return all(child.can_fail for child in node.children)
+    return False
+
+
+def _get_first(node):
+    """The (source, method) pairs of the messages the node can start with"""
+    if node.kind == ATOMIC:
+        return frozenset([(node.source, node.method)])
+    first = set()
+    for child in node.children:
+        first |= child.first
+        if node.kind == SEQUENCE and child.can_fail:
+            break  # the following steps can only come after this one
+    return frozenset(first)
+
+
+def _is_predictive(node):
+    """Alternatives that can't match nothing and whose children can't start with the same message"""
+    if node.kind != ALTERNATIVE or not node.can_fail:
+        return False
+    seen = set()
+    for child in node.children:
+        if not child.can_fail or not seen.isdisjoint(child.first):
+            return False
+        seen |= child.first
+    return True
+
+
+def _get_array_name(protocol_step):
+    """Get one of the arrays from above given their name contained in a parent array"""
+    protocol_step = protocol_step.replace("*", "").replace("?", "")  # strip quantifiers
+    return protocol_step.upper().replace("-", "_")
+
+
+def _is_atomic_step(step):
+    return step[:2] in ("C:", "S:")
+
+
+def _is_repeatable_step_spec(step):
+    return step.startswith("*")
+
+
+def _is_optional_step_spec(step):
+    return step.startswith("?")
+
+
+def _is_alternative_step_spec(step):
+    return " | " in step
+
+
+def get_protocol_part(protocol_part_name):
+    try:
+        return getattr(amqp_protocol_spec, _get_array_name(protocol_part_name))
+    except AttributeError:
+        raise GrammarError("Unknown protocol part: %s" % protocol_part_name)
+
+
+class GrammarCompiler(object):
+    def __init__(self):
+        self.rules = {}
+
+    def compile_rule(self, rule_name):
+        """Rules are compiled once and shared by every step referencing them"""
+        array_name = _get_array_name(rule_name)
+        if array_name not in self.rules:
+            self.rules[array_name] = GrammarNode(SEQUENCE, rule_name, [self.compile_step(step)
+                                                                       for step in get_protocol_part(rule_name)])
+        return self.rules[array_name]
+
+    def compile_step(self, step):
+        if _is_alternative_step_spec(step):
+            alternatives = step.split(" | ")
+            for alternative in alternatives:
+                if _is_repeatable_step_spec(alternative) or _is_optional_step_spec(alternative):
+                    raise GrammarError("Can't have quantifiers applied to an alternative rule. "
+                                       "Use them only in step sequences.")
+            return GrammarNode(ALTERNATIVE, step, [self.compile_step(alternative) for alternative in alternatives])
+        if _is_optional_step_spec(step):
+            return GrammarNode(OPTIONAL, step, [self.compile_step(step[1:])])
+        if _is_repeatable_step_spec(step):
+            return GrammarNode(REPEAT, step, [self.compile_step(step[1:])])
+        if _is_atomic_step(step):
+            return GrammarNode(ATOMIC, step, source=MESSAGE_SOURCES[step[0]], method=step[2:])
+        return self.compile_rule(step)
+
+
+_compiler = GrammarCompiler()
+
+
+def compile_step(step):
+    return _compiler.compile_step(step)
+
+
+PROTOCOL_GRAMMAR = compile_step("protocol")
+RESYNC_GRAMMAR = compile_step("resync")
@@ -1,3 +1,10 @@
+import mmap
+import os
+import struct
+
+from collections import namedtuple
+from functools import partial
+
 from amqp_constants import *
 from amqp_data_types import *
 from amqp_messages import AMQPFrame, AMQPProtocolHeader
@@ -6,18 +13,101 @@ KNOWN_FRAME_TYPES = [FRAME_METHOD, FRAME_HEADER, FRAME_BODY, FRAME_HEARTBEAT]
 
 FRAME_END_MARKER = ord(b'\xCE')
 
+FRAME_HEADER_SIZE = 7
+PROTOCOL_HEADER_SIZE = 8
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_FRAME_SIZE = 1024 * 1024  # frames claiming to be larger are not accepted when resynchronizing
+
 CLIENT = "CLIENT"
 SERVER = "SERVER"
 
+_frame_header_struct = struct.Struct("!BHL")
+_protocol_header_struct = struct.Struct("!4sBBBB")
+
 
 class MalformedMessage(Exception):
     pass
 
 
+# bytes skipped to resynchronize after a malformed frame, offset is relative to the start of the stream
+ParseGap = namedtuple('ParseGap', 'offset size reason')
+
+
+def _get_frame_bounds(buffer, offset):
+    """
+    Decode the frame header found at offset.
+    Returns (frame_type, channel_id, payload_start, payload_end) or None if the buffer does not hold the whole frame.
+    """
+    if len(buffer) - offset < FRAME_HEADER_SIZE:
+        return None
+    frame_type, channel_id, payload_size = _frame_header_struct.unpack_from(buffer, offset)
+    if frame_type not in KNOWN_FRAME_TYPES:
+        raise MalformedMessage("Unknown frame type: %d" % frame_type)
+    payload_start = offset + FRAME_HEADER_SIZE
+    payload_end = payload_start + payload_size
+    if len(buffer) < payload_end + 1:
+        return None
+    frame_end = buffer[payload_end]
+    if frame_end != FRAME_END_MARKER:
+        raise MalformedMessage("Invalid frame end marker: %s" % hex(frame_end))
+    return frame_type, channel_id, payload_start, payload_end
+
+
+def _get_protocol_header(buffer, offset):
+    _, protocol_id, protocol_version_major, protocol_version_minor, protocol_version_revision = \
+        _protocol_header_struct.unpack_from(buffer, offset)
+    return AMQPProtocolHeader(protocol_id, protocol_version_major, protocol_version_minor, protocol_version_revision)
+
+
+def find_frame_boundary(buffer, offset, max_frame_size=DEFAULT_MAX_FRAME_SIZE, final=True):
+    """
+    Scan forward from offset for the next plausible frame start. Frames start right after the end marker of the
+    previous frame, so candidates are found with find() on the 0xCE marker and confirmed by their known frame type,
+    a size that puts their own end marker in place and a known frame type right after them.
+    Returns (offset, confirmed). When the buffer is not final a candidate that runs past its end is returned
+    unconfirmed, more data is needed to check it. Returns (None, True) if there is no candidate at all.
+    """
+    marker = buffer.find(b'\xce', offset)
+    while marker != -1:
+        candidate = marker + 1
+        if len(buffer) - candidate < FRAME_HEADER_SIZE:
+            return (None, True) if final else (candidate, False)
+        frame_type, _, payload_size = _frame_header_struct.unpack_from(buffer, candidate)
+        frame_end = candidate + FRAME_HEADER_SIZE + payload_size
+        if frame_type in KNOWN_FRAME_TYPES and payload_size <= max_frame_size:
+            if frame_end >= len(buffer):
+                if not final:
+                    return candidate, False
+            elif buffer[frame_end] == FRAME_END_MARKER and \
+                    (frame_end + 1 == len(buffer) or buffer[frame_end + 1] in KNOWN_FRAME_TYPES):
+                return candidate, True
+        marker = buffer.find(b'\xce', candidate)
+    return None, True
+
+
 class AMQPStreamParser(object):
-    def __init__(self, bytes, source):
-        self.bytes = bytes
+    """
+    Walks the byte dump with an integer offset over a memoryview, so the dump itself is never re-sliced.
+    In zero_copy mode the frame payloads are memoryviews into the original buffer and nothing is copied
+    until a caller asks for the bytes.
+    In recover mode malformed frames don't stop the parsing, the parser skips to the next plausible frame boundary
+    and records the skipped bytes in gaps.
+    timestamps is an optional list of (stream offset, capture time) for the captured segments, sorted by offset.
+    Every frame gets the capture time of the segment holding its last byte, i.e. when it was complete.
+    """
+    def __init__(self, bytes, source, zero_copy=False, recover=False, max_frame_size=DEFAULT_MAX_FRAME_SIZE,
+                 timestamps=None):
+        self.bytes = memoryview(bytes)
+        self.offset = 0
         self.source = source
+        self.zero_copy = zero_copy
+        self.recover = recover
+        self.max_frame_size = max_frame_size
+        self.gaps = []
+        self.timestamps = timestamps
+        self._timestamp_index = 0
+        self._searchable_bytes = bytes  # memoryviews have no find()
         if source == 'CLIENT':
             self.parse_frame = self.parse_frame_init
         else:
@@ -30,7 +120,7 @@ class AMQPStreamParser(object):
         return self.next_message()
 
     def next_message(self):
-        if not self.bytes:
+        if self.offset >= len(self.bytes):
             raise StopIteration
         return self.parse_frame()
 
@@ -42,26 +132,187 @@ class AMQPStreamParser(object):
             return self.parse_frame()
 
     def parse_standard_frame(self):
-        frame_type, self.bytes = extract_octet(self.bytes)
-        if frame_type not in KNOWN_FRAME_TYPES:
-            raise MalformedMessage("Unknown frame type: %d" % frame_type)
-        channel_id, self.bytes = extract_short_uint(self.bytes)
-        payload_size, self.bytes = extract_long_uint(self.bytes)
-        if len(self.bytes) < payload_size + 1:
-            raise MalformedMessage("Truncated frame")
-        payload, self.bytes = self.bytes[:payload_size], self.bytes[payload_size:]
-        frame_end, self.bytes = extract_octet(self.bytes)
-        if frame_end != FRAME_END_MARKER:
-            raise MalformedMessage("Invalid frame end marker: %s" % hex(frame_end))
-        return AMQPFrame(self.source, frame_type, channel_id, payload)
+        try:
+            frame_bounds = _get_frame_bounds(self.bytes, self.offset)
+            if frame_bounds is None:
+                raise MalformedMessage("Truncated frame")
+        except MalformedMessage as e:
+            if not self.recover:
+                raise
+            return self._resynchronize(e)
+        frame_type, channel_id, payload_start, payload_end = frame_bounds
+        payload = self.bytes[payload_start:payload_end]
+        if not self.zero_copy:
+            payload = payload.tobytes()
+        self.offset = payload_end + 1
+        frame = AMQPFrame(self.source, frame_type, channel_id, payload)
+        if self.timestamps:
+            frame.timestamp = self._get_timestamp(payload_end)
+        return frame
+
+    def _get_timestamp(self, offset):
+        # frames come in stream order so the segment index only moves forward
+        timestamps, index = self.timestamps, self._timestamp_index
+        while index + 1 < len(timestamps) and timestamps[index + 1][0] <= offset:
+            index += 1
+        self._timestamp_index = index
+        return timestamps[index][1]
+
+    def _resynchronize(self, error):
+        if not hasattr(self._searchable_bytes, 'find'):
+            self._searchable_bytes = self.bytes.tobytes()
+        boundary, _ = find_frame_boundary(self._searchable_bytes, self.offset, self.max_frame_size)
+        if boundary is None:
+            boundary = len(self.bytes)
+        self.gaps.append(ParseGap(self.offset, boundary - self.offset, str(error)))
+        self.offset = boundary
+        return self.next_message()
 
     def _is_protocol_header(self):
-        return self.bytes[:4] == b'AMQP'
+        return self.bytes[self.offset:self.offset + 4] == b'AMQP'
 
     def _extract_protocol_header(self):
-        amqp_literal, self.bytes = self.bytes[:4], self.bytes[4:]
-        protocol_id, self.bytes = extract_octet(self.bytes)
-        protocol_version_major, self.bytes = extract_octet(self.bytes)
-        protocol_version_minor, self.bytes = extract_octet(self.bytes)
-        protocol_version_revision, self.bytes = extract_octet(self.bytes)
-        return AMQPProtocolHeader(protocol_id, protocol_version_major, protocol_version_minor, protocol_version_revision)
+        if len(self.bytes) - self.offset < PROTOCOL_HEADER_SIZE:
+            raise MalformedMessage("Truncated protocol header")
+        protocol_header = _get_protocol_header(self.bytes, self.offset)
+        self.offset += PROTOCOL_HEADER_SIZE
+        if self.timestamps:
+            protocol_header.timestamp = self._get_timestamp(self.offset - 1)
+        return protocol_header
+
+
+class AMQPIncrementalParser(object):
+    """
+    Accepts the dump in arbitrary chunks through feed() and returns the frames completed by each chunk.
+    Only the trailing partial frame is kept in memory between calls.
+    Recover mode works like the one of AMQPStreamParser, a gap can span several chunks.
+    When chunks are fed with their capture timestamp, the frames they complete get that timestamp.
+    """
+    def __init__(self, source, recover=False, max_frame_size=DEFAULT_MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.offset = 0  # stream offset of the first byte in the buffer
+        self.source = source
+        self.recover = recover
+        self.max_frame_size = max_frame_size
+        self.gaps = []
+        self._expect_protocol_header = source == CLIENT
+        self._gap = None  # (offset, reason) of the gap being skipped
+
+    def feed(self, chunk, timestamp=None):
+        frames = self._parse_chunk(chunk)
+        if timestamp is not None:
+            for frame in frames:
+                frame.timestamp = timestamp
+        return frames
+
+    def _parse_chunk(self, chunk):
+        buffer = self.buffer
+        buffer += chunk
+        frames = []
+        position = 0
+        try:
+            if self._expect_protocol_header:
+                if len(buffer) < PROTOCOL_HEADER_SIZE and b'AMQP'.startswith(bytes(buffer[:4])):
+                    return frames
+                self._expect_protocol_header = False
+                if buffer[:4] == b'AMQP':
+                    frames.append(_get_protocol_header(buffer, 0))
+                    position = PROTOCOL_HEADER_SIZE
+            while True:
+                if self._gap is not None:
+                    position = self._skip_gap(position)
+                    if self._gap is not None:
+                        return frames
+                try:
+                    frame_bounds = _get_frame_bounds(buffer, position)
+                except MalformedMessage as e:
+                    if not self.recover:
+                        raise
+                    self._gap = (self.offset + position, str(e))
+                    continue
+                if frame_bounds is None:
+                    return frames
+                frame_type, channel_id, payload_start, payload_end = frame_bounds
+                frames.append(AMQPFrame(self.source, frame_type, channel_id, bytes(buffer[payload_start:payload_end])))
+                position = payload_end + 1
+        finally:
+            del buffer[:position]
+            self.offset += position
+
+    def _skip_gap(self, position):
+        boundary, confirmed = find_frame_boundary(self.buffer, position, self.max_frame_size, final=False)
+        if boundary is None:
+            return len(self.buffer)
+        if not confirmed:
+            return boundary - 1  # keep the end marker in front of the candidate for the next search
+        self._end_gap(self.offset + boundary)
+        return boundary
+
+    def _end_gap(self, end):
+        gap_offset, reason = self._gap
+        self.gaps.append(ParseGap(gap_offset, end - gap_offset, reason))
+        self._gap = None
+
+    def close(self):
+        """Signal the end of the stream, fails if it ended in the middle of a frame"""
+        if self._gap is None and self.buffer:
+            if not self.recover:
+                raise MalformedMessage("Truncated frame")
+            self._gap = (self.offset, "Truncated frame")
+        if self._gap is not None:
+            self._end_gap(self.offset + len(self.buffer))
+
+
+def feed_file(parser, filename, chunk_size=DEFAULT_CHUNK_SIZE, timestamps=None):
+    """
+    Feed a dump file chunk by chunk to an incremental parser, yielding every frame as soon as it has been read.
+    With a list of (stream offset, capture time) the file is fed segment by segment with the segment timestamps.
+    """
+    with open(filename, 'rb') as f:
+        if timestamps:
+            chunks = _iter_timestamped_segments(f, timestamps, chunk_size)
+        else:
+            chunks = ((chunk, None) for chunk in iter(partial(f.read, chunk_size), b''))
+        for chunk, timestamp in chunks:
+            for frame in parser.feed(chunk, timestamp):
+                yield frame
+    parser.close()
+
+
+def _iter_timestamped_segments(f, timestamps, chunk_size):
+    # bytes in front of the first indexed segment belong to it
+    position = 0
+    for index, (_, timestamp) in enumerate(timestamps):
+        segment_end = timestamps[index + 1][0] if index + 1 < len(timestamps) else None
+        while segment_end is None or position < segment_end:
+            chunk = f.read(chunk_size if segment_end is None else min(chunk_size, segment_end - position))
+            if not chunk:
+                return
+            position += len(chunk)
+            yield chunk, timestamp
+
+
+def map_file(filename):
+    """
+    The mapping outlives the file object and is released once the last frame payload viewing it is gone.
+    """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''  # empty files can't be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def open_dump(filename, source, recover=False, use_mmap=False, timestamps=None):
+    """
+    Returns (parser, frames) for a dump file: the frames are read from a memory mapping with zero copy payloads or
+    streamed chunk by chunk through an incremental parser, the parser gaps are complete once the frames are exhausted.
+    """
+    if use_mmap:
+        parser = AMQPStreamParser(map_file(filename), source, zero_copy=True, recover=recover, timestamps=timestamps)
+        return parser, iter(parser)
+    parser = AMQPIncrementalParser(source, recover=recover)
+    return parser, feed_file(parser, filename, timestamps=timestamps)
+
+
+def iter_file_frames(filename, source, chunk_size=DEFAULT_CHUNK_SIZE):
+    return feed_file(AMQPIncrementalParser(source), filename, chunk_size)
@@ -4,6 +4,12 @@ PROTOCOL = [
     "close-connection"
 ]
 
+CONNECTION = [  # the channel 0 part of the protocol when the channels are analyzed separately
+    "open-connection",
+    "*connection-flow",
+    "close-connection"
+]
+
 OPEN_CONNECTION = [
     "C:protocol-header",
     "S:connection.start",
@@ -21,7 +27,15 @@ CHALLENGE = [
 ]
 
 USE_CONNECTION = [
-    "*channel"
+    "*connection-activity"
+]
+
+CONNECTION_ACTIVITY = [
+    "channel | connection-flow"
+]
+
+CONNECTION_FLOW = [  # RabbitMQ extension, the server stops and resumes accepting publishes
+    "S:connection.blocked | S:connection.unblocked"
 ]
 
 CHANNEL = [
@@ -57,7 +71,7 @@ FUNCTIONAL_CLASS = [
 
 
 EXCHANGE = [
-    "exchange-declare | exchange-delete"
+    "exchange-declare | exchange-delete | exchange-bind | exchange-unbind"
 ]
 
 EXCHANGE_DECLARE = [
@@ -70,15 +84,25 @@ EXCHANGE_DELETE = [
     "S:exchange.delete-ok"
 ]
 
+EXCHANGE_BIND = [
+    "C:exchange.bind",
+    "S:exchange.bind-ok"
+]
+
+EXCHANGE_UNBIND = [
+    "C:exchange.unbind",
+    "S:exchange.unbind-ok"
+]
+
 
 QUEUE = [
-    "queue-declare | queue-bind | queue-unbind | queue_purge | queue_delete"
+    "queue-declare | queue-bind | queue-unbind | queue-purge | queue-delete"
 ]
 
 
 QUEUE_DECLARE = [
     "C:queue.declare",
-    "S:queue.declare.ok"
+    "S:queue.declare-ok"
 ]
 
 QUEUE_BIND = [
@@ -103,7 +127,7 @@ QUEUE_DELETE = [
 
 
 BASIC = [
-    "qos | consume | cancel | publish | return-failed | deliver | get | ack | recover-async | recover"
+    "qos | consume | cancel | publish | return-failed | deliver | get | ack | nack | reject | recover-async | recover"
 ]
 
 QOS = [
@@ -126,19 +150,21 @@ PUBLISH = [
     "?S:basic.ack",
     "C:HEADER",
     "?S:basic.ack",
-    "C:BODY",
+    "*C:BODY",  # no body frame for empty bodies, several for the large ones
     "?S:basic.ack"
 ]
 
 RETURN_FAILED = [
     "S:basic.return",
-    "S:BODY"
+    "?S:HEADER",
+    "*S:BODY"
 ]
 
 
 DELIVER = [
     "S:basic.deliver",
-    "S:BODY"
+    "?S:HEADER",
+    "*S:BODY"
 ]
 
 
@@ -149,7 +175,8 @@ GET = [
 GET_CONTENT = [
     "C:basic.get",
     "S:basic.get-ok",
-    "S:BODY"
+    "?S:HEADER",
+    "*S:BODY"
 ]
 
 GET_EMPTY = [
@@ -161,6 +188,10 @@ ACK = [
     "C:basic.ack | S:basic.ack"
 ]
 
+NACK = [
+    "C:basic.nack | S:basic.nack"
+]
+
 REJECT = [
     "C:basic.reject"
 ]
@@ -210,7 +241,7 @@ CHANNEL_CLOSE_CLIENT_INIT = [
 ]
 
 CHANNEL_CLOSE_SERVER_INIT = [
-    "S:channel.close"
+    "S:channel.close",
     "C:channel.close-ok"
 ]
 
@@ -227,3 +258,8 @@ SERVER_CLOSE = [
     "S:connection.close",
     "C:connection.close-ok"
 ]
+
+
+RESYNC = [  # the units the analysis resumes with after a protocol mismatch, in any order
+    "open-connection | challenge | open-channel | connection-flow | use-channel | close-channel | close-connection"
+]
@@ -1,4 +1,7 @@
+import io
 import json
+import re
+import struct
 import xml.etree.ElementTree as ET
 
 from collections import OrderedDict
@@ -35,11 +38,186 @@ def get_class_data(method_class):
     return int(method_class.attrib['index']), method_class.attrib['name'], method_dict
 
 
+# fixed width domain types and their struct format, bits are packed into octets
+FIXED_WIDTH_FORMATS = {
+    'octet': 'B',
+    'short': 'H',
+    'long': 'L',
+    'longlong': 'Q',
+}
+
+VARIABLE_WIDTH_DECODERS = {
+    'shortstr': 'decode_short_string',
+    'longstr': 'decode_long_string',
+    'timestamp': 'decode_timestamp',
+    'table': 'decode_field_table',
+}
+
+
+# decoders for the content properties, which are never packed together.
+# Header tables can be large and are usually only probed for a few keys so they are decoded lazily.
+PROPERTY_DECODERS = {
+    'octet': 'decode_octet',
+    'short': 'decode_short_uint',
+    'long': 'decode_long_uint',
+    'longlong': 'decode_long_long_uint',
+    'shortstr': 'decode_short_string',
+    'longstr': 'decode_long_string',
+    'timestamp': 'decode_timestamp',
+    'table': 'decode_lazy_field_table',
+}
+
+
+def get_python_name(name):
+    return name.replace("-", "_")
+
+
+def get_domain_types(root):
+    return {domain.attrib['name']: domain.attrib['type'] for domain in root.findall("domain")}
+
+
+def get_field_specs(element, domain_types):
+    """List of (name, type, reserved) for the fields of a method or the properties of a class"""
+    field_specs = []
+    for field in element.findall("field"):
+        field_type = field.attrib['type'] if 'type' in field.attrib else domain_types[field.attrib['domain']]
+        field_specs.append((get_python_name(field.attrib['name']), field_type, field.attrib.get('reserved') == '1'))
+    return field_specs
+
+
+def group_fields(field_specs):
+    """
+    Merge consecutive fixed width fields into runs decoded by a single struct, consecutive bits are packed
+    into octets (least significant bit first) that become part of the run.
+    Yields ('struct', [(name, format, bits)]) and ('variable', (name, type, reserved)) groups,
+    where bits is a list of (name, reserved) for bit octets and None for other fixed width fields.
+    """
+    run = []
+    for field_spec in field_specs:
+        name, field_type, reserved = field_spec
+        if field_type == 'bit':
+            if run and run[-1][2] is not None and len(run[-1][2]) < 8:
+                run[-1][2].append((name, reserved))
+            else:
+                run.append((None, 'B', [(name, reserved)]))
+        elif field_type in FIXED_WIDTH_FORMATS:
+            run.append((None if reserved else name, FIXED_WIDTH_FORMATS[field_type], None))
+        else:
+            if run:
+                yield 'struct', run
+                run = []
+            yield 'variable', field_spec
+    if run:
+        yield 'struct', run
+
+
+def write_fields_decoder(function_name, field_specs, out):
+    struct_declarations = []
+    body = []
+    for group_type, group in group_fields(field_specs):
+        if group_type == 'variable':
+            name, field_type, reserved = group
+            if reserved:
+                body.append("    _, offset = %s(buffer, offset)" % VARIABLE_WIDTH_DECODERS[field_type])
+            else:
+                body.append("    result['%s'], offset = %s(buffer, offset)" %
+                            (name, VARIABLE_WIDTH_DECODERS[field_type]))
+            continue
+        struct_format = ""
+        targets = []
+        bit_assignments = []
+        for name, field_format, bits in group:
+            if bits is not None and not all(reserved for _, reserved in bits):
+                bits_name = "bits_%d" % len(bit_assignments)
+                targets.append(bits_name)
+                bit_assignments.append((bits_name, bits))
+                struct_format += field_format
+            elif name and bits is None:
+                targets.append("result['%s']" % name)
+                struct_format += field_format
+            else:  # reserved fields are skipped
+                struct_format += "%dx" % struct.calcsize("!" + field_format)
+        if targets:
+            struct_name = "_%s_%d" % (function_name, len(struct_declarations))
+            struct_declarations.append("%s = struct.Struct(\"!%s\")" % (struct_name, struct_format))
+            body.append("    %s%s = %s.unpack_from(buffer, offset)" % (", ".join(targets),
+                                                                         "," if len(targets) == 1 else "",
+                                                                         struct_name))
+        for bits_name, bits in bit_assignments:
+            for bit_index, (bit_name, reserved) in enumerate(bits):
+                if not reserved:
+                    body.append("    result['%s'] = bool(%s & %d)" % (bit_name, bits_name, 1 << bit_index))
+        body.append("    offset += %d" % struct.calcsize("!" + struct_format))
+    for struct_declaration in struct_declarations:
+        out.write(struct_declaration + "\n")
+    if struct_declarations:
+        out.write("\n\n")
+    out.write("def %s(buffer, offset):\n" % function_name)
+    out.write("    result = OrderedDict()\n")
+    for line in body:
+        out.write(line + "\n")
+    out.write("    return result, offset\n\n\n")
+
+
+def write_method_decoders(root, out):
+    domain_types = get_domain_types(root)
+    body = io.StringIO()
+    _write_method_decoder_body(root, domain_types, body)
+    body = body.getvalue()
+    out.write('"""Generated by amqp_spec_parser.py from amqp0-9-1.xml, do not edit."""\n')
+    out.write("import struct\n\n")
+    out.write("from collections import OrderedDict\n\n")
+    out.write("from amqp_data_types import (\n")
+    for decoder in sorted(set(VARIABLE_WIDTH_DECODERS.values()) | set(PROPERTY_DECODERS.values())):
+        if re.search(r'\b%s\b' % decoder, body):  # only the decoders the generated code references
+            out.write("    %s,\n" % decoder)
+    out.write(")\n\n\n")
+    out.write(body)
+
+
+def _write_method_decoder_body(root, domain_types, out):
+    decoders = []
+    content_methods = []
+    for method_class in root.findall("class"):
+        class_name = get_python_name(method_class.attrib['name'])
+        for method in method_class.findall("method"):
+            function_name = "decode_%s_%s" % (class_name, get_python_name(method.attrib['name']))
+            write_fields_decoder(function_name, get_field_specs(method, domain_types), out)
+            decoders.append((int(method_class.attrib['index']), int(method.attrib['index']), function_name))
+            if method.attrib.get('content') == "1":
+                content_methods.append(decoders[-1][:2])
+    out.write("METHOD_DECODERS = {\n")
+    for class_id, method_id, function_name in decoders:
+        out.write("    (%d, %d): %s,\n" % (class_id, method_id, function_name))
+    out.write("}\n\n")
+    # methods followed by a content header and body frames
+    out.write("CONTENT_METHODS = frozenset([\n")
+    for class_id, method_id in content_methods:
+        out.write("    (%d, %d),\n" % (class_id, method_id))
+    out.write("])\n\n")
+    write_class_properties(root, domain_types, out)
+
+
+def write_class_properties(root, domain_types, out):
+    """The content properties of each class in property flag order, as (name, decoder) pairs"""
+    out.write("CLASS_PROPERTIES = {\n")
+    for method_class in root.findall("class"):
+        field_specs = get_field_specs(method_class, domain_types)
+        if not field_specs:
+            continue
+        out.write("    %s: [\n" % method_class.attrib['index'])
+        for name, field_type, reserved in field_specs:
+            out.write("        ('%s', %s),\n" % (name, PROPERTY_DECODERS[field_type]))
+        out.write("    ],\n")
+    out.write("}\n")
+
+
 def extract_data(root, out):
     constants = root.findall("constant")
     constant_declarations = []
     for constant in constants:
         constant_declarations.append(get_constant(constant))
+    constant_declarations.append("AMQP_PORT = %s\n" % root.attrib['port'])
     constant_declarations.sort()
     for constant_declaration in constant_declarations:
         out.write(constant_declaration)
@@ -53,6 +231,8 @@ def main():
     root = tree.getroot()
     with open('amqp_constants.py', 'w') as f:
         extract_data(root, f)
-        
+    with open('amqp_method_decoders.py', 'w') as f:
+        write_method_decoders(root, f)
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
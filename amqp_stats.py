@@ -0,0 +1,133 @@
+"""
+Throughput statistics.
+A single pass over the parsed frames counts frames and wire bytes per (direction, channel, method) and, for
+frames with capture timestamps, the publish, deliver and acknowledgement rates per time window, direction and
+channel. Only the counters
+are kept, the frames are dropped as soon as they are counted, so captures larger than the memory can be summarized.
+"""
+import math
+
+from collections import OrderedDict
+
+from amqp_channels import get_channel
+from amqp_frame_store import PROTOCOL_HEADER_TYPE
+from amqp_protocol_parser import CLIENT, SERVER, FRAME_HEADER_SIZE, PROTOCOL_HEADER_SIZE
+
+DEFAULT_WINDOW = 1.0  # seconds
+FRAME_OVERHEAD = FRAME_HEADER_SIZE + 1  # header and frame end octet
+
+# rate name -> the (direction, method) of the frames it counts
+RATES = OrderedDict((
+    ('publish', ((CLIENT, "basic.publish"),)),
+    ('deliver', ((SERVER, "basic.deliver"), (SERVER, "basic.get-ok"))),
+    ('ack', ((CLIENT, "basic.ack"),)),  # consumer acknowledgements
+    ('confirm', ((SERVER, "basic.ack"),)),  # publisher confirms
+    ('reject', ((CLIENT, "basic.nack"), (CLIENT, "basic.reject"), (SERVER, "basic.nack"))),
+))
+_rate_indexes = dict((key, index) for index, keys in enumerate(RATES.values()) for key in keys)
+
+
+class StatsCollector(object):
+    """Counts the frames it is given, window is the length of the rate windows in seconds"""
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.totals = {}  # (source, channel, method) -> [frames, bytes]
+        self.windows = {}  # (window index, source, channel) -> counts in RATES order
+        self.first_timestamp = self.last_timestamp = None
+
+    def add_all(self, messages):
+        for message in messages:
+            self.add(message)
+        return self
+
+    def add(self, message):
+        method = message.method or message.frame_type_string  # heartbeats have no method
+        key = message.source, get_channel(message), method
+        totals = self.totals.get(key)
+        if totals is None:
+            totals = self.totals[key] = [0, 0]
+        totals[0] += 1
+        totals[1] += PROTOCOL_HEADER_SIZE if message.type == PROTOCOL_HEADER_TYPE else \
+            message.payload_len + FRAME_OVERHEAD
+        timestamp = message.timestamp
+        if timestamp is None:
+            return
+        if self.first_timestamp is None or timestamp < self.first_timestamp:
+            self.first_timestamp = timestamp
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+        rate_index = _rate_indexes.get((message.source, method))
+        if rate_index is not None:
+            window_key = int(math.floor(timestamp / self.window)), message.source, key[1]
+            counts = self.windows.get(window_key)
+            if counts is None:
+                counts = self.windows[window_key] = [0] * len(RATES)
+            counts[rate_index] += 1
+
+    def get_totals(self, *fields):
+        """[frames, bytes] summed by the given fields of (source, channel, method), sorted"""
+        indexes = [("source", "channel", "method").index(field) for field in fields]
+        result = {}
+        for key, (frames, size) in self.totals.items():
+            group = tuple(key[index] for index in indexes)
+            totals = result.setdefault(group, [0, 0])
+            totals[0] += frames
+            totals[1] += size
+        return sorted(result.items())
+
+    def get_rates(self, *fields):
+        """
+        (window start, group, {rate name: per second}) of the windows with any counted frame, summed by the given
+        fields of (source, channel), in time and group order
+        """
+        indexes = [("source", "channel").index(field) + 1 for field in fields]
+        result = {}
+        for key, counts in self.windows.items():
+            group_counts = result.setdefault((key[0],) + tuple(key[index] for index in indexes), [0] * len(RATES))
+            for rate_index, count in enumerate(counts):
+                group_counts[rate_index] += count
+        for key, counts in sorted(result.items()):
+            yield key[0] * self.window, key[1:], OrderedDict(
+                (name, count / self.window) for name, count in zip(RATES, counts))
+
+
+def format_stats_table(collector):
+    """The lines of the summary: totals per direction, channel and method, then the rates per window"""
+    yield "%-6s %12s %16s" % ("source", "frames", "bytes")
+    for (source,), (frames, size) in collector.get_totals("source"):
+        yield "%-6s %12d %16d" % (source, frames, size)
+    yield ""
+    yield "%-6s %7s %12s %16s" % ("source", "channel", "frames", "bytes")
+    for (source, channel), (frames, size) in collector.get_totals("source", "channel"):
+        yield "%-6s %7d %12d %16d" % (source, channel, frames, size)
+    yield ""
+    yield "%-6s %-30s %12s %16s" % ("source", "method", "frames", "bytes")
+    for (source, method), (frames, size) in collector.get_totals("source", "method"):
+        yield "%-6s %-30s %12d %16d" % (source, method, frames, size)
+    if collector.windows:
+        yield ""
+        yield "%-18s %s" % ("window start", " ".join("%10s" % ("%s/s" % name) for name in RATES))
+        for start, _, rates in collector.get_rates():
+            yield "%-18.3f %s" % (start, " ".join("%10.1f" % rate for rate in rates.values()))
+        yield ""
+        yield "%-18s %-6s %7s %s" % ("window start", "source", "channel",
+                                     " ".join("%10s" % ("%s/s" % name) for name in RATES))
+        for start, (source, channel), rates in collector.get_rates("source", "channel"):
+            yield "%-18.3f %-6s %7d %s" % (start, source, channel, " ".join("%10.1f" % rate for rate in rates.values()))
+
+
+def get_stats_record(collector):
+    """The statistics as one JSON serializable object"""
+    return OrderedDict((
+        ('window', collector.window),
+        ('first_timestamp', collector.first_timestamp),
+        ('last_timestamp', collector.last_timestamp),
+        ('totals', [OrderedDict((('source', source), ('channel', channel), ('method', method), ('frames', frames),
+                                 ('bytes', size)))
+                    for (source, channel, method), (frames, size) in collector.get_totals("source", "channel",
+                                                                                          "method")]),
+        ('rates', [OrderedDict([('start', start)] + list(rates.items())) for start, _, rates in collector.get_rates()]),
+        ('channel_rates', [OrderedDict([('start', start), ('source', source), ('channel', channel)] +
+                                       list(rates.items()))
+                           for start, (source, channel), rates in collector.get_rates("source", "channel")]),
+    ))
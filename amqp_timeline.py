@@ -0,0 +1,54 @@
+"""
+Ordering by capture time.
+When the dumps come with the capture timestamps of their segments every frame knows when it was seen on the wire,
+so the exchange order is a k-way merge of the streams by timestamp and the grammar only validates it.
+"""
+import heapq
+
+from amqp_protocol import ProtocolDetective
+from amqp_protocol_grammar import PROTOCOL_GRAMMAR
+
+
+def load_timestamp_index(filename):
+    """
+    Read a timestamp index: one "<stream offset> <capture time>" line per captured segment, sorted by offset.
+    Empty lines and lines starting with # are ignored. Returns a list of (offset, timestamp).
+    """
+    index = []
+    with open(filename) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                offset, timestamp = line.split()
+                index.append((int(offset), float(timestamp)))
+            except ValueError:
+                raise ValueError("%s:%d: expected '<offset> <timestamp>', got %r" % (filename, line_number, line))
+            if len(index) > 1 and index[-2][0] > index[-1][0]:
+                raise ValueError("%s:%d: offsets are not sorted" % (filename, line_number))
+    return index
+
+
+def _get_timestamp(message):
+    if message.timestamp is None:
+        raise ValueError("Message without capture timestamp: %s" % message)
+    return message.timestamp
+
+
+def merge_by_timestamp(*streams):
+    """
+    Lazily merge message streams that are each in capture order into one stream ordered by timestamp.
+    A heap holds the head of every stream so merging n messages from k streams costs O(n log k).
+    Messages with equal timestamps keep the order of the streams in the arguments.
+    """
+    return heapq.merge(*streams, key=_get_timestamp)
+
+
+def analyze_by_timestamp(client_messages, server_messages, grammar=PROTOCOL_GRAMMAR, resync=False):
+    """
+    Yields the messages in capture order, checked against the grammar. Messages from the point where the captured
+    order breaks the protocol on are marked out of order, with resync only the ones the detective has to skip.
+    """
+    merged_messages = merge_by_timestamp(client_messages, server_messages)
+    return ProtocolDetective.validator(merged_messages, grammar, resync).iter_messages()
@@ -2,6 +2,12 @@
 The script receives the dump of bytes exchanged on 2 socket connections between 2 AMQP participants and prints a nice
  representation of the messages and the order in which they could have been exchanged.
 
+ With --batch a whole tcpflow output directory is analyzed, one output file per connection in the output directory
+ plus a summary of all of them.
+
+ With --pcap the connections are read straight from a pcap/pcapng capture instead, e.g.
+ `sudo tcpdump -i any -w capture.pcap port 5672`, and every AMQP connection in it is printed in capture order.
+
  To get the dump you could:
  1. create a folder and cd into it
  2. execute `sudo tcpflow -i any -a  port 5672`
@@ -10,43 +16,276 @@ The script receives the dump of bytes exchanged on 2 socket connections between
     where <PID> is the pid of the client process.
 """
 
+import argparse
+import json
 import sys
 
-from amqp_protocol_parser import AMQPStreamParser, CLIENT, SERVER
+from amqp_batch import analyze_tcpflow_directory, write_summary
+from amqp_channels import analyze_by_channel
+from amqp_constants import AMQP_PORT
+from amqp_content import ContentAssembler, DEFAULT_SPILL_THRESHOLD
+from amqp_frame_cache import FrameCache, DEFAULT_MAX_SIZE, DEFAULT_MAX_AGE
+from amqp_frame_store import AMQPFrameStore
+from amqp_latency import LatencyAnalyzer, format_latency_report
+from amqp_output import get_writer, open_output, OUTPUT_FORMATS
+from amqp_pcap import iter_capture_connections
+from amqp_protocol_parser import open_dump, map_file, CLIENT, SERVER
 from amqp_protocol import ProtocolDetective
+from amqp_stats import StatsCollector, format_stats_table, get_stats_record, DEFAULT_WINDOW
+from amqp_timeline import analyze_by_timestamp, load_timestamp_index, merge_by_timestamp
 
 
 def main():
     """
-    Usage: client_message_dump_file server_message_dump_file [output_file]
+    Usage: client_message_dump_file server_message_dump_file [output_file] [--mmap] [--recover] [--compact]
+           [--per-channel [--workers N] | --online | --client-timestamps FILE --server-timestamps FILE]
+           [--content [--spill-threshold BYTES]] [--format text|jsonl|csv]
+           [--cache-dir DIRECTORY [--cache-max-size BYTES] [--cache-max-age SECONDS]]
+           --pcap CAPTURE [output_file] [--port PORT ...] [--recover] [--content [--spill-threshold BYTES]]
+           [--format text|jsonl|csv]
+           --pcap CAPTURE [output_file] --latency [--port PORT ...] [--recover]
+           --pcap CAPTURE [output_file] --stats [--stats-window SECONDS] [--format text|jsonl] [--port PORT ...]
+           [--recover]
+           client_message_dump_file server_message_dump_file [output_file] --stats [--stats-window SECONDS]
+           [--format text|jsonl] [--client-timestamps FILE --server-timestamps FILE] [--mmap] [--recover]
+           client_message_dump_file server_message_dump_file [output_file] --client-timestamps FILE
+           --server-timestamps FILE --latency [--mmap] [--recover]
+           --batch TCPFLOW_DIRECTORY output_directory [--port PORT ...] [--mmap] [--recover] [--workers N]
+           [--format text|jsonl|csv]
     """
-    client_message_dump_file = sys.argv[1]
-    server_message_dump_file = sys.argv[2]
+    arguments = _parse_arguments(sys.argv[1:])
+
+    if arguments.batch:
+        summaries = analyze_tcpflow_directory(arguments.batch, arguments.output_directory,
+                                              arguments.port or [AMQP_PORT], arguments.recover, arguments.workers,
+                                              arguments.format, resync=True, use_mmap=arguments.mmap)
+        write_summary(summaries, sys.stdout)
+        return
+
+    with get_writer(open_output(arguments.output_file), arguments.format, arguments.flush_every) as writer:
+        if arguments.stats:
+            _write_stats(arguments, writer)
+            return
+        if arguments.pcap:
+            _write_capture_connections(arguments, writer)
+            return
+        if arguments.client_timestamps:
+            client_messages = _iter_messages(arguments.client_message_dump_file, CLIENT, arguments,
+                                             load_timestamp_index(arguments.client_timestamps))
+            server_messages = _iter_messages(arguments.server_message_dump_file, SERVER, arguments,
+                                             load_timestamp_index(arguments.server_timestamps))
+        elif arguments.online:
+            client_messages = _iter_messages(arguments.client_message_dump_file, CLIENT, arguments)
+            server_messages = _iter_messages(arguments.server_message_dump_file, SERVER, arguments)
+        else:
+            client_messages = _get_messages(arguments.client_message_dump_file, CLIENT, arguments)
+            server_messages = _get_messages(arguments.server_message_dump_file, SERVER, arguments)
+
+        if arguments.latency:
+            _write_latency_report(LatencyAnalyzer().analyze(merge_by_timestamp(client_messages, server_messages)),
+                                  writer)
+            return
+        if arguments.client_timestamps:
+            messages = analyze_by_timestamp(client_messages, server_messages, resync=True)
+        elif arguments.per_channel:
+            messages = analyze_by_channel(client_messages, server_messages, arguments.workers, resync=True)
+        elif arguments.online or arguments.compact:
+            messages = ProtocolDetective(client_messages, server_messages, recover=True).iter_messages()
+        else:
+            messages = ProtocolDetective(client_messages, server_messages, recover=True).analyze()
+
+        writer.write_all(_assemble_content(messages, arguments))
+
+
+def _parse_arguments(args):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('client_message_dump_file', nargs='?')
+    parser.add_argument('server_message_dump_file', nargs='?')
+    parser.add_argument('output_file', nargs='?')
+    parser.add_argument('--mmap', action='store_true',
+                        help='memory map the dump files instead of reading them, frame payloads stay views into the '
+                             'mapping and are paged in by the OS on demand')
+    parser.add_argument('--recover', action='store_true',
+                        help='skip damaged parts of the dumps up to the next frame boundary instead of stopping')
+    parser.add_argument('--compact', action='store_true',
+                        help='keep the frames in columnar storage and build frame objects on demand, '
+                             'best combined with --mmap (damaged dumps can not be recovered in this mode)')
+    parser.add_argument('--per-channel', action='store_true',
+                        help='analyze every channel of the connection separately and merge the results')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes analyzing the channels with --per-channel, '
+                             'or the connections with --batch (default: one per core)')
+    parser.add_argument('--online', action='store_true',
+                        help='stream the frames through the analysis and print every message as soon as its place is '
+                             'known, memory stays bounded by the lookahead instead of the dump size')
+    parser.add_argument('--client-timestamps', metavar='FILE',
+                        help='timestamp index of the client dump, one "<stream offset> <capture time>" line per '
+                             'captured segment. With both indexes the messages are ordered by capture time and only '
+                             'validated against the protocol')
+    parser.add_argument('--server-timestamps', metavar='FILE', help='timestamp index of the server dump')
+    parser.add_argument('--pcap', metavar='CAPTURE',
+                        help='read every AMQP connection from a pcap/pcapng capture, the only positional argument is '
+                             'then the output file')
+    parser.add_argument('--port', type=int, action='append',
+                        help='AMQP server port of the connections in the capture, can be repeated (default: %d)'
+                             % AMQP_PORT)
+    parser.add_argument('--content', action='store_true',
+                        help='print every published/delivered message with its content header and body as one line '
+                             'instead of the separate frames')
+    parser.add_argument('--spill-threshold', type=int, default=DEFAULT_SPILL_THRESHOLD, metavar='BYTES',
+                        help='with --content, message bodies larger than this are kept in temporary files '
+                             '(default: %(default)s)')
+    parser.add_argument('--format', choices=list(OUTPUT_FORMATS), default='text',
+                        help='output the messages as text, JSON Lines or CSV records (default: %(default)s)')
+    parser.add_argument('--flush-every', type=int, default=None, metavar='N',
+                        help='flush the output after every N messages, 0 flushes only at the end of every connection '
+                             '(default: after every message on a terminal, 0 otherwise)')
+    parser.add_argument('--latency', action='store_true',
+                        help='report the request/reply latencies per method pair and channel instead of the messages, '
+                             'needs the capture times of --pcap or of timestamp indexes')
+    parser.add_argument('--stats', action='store_true',
+                        help='print frame and byte counts per direction, channel and method and the publish/deliver/'
+                             'ack rates per time window instead of the messages, as a table or as JSON with '
+                             '--format jsonl. The rates need the capture times of --pcap or of timestamp indexes')
+    parser.add_argument('--stats-window', type=float, default=DEFAULT_WINDOW, metavar='SECONDS',
+                        help='length of the --stats rate windows (default: %(default)s)')
+    parser.add_argument('--cache-dir', metavar='DIRECTORY',
+                        help='keep the parsed frame boundaries of the dumps in this directory, the next runs over the '
+                             'same dumps load them instead of parsing again')
+    parser.add_argument('--cache-max-size', type=int, default=DEFAULT_MAX_SIZE, metavar='BYTES',
+                        help='the least recently used cache files are removed above this size (default: %(default)s)')
+    parser.add_argument('--cache-max-age', type=int, default=DEFAULT_MAX_AGE, metavar='SECONDS',
+                        help='cache files unused for longer are removed (default: %(default)s)')
+    parser.add_argument('--batch', metavar='TCPFLOW_DIRECTORY',
+                        help='analyze every connection found in a tcpflow output directory, the only positional '
+                             'argument is then the output directory')
+    arguments = parser.parse_args(args)
+    if arguments.flush_every is not None and arguments.flush_every < 0:
+        parser.error("--flush-every can't be negative")
+    if arguments.cache_dir and (arguments.batch or arguments.pcap or arguments.online or arguments.recover or
+                                arguments.client_timestamps):
+        parser.error("--cache-dir can't be combined with --batch, --pcap, --online, --recover or timestamp indexes")
+    if arguments.stats_window <= 0:
+        parser.error("--stats-window must be positive")
+    if arguments.stats and (arguments.batch or arguments.latency or arguments.content or arguments.online or
+                            arguments.per_channel or arguments.compact or arguments.cache_dir or
+                            arguments.format == 'csv'):
+        parser.error("--stats can't be combined with --batch, --latency, --content, --online, --per-channel, "
+                     "--compact, --cache-dir or --format csv")
+    if arguments.latency and not (arguments.pcap or arguments.client_timestamps):
+        parser.error("--latency needs the capture times of --pcap or of timestamp indexes")
+    if arguments.latency and (arguments.content or arguments.online or arguments.format != 'text'):
+        parser.error("--latency can't be combined with --content, --online or --format")
+    if arguments.batch:
+        if not arguments.client_message_dump_file or arguments.server_message_dump_file:
+            parser.error("--batch takes the output directory as its only positional argument")
+        if arguments.pcap or arguments.online or arguments.per_channel or arguments.compact or \
+                arguments.client_timestamps:
+            parser.error("--batch can't be combined with --pcap, --online, --per-channel, --compact "
+                         "or timestamp indexes")
+        arguments.output_directory, arguments.client_message_dump_file = arguments.client_message_dump_file, None
+        return arguments
+    if arguments.pcap:
+        if arguments.server_message_dump_file:
+            parser.error("--pcap takes only the output file as positional argument")
+        if arguments.online or arguments.per_channel or arguments.compact or arguments.client_timestamps:
+            parser.error("--pcap can't be combined with --online, --per-channel, --compact or timestamp indexes")
+        arguments.output_file, arguments.client_message_dump_file = arguments.client_message_dump_file, None
+        return arguments
+    if not arguments.server_message_dump_file:
+        parser.error("the client and server dump files are required")
+    if arguments.compact and arguments.recover:
+        parser.error("--compact can't be combined with --recover, damaged dumps need the frame parser")
+    if arguments.online and (arguments.per_channel or arguments.compact):
+        parser.error("--online can't be combined with --per-channel or --compact")
+    if bool(arguments.client_timestamps) != bool(arguments.server_timestamps):
+        parser.error("--client-timestamps and --server-timestamps must be given together")
+    if arguments.client_timestamps and (arguments.per_channel or arguments.compact):
+        parser.error("timestamp indexes can't be combined with --per-channel or --compact")
+    return arguments
+
 
-    if len(sys.argv) == 4:
-        output_stream = open(sys.argv[3])
+def _write_capture_connections(arguments, writer):
+    capture_latency = LatencyAnalyzer()
+    for connection in iter_capture_connections(arguments.pcap, arguments.port or [AMQP_PORT], arguments.recover):
+        writer.start_connection(connection)
+        if arguments.latency:
+            latency = LatencyAnalyzer().analyze(connection.messages)
+            _write_latency_report(latency, writer)
+            capture_latency.merge(latency)
+        else:
+            messages = ProtocolDetective.validator(connection.messages, recover=True).iter_messages()
+            writer.write_all(_assemble_content(messages, arguments))
+        writer.end_connection()
+        for source in (CLIENT, SERVER):
+            if connection.get_skipped_bytes(source):
+                print("%s %s: %d bytes missing from the capture" % (connection, source,
+                                                                   connection.get_skipped_bytes(source)),
+                      file=sys.stderr, flush=True)
+            for gap in connection.get_gaps(source):
+                print("%s %s: skipped %d bytes at offset %d: %s" % (connection, source, gap.size, gap.offset,
+                                                                    gap.reason), file=sys.stderr, flush=True)
+        if connection.error:
+            print("%s: %s" % (connection, connection.error), file=sys.stderr, flush=True)
+    if arguments.latency:
+        writer.write_line("All connections")
+        _write_latency_report(capture_latency, writer)
+        writer.end_connection()
+
+
+def _write_stats(arguments, writer):
+    collector = StatsCollector(arguments.stats_window)
+    if arguments.pcap:
+        for connection in iter_capture_connections(arguments.pcap, arguments.port or [AMQP_PORT], arguments.recover):
+            collector.add_all(connection.messages)
     else:
-        output_stream = sys.stdout
+        for source, filename, timestamps in ((CLIENT, arguments.client_message_dump_file, arguments.client_timestamps),
+                                             (SERVER, arguments.server_message_dump_file, arguments.server_timestamps)):
+            timestamp_index = load_timestamp_index(timestamps) if timestamps else None
+            collector.add_all(_iter_messages(filename, source, arguments, timestamp_index))
+    if arguments.format == 'jsonl':
+        writer.write_line(json.dumps(get_stats_record(collector)))
+    else:
+        for line in format_stats_table(collector):
+            writer.write_line(line)
+
 
-    try:
-        client_stream_parser = AMQPStreamParser(_get_protocol_bytes(client_message_dump_file), CLIENT)
-        server_stream_parser = AMQPStreamParser(_get_protocol_bytes(server_message_dump_file), SERVER)
+def _write_latency_report(analyzer, writer):
+    for line in format_latency_report(analyzer):
+        writer.write_line(line)
 
-        client_messages = [message for message in client_stream_parser]
-        server_messages = [message for message in server_stream_parser]
 
-        messages = ProtocolDetective(client_messages, server_messages).analyze()
+def _assemble_content(messages, arguments):
+    if not arguments.content:
+        return messages
+    return ContentAssembler(arguments.spill_threshold).assemble(messages)
 
-        for message in messages:
-            print(message, file=output_stream, flush=True)
-    finally:
-        if output_stream != sys.stdout:
-            output_stream.close()
 
+def _get_messages(filename, source, arguments):
+    if arguments.cache_dir:
+        frame_cache = FrameCache(arguments.cache_dir, arguments.cache_max_size, arguments.cache_max_age)
+        store = frame_cache.get_store(_read_protocol_bytes(filename, arguments), source)
+        return store if arguments.compact else list(store)
+    if arguments.compact:
+        return AMQPFrameStore.from_buffer(_read_protocol_bytes(filename, arguments), source)
+    return [message for message in _iter_messages(filename, source, arguments)]
 
-def _get_protocol_bytes(filename):
-    with open(filename, 'r+b') as f:
+
+def _iter_messages(filename, source, arguments, timestamps=None):
+    parser, messages = open_dump(filename, source, arguments.recover, arguments.mmap, timestamps)
+    for message in messages:
+        yield message
+    for gap in parser.gaps:
+        print("%s: skipped %d bytes at offset %d: %s" % (source, gap.size, gap.offset, gap.reason),
+              file=sys.stderr, flush=True)
+
+
+def _read_protocol_bytes(filename, arguments):
+    if arguments.mmap:
+        return map_file(filename)
+    with open(filename, 'rb') as f:
         return f.read()
 
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,52 @@
+from amqp_batch import *
+from test.test_pcap import CLIENT_DUMP, SERVER_DUMP
+
+
+def _make_tcpflow_directory(tmpdir):
+    flows = tmpdir.mkdir("flows")
+    for client_port in (54321, 54322):
+        flows.join("192.168.001.010.%05d-192.168.001.020.05672" % client_port).write_binary(CLIENT_DUMP)
+        flows.join("192.168.001.020.05672-192.168.001.010.%05d" % client_port).write_binary(SERVER_DUMP)
+    flows.join("192.168.001.010.54323-192.168.001.020.05672c1").write_binary(CLIENT_DUMP[:-1])  # unpaired, truncated
+    # unknown method class, only found while the frame is matched
+    flows.join("192.168.001.010.54325-192.168.001.020.05672").write_binary(
+        CLIENT_DUMP[:8] + b'\x01\x00\x00\x00\x00\x00\x04\x03\xe7\x00\x01\xce')
+    flows.join("192.168.001.020.05672-192.168.001.010.54325").write_binary(SERVER_DUMP)
+    flows.join("192.168.001.010.54324-192.168.001.020.00080").write_binary(b'GET / HTTP/1.1\r\n')
+    flows.join("report.xml").write("<dfxml/>")
+    return flows
+
+
+def test_parse_tcpflow_name():
+    assert ("192.168.001.010", 54321, "192.168.001.020", 5672, "") == \
+        parse_tcpflow_name("192.168.001.010.54321-192.168.001.020.05672")
+    assert ("192.168.001.010", 54321, "192.168.001.020", 5672, "c2") == \
+        parse_tcpflow_name("/tmp/192.168.001.010.54321-192.168.001.020.05672c2")
+    assert parse_tcpflow_name("report.xml") is None
+
+
+def test_find_tcpflow_connections(tmpdir):
+    flows = _make_tcpflow_directory(tmpdir)
+    connections = find_tcpflow_connections(str(flows))
+    assert ["192.168.001.010.54321-192.168.001.020.05672",
+            "192.168.001.010.54322-192.168.001.020.05672",
+            "192.168.001.010.54323-192.168.001.020.05672c1",
+            "192.168.001.010.54325-192.168.001.020.05672"] == [connection.name for connection in connections]
+    assert connections[0].server_file.endswith("192.168.001.020.05672-192.168.001.010.54321")
+    assert connections[2].server_file is None
+
+
+def test_analyze_tcpflow_directory(tmpdir):
+    flows = _make_tcpflow_directory(tmpdir)
+    output_directory = tmpdir.join("output")
+    summaries = analyze_tcpflow_directory(str(flows), str(output_directory), workers=2)
+
+    # the failed connections keep the frames counted up to their error and don't stop the others
+    assert [(5, 4, 0, None), (5, 4, 0, None), (4, 0, 3, "Truncated frame"), (2, 1, 0, "KeyError: 999")] == \
+        [(summary.client_frames, summary.server_frames, summary.out_of_order, summary.error)
+         for summary in summaries]
+    output = output_directory.join("192.168.001.010.54321-192.168.001.020.05672.txt").read().splitlines()
+    assert 9 == len(output)
+    assert output[1].startswith("SERVER: |METHOD|0|4|connection.start")
+    summary = output_directory.join(SUMMARY_FILE).read()
+    assert "4 connections, 25 frames, 3 out of order, 2 failed" == summary.splitlines()[-1]
@@ -0,0 +1,88 @@
+import struct
+
+import amqp_constants as const
+
+from amqp_channels import *
+from amqp_frame_store import AMQPFrameStore
+from amqp_messages import AMQPFrame, AMQPProtocolHeader
+
+
+def _frame(source, channel, method_type):
+    for class_id in const.AMQP_METHODS:
+        for method_id in const.AMQP_METHODS[class_id]:
+            if const.AMQP_METHODS[class_id][method_id] == method_type:
+                return AMQPFrame(source, const.FRAME_METHOD, channel, struct.pack("!HH", class_id, method_id))
+    raise Exception("No such method: %s" % method_type)
+
+
+def _make_connection(channels):
+    client_messages = [AMQPProtocolHeader(0, 0, 9, 1),
+                       _frame(CLIENT, 0, "connection.start-ok"),
+                       _frame(CLIENT, 0, "connection.tune-ok"),
+                       _frame(CLIENT, 0, "connection.open")]
+    server_messages = [_frame(SERVER, 0, "connection.start"),
+                       _frame(SERVER, 0, "connection.tune"),
+                       _frame(SERVER, 0, "connection.open-ok")]
+    client_messages += [_frame(CLIENT, channel, "channel.open") for channel in channels]
+    server_messages += [_frame(SERVER, channel, "channel.open-ok") for channel in channels]
+    client_messages += [_frame(CLIENT, channel, "basic.qos") for channel in channels]
+    server_messages += [_frame(SERVER, channel, "basic.qos-ok") for channel in reversed(channels)]
+    client_messages += [_frame(CLIENT, channel, "channel.close") for channel in channels]
+    server_messages += [_frame(SERVER, channel, "channel.close-ok") for channel in channels]
+    client_messages.append(_frame(CLIENT, 0, "connection.close"))
+    server_messages.append(_frame(SERVER, 0, "connection.close-ok"))
+    return client_messages, server_messages
+
+
+def _dump(messages):
+    return b''.join(b'AMQP\x00\x00\x09\x01' if isinstance(message, AMQPProtocolHeader) else
+                    struct.pack("!BHL", message.type, message.channel, len(message.payload)) + message.payload + b'\xce'
+                    for message in messages)
+
+
+def _assert_channel_orders(result, channels):
+    assert not any(message.out_of_order for message in result)
+    for channel in channels:
+        assert ["channel.open", "channel.open-ok", "basic.qos", "basic.qos-ok", "channel.close", "channel.close-ok"] \
+            == [message.method for message in result if get_channel(message) == channel]
+    assert "protocol-header" == result[0].method
+    assert "connection.close-ok" == result[-1].method
+
+
+def test_split_by_channel():
+    client_messages, server_messages = _make_connection([1, 2])
+    channels = split_by_channel(client_messages, server_messages)
+    assert [0, 1, 2] == list(channels)
+    assert [0, 1, 2, 3, 10] == [token.index for token in channels[0][0]]
+    assert ["channel.open", "basic.qos", "channel.close"] == [token.method for token in channels[2][0]]
+
+
+def test_interleaved_channels_are_analyzed_separately():
+    client_messages, server_messages = _make_connection([1, 2, 3])
+    result = analyze_by_channel(client_messages, server_messages)
+    assert len(client_messages) + len(server_messages) == len(result)
+    _assert_channel_orders(result, [1, 2, 3])
+
+
+def test_channels_are_analyzed_in_worker_processes():
+    client_messages, server_messages = _make_connection([1, 2])
+    result = analyze_by_channel(client_messages, server_messages, workers=2)
+    assert len(client_messages) + len(server_messages) == len(result)
+    _assert_channel_orders(result, [1, 2])
+
+
+def test_channels_run_while_the_connection_is_open():
+    client_messages, server_messages = _make_connection([1])
+    methods = [message.method for message in analyze_by_channel(client_messages, server_messages)]
+    assert methods.index("connection.open-ok") < methods.index("channel.open")
+    assert methods.index("channel.close-ok") < methods.index("connection.close")
+
+
+def test_out_of_order_marks_are_kept_for_frame_stores():
+    client_messages, server_messages = _make_connection([1])
+    server_messages.insert(3, _frame(SERVER, 1, "basic.qos-ok"))  # a reply without request
+    for client, server in ((client_messages, server_messages),
+                           (AMQPFrameStore.from_buffer(_dump(client_messages), CLIENT),
+                            AMQPFrameStore.from_buffer(_dump(server_messages), SERVER))):
+        result = analyze_by_channel(client, server, resync=True)
+        assert ["basic.qos-ok"] == [message.method for message in result if message.out_of_order]
@@ -0,0 +1,87 @@
+import struct
+
+import amqp_constants as const
+
+from amqp_content import *
+from amqp_messages import AMQPFrame, AMQPProtocolHeader
+from amqp_protocol_parser import AMQPStreamParser, CLIENT, SERVER
+
+
+def _method(source, channel, class_id, method_id):
+    return AMQPFrame(source, const.FRAME_METHOD, channel, struct.pack("!HH", class_id, method_id))
+
+
+def _header(source, channel, body_size):
+    return AMQPFrame(source, const.FRAME_HEADER, channel, struct.pack("!HHQH", 60, 0, body_size, 0))
+
+
+def _body(source, channel, data):
+    return AMQPFrame(source, const.FRAME_BODY, channel, data)
+
+
+def test_content_frames_are_joined_per_channel():
+    publish, deliver, ack = _method(CLIENT, 1, 60, 40), _method(SERVER, 1, 60, 60), _method(CLIENT, 2, 60, 80)
+    messages = [AMQPProtocolHeader(0, 0, 9, 1),
+                publish, _header(CLIENT, 1, 5),
+                deliver, _header(SERVER, 1, 2),
+                _body(CLIENT, 1, b'hel'), ack, _body(SERVER, 1, b'hi'), _body(CLIENT, 1, b'lo')]
+    result = list(ContentAssembler().assemble(messages))
+
+    assert messages[0] is result[0]
+    published, delivered = result[1:3]
+    assert ack is result[3]  # behind the publish received before it
+    assert publish is published.method_frame
+    assert (SERVER, 1, "basic.deliver", 2, b'hi') == \
+        (delivered.source, delivered.channel, delivered.method, delivered.body_size, delivered.body.read())
+    assert (b'hello', 2, True) == (published.body.read(), published.body_frames, published.complete)
+    assert str(published).startswith("CLIENT: |CONTENT|1|basic.publish(")
+    assert str(published).endswith("body 5/5 bytes in 2 frames|END|")
+
+
+def test_interleaved_channels_keep_the_stream_order():
+    qos, declare = _method(CLIENT, 2, 60, 10), _method(CLIENT, 3, 50, 10)
+    messages = [_method(CLIENT, 1, 60, 40), qos, _method(CLIENT, 2, 60, 40), _header(CLIENT, 2, 1),
+                _body(CLIENT, 2, b'2'), declare, _header(CLIENT, 1, 1), _body(CLIENT, 1, b'1')]
+    assembler = ContentAssembler()
+    ready = [assembler.add(message) for message in messages]
+
+    assert [0, 0, 0, 0, 0, 0, 0, 4] == [len(messages) for messages in ready]
+    first, second = ready[-1][0], ready[-1][2]
+    assert [(1, b'1'), qos, (2, b'2'), declare] == \
+        [(first.channel, first.body.read()), ready[-1][1], (second.channel, second.body.read()), ready[-1][3]]
+    assert [] == assembler.close()
+
+
+def test_empty_and_interrupted_content():
+    close = _method(CLIENT, 1, 20, 40)
+    messages = [_method(CLIENT, 1, 60, 40), _header(CLIENT, 1, 0),
+                _method(CLIENT, 1, 60, 40), _header(CLIENT, 1, 10), _body(CLIENT, 1, b'abc'), close,
+                _method(CLIENT, 1, 60, 40)]
+    result = list(ContentAssembler().assemble(messages))
+
+    assert [True, False, False] == [message.complete for message in result if message is not close]
+    assert close is result[2]
+    assert b'abc' == result[1].body.read()
+    assert str(result[3]).endswith("|no content header|INCOMPLETE|")
+
+
+def test_large_bodies_spill_to_disk():
+    assembler = ContentAssembler(spill_threshold=10)
+    assert [] == assembler.add(_method(CLIENT, 1, 60, 40)) + assembler.add(_header(CLIENT, 1, 16))
+    assert [] == assembler.add(_body(CLIENT, 1, b'01234567'))
+    [message] = assembler.add(_body(CLIENT, 1, b'89abcdef'))
+    assert message.body.spilled
+    assert b'0123456789abcdef' == message.body.read()
+    message.body.close()
+
+
+def test_zero_copy_bodies_stay_in_the_dump():
+    payload = struct.pack("!HH", 60, 60)
+    dump = bytearray(struct.pack("!BHL", const.FRAME_METHOD, 1, len(payload)) + payload + b'\xce' +
+                     struct.pack("!BHLHHQH", const.FRAME_HEADER, 1, 14, 60, 0, 4, 0) + b'\xce' +
+                     struct.pack("!BHL", const.FRAME_BODY, 1, 4) + b'body\xce')
+    parser = AMQPStreamParser(dump, SERVER, zero_copy=True)
+    [message] = list(ContentAssembler(spill_threshold=0).assemble(parser))
+    assert not message.body.spilled
+    dump[-5:-1] = b'BODY'
+    assert b'BODY' == message.body.read()
@@ -165,3 +165,71 @@ def test_extract_field_table():
 
 def extract_void():
     assert ('', b'END') == extract_void(b'END')
+
+
+def test_decode_fixed_width_types_at_offset():
+    buffer = b'END\xff\x80\x00\x00\x00\x00\x00\x00\x01\x00\x01\x00\x00'
+    assert (255, 4) == decode_octet(buffer, 3)
+    assert (-1, 4) == decode_short_short_int(buffer, 3)
+    assert (2 ** 15, 6) == decode_short_uint(buffer, 4)
+    assert (-2 ** 15, 6) == decode_short_int(buffer, 4)
+    assert (-2 ** 31, 8) == decode_long_int(buffer, 4)
+    assert (2 ** 63 + 1, 12) == decode_long_long_uint(buffer, 4)
+    assert (6553.6, 16) == decode_decimal(buffer, 11)
+
+
+def test_decode_strings_at_offset():
+    assert ('test', 8) == decode_short_string(b'END\x04test', 3)
+    assert ('test', 11) == decode_long_string(memoryview(b'END\x00\x00\x00\x04test'), 3)
+
+
+def test_decode_field_array_at_offset():
+    assert ([1, [2, 3, 4], 5], 22) == decode_field_array(
+        b'END'
+        b'\x00\x00\x00\x0F'
+        b'b\x01'
+        b'A\x00\x00\x00\x06b\x02b\x03b\x04'
+        b'b\x05', 3)
+
+
+def test_decode_field_table_matches_extract_field_table():
+    buffer = (b'\x00\x00\x00\x24'
+              b'\x04key1b\x01\x04key2'
+              b'F\x00\x00\x00\x0D\x06key2.1D\x01\x00\x00\x00\x15'
+              b'\x04key3b\x03END')
+    expected_dict, remainder = extract_field_table(buffer)
+    assert (expected_dict, len(buffer) - len(remainder)) == decode_field_table(memoryview(buffer), 0)
+
+
+def test_lazy_field_table():
+    buffer = (b'\x00\x00\x00\x24'
+              b'\x04key1b\x01\x04key2'
+              b'F\x00\x00\x00\x0D\x06key2.1D\x01\x00\x00\x00\x15'
+              b'\x04key3b\x03END')
+    table, offset = decode_lazy_field_table(buffer, 0)
+    assert 41 == offset
+    assert ['key1', 'key2', 'key3'] == list(table)
+    assert 'key2' in table
+    assert 'key4' not in table
+    assert not table._values
+    assert 3 == table['key3']
+    assert ['key3'] == list(table._values)
+    assert isinstance(table['key2'], LazyFieldTable)
+    assert 2.1 == table['key2']['key2.1']
+    assert extract_field_table(buffer)[0] == table
+
+
+def test_skip_field_value():
+    assert 4 == skip_field_value(b'\x00\x00\x00\x01END', 0, ord('i'))
+    assert 5 == skip_field_value(b'\x04test', 0, ord('s'))
+    assert 10 == skip_field_value(b'\x00\x00\x00\x06b\x02b\x03b\x04', 0, ord('A'))
+
+
+def test_unknown_field_value_type():
+    buffer = b'\x00\x00\x00\x06\x04key1x'
+    with pytest.raises(ValueError, match="Unknown field value type: 'x'"):
+        decode_field_table(buffer, 0)
+    with pytest.raises(ValueError, match="Unknown field value type: 'x'"):
+        decode_lazy_field_table(buffer, 0)
+    with pytest.raises(ValueError, match="Unknown field value type: 'x'"):
+        decode_field_array(b'\x00\x00\x00\x01x', 0)
@@ -0,0 +1,58 @@
+import os
+import time
+
+from amqp_frame_cache import *
+from amqp_frame_store import AMQPFrameStore
+from test.test_frame_store import DUMP
+
+
+def _cache_files(tmpdir):
+    return sorted(name for name in os.listdir(str(tmpdir)) if name.endswith(CACHE_SUFFIX))
+
+
+def test_cached_columns_are_loaded_from_the_mapped_file(tmpdir):
+    cache = FrameCache(str(tmpdir))
+    scanned = cache.get_store(DUMP, "CLIENT")
+    assert 1 == len(_cache_files(tmpdir))
+
+    loaded = cache.get_store(DUMP, "CLIENT")
+    assert isinstance(loaded.offsets, memoryview)
+    for name in COLUMNS:
+        assert list(getattr(scanned, name)) == list(getattr(loaded, name))
+    assert list(AMQPFrameStore.from_buffer(DUMP, "CLIENT")) == list(loaded)
+    assert "connection.start-ok" == loaded[1].method
+
+
+def test_cache_is_keyed_by_content_source_and_version(tmpdir):
+    cache = FrameCache(str(tmpdir))
+    cache.get_store(DUMP, "CLIENT")
+    cache.get_store(DUMP[8:], "SERVER")
+    assert 2 == len(_cache_files(tmpdir))
+    assert all(name.endswith("-v%d%s" % (CACHE_VERSION, CACHE_SUFFIX)) for name in _cache_files(tmpdir))
+
+
+def test_unusable_cache_files_are_replaced(tmpdir):
+    cache = FrameCache(str(tmpdir))
+    path = cache.get_path(DUMP, "CLIENT")
+    with open(path, 'wb') as f:
+        f.write(b'AMQPFRMS\x00\x00')  # truncated header
+    assert cache.load(path, DUMP, "CLIENT") is None
+    assert 4 == len(cache.get_store(DUMP, "CLIENT"))
+    assert cache.load(path, DUMP, "CLIENT") is not None
+    assert cache.load(path, DUMP + b'\x08\x00\x00\x00\x00\x00\x00\xce', "CLIENT") is None  # dump size differs
+
+
+def test_eviction_by_age_and_size(tmpdir):
+    cache = FrameCache(str(tmpdir), max_size=None, max_age=3600)
+    dumps = [DUMP, DUMP[:-11], DUMP[:-19]]
+    paths = [cache.get_path(dump, "CLIENT") for dump in dumps]
+    for index, dump in enumerate(dumps):
+        cache.get_store(dump, "CLIENT")
+        os.utime(paths[index], (time.time() - 100 * (3 - index),) * 2)
+    os.utime(paths[0], (time.time() - 7200,) * 2)
+    cache.evict()
+    assert sorted(os.path.basename(path) for path in paths[1:]) == _cache_files(tmpdir)
+
+    cache.max_size = os.path.getsize(paths[2])
+    cache.evict()
+    assert [os.path.basename(paths[2])] == _cache_files(tmpdir)
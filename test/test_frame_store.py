@@ -0,0 +1,59 @@
+import pytest
+
+from amqp_frame_store import AMQPFrameStore
+from amqp_messages import AMQPFrame, AMQPProtocolHeader
+from amqp_protocol import ProtocolDetective
+from amqp_protocol_parser import AMQPStreamParser, MalformedMessage, CLIENT, SERVER
+from test.test_pcap import CLIENT_DUMP, SERVER_DUMP
+
+DUMP = (b'AMQP\x00\x00\x09\x01'
+        b'\x01\x00\x00\x00\x00\x00\x04\x00\x0a\x00\x0b\xce'
+        b'\x08\x00\x00\x00\x00\x00\x00\xce'
+        b'\x03\x00\x01\x00\x00\x00\x03END\xce')
+
+
+def test_store_columns():
+    store = AMQPFrameStore.from_buffer(DUMP, "CLIENT")
+    assert 4 == len(store)
+    assert [0, 1, 8, 3] == list(store.types)
+    assert [0, 0, 0, 1] == list(store.channels)
+    assert [0, 10, 0, 0] == list(store.class_ids)
+    assert [0, 11, 0, 0] == list(store.method_ids)
+    assert [0, 15, 27, 35] == list(store.offsets)
+    assert [8, 4, 0, 3] == list(store.lengths)
+
+
+def test_store_takes_19_bytes_per_frame():
+    store = AMQPFrameStore.from_buffer(DUMP, "CLIENT")
+    assert 19 == sum(column.itemsize for column in (store.types, store.channels, store.class_ids, store.method_ids,
+                                                     store.offsets, store.lengths))
+
+
+def test_store_frames_match_parser_frames():
+    store = AMQPFrameStore.from_buffer(DUMP, "CLIENT")
+    assert list(AMQPStreamParser(DUMP, "CLIENT")) == list(store)
+    assert AMQPProtocolHeader(0, 0, 9, 1) == store[0]
+    assert AMQPFrame("CLIENT", 3, 1, b'END') == store[-1]
+    assert "connection.start-ok" == store[1].method
+
+
+def test_store_truncated_dump():
+    with pytest.raises(MalformedMessage):
+        AMQPFrameStore.from_buffer(DUMP[:-1], "CLIENT")
+
+
+class _CountingStore(AMQPFrameStore):
+    reads = 0
+
+    def __getitem__(self, index):
+        self.reads += 1
+        return super(_CountingStore, self).__getitem__(index)
+
+
+def test_detective_builds_every_store_frame_once():
+    client_store = _CountingStore.from_buffer(CLIENT_DUMP, CLIENT)
+    server_store = _CountingStore.from_buffer(SERVER_DUMP, SERVER)
+    messages = list(ProtocolDetective(client_store, server_store).iter_messages())
+    assert list(AMQPStreamParser(CLIENT_DUMP, CLIENT)) + list(AMQPStreamParser(SERVER_DUMP, SERVER)) == \
+        sorted(messages, key=lambda message: message.source)
+    assert (len(client_store), len(server_store)) == (client_store.reads, server_store.reads)
@@ -0,0 +1,94 @@
+import struct
+
+import amqp_constants as const
+
+from amqp_latency import *
+from amqp_messages import AMQPFrame, AMQPProtocolHeader
+from amqp_protocol_parser import CLIENT, SERVER
+from test.test_protocol import _get_class_and_method
+
+
+def _frame(source, method_type, channel, timestamp):
+    frame = AMQPFrame(source, const.FRAME_METHOD, channel, _get_class_and_method(method_type))
+    frame.timestamp = timestamp
+    return frame
+
+
+def test_request_replies_come_from_the_grammar():
+    request_replies = get_request_replies()
+    assert {(SERVER, "queue.declare-ok")} == request_replies[CLIENT, "queue.declare"]
+    assert {(SERVER, "basic.get-ok"), (SERVER, "basic.get-empty")} == request_replies[CLIENT, "basic.get"]
+    assert {(CLIENT, "channel.close-ok")} == request_replies[SERVER, "channel.close"]
+    assert (CLIENT, "basic.publish") not in request_replies
+
+
+def test_latency_per_method_and_channel():
+    protocol_header = AMQPProtocolHeader(0, 0, 9, 1)
+    protocol_header.timestamp = 0.5
+    body = AMQPFrame(SERVER, const.FRAME_BODY, 1, b'')
+    body.timestamp = 1.5
+    messages = [protocol_header, _frame(SERVER, "connection.start", 0, 0.502),
+                _frame(CLIENT, "connection.start-ok", 0, 0.51),
+                _frame(CLIENT, "queue.declare", 1, 1.0), _frame(CLIENT, "queue.declare", 2, 1.001),
+                _frame(CLIENT, "basic.get", 1, 1.002), _frame(SERVER, "queue.declare-ok", 2, 1.011),
+                _frame(SERVER, "queue.declare-ok", 1, 1.02), _frame(SERVER, "basic.get-empty", 1, 1.5), body,
+                _frame(CLIENT, "tx.commit", 1, 2.0), _frame(SERVER, "tx.commit-ok", 2, 2.1)]
+    analyzer = LatencyAnalyzer().analyze(messages)
+
+    assert [("basic.get", "basic.get-empty"), ("connection.start", "connection.start-ok"),
+            ("protocol-header", "connection.start"),
+            ("queue.declare", "queue.declare-ok")] == sorted(analyzer.by_method)
+    declare = analyzer.by_method["queue.declare", "queue.declare-ok"]
+    assert (2, 0.01, 0.02) == (declare.count, round(declare.min, 6), round(declare.max, 6))
+    assert 0.02 == round(analyzer.by_channel[1, "queue.declare", "queue.declare-ok"].max, 6)
+    assert 0.498 == round(analyzer.by_channel[1, "basic.get", "basic.get-empty"].max, 6)
+    assert 0.002 == round(analyzer.by_channel[0, "protocol-header", "connection.start"].max, 6)
+    assert {"tx.commit": 1} == analyzer.unanswered
+    assert {"tx.commit-ok": 1} == analyzer.unexpected_replies
+
+    report = list(format_latency_report(analyzer))
+    assert report[1].startswith("basic.get -> basic.get-empty")
+    assert "unanswered requests: tx.commit 1" in report
+
+
+def _declare(channel, timestamp, no_wait):
+    frame = AMQPFrame(CLIENT, const.FRAME_METHOD, channel,
+                      struct.pack("!HHH", 50, 10, 0) + b'\x01q' + (b'\x10' if no_wait else b'\x00') + b'\x00' * 4)
+    frame.timestamp = timestamp
+    return frame
+
+
+def test_no_wait_requests_wait_for_no_reply():
+    messages = [_declare(1, 1.0, True), _declare(1, 1.5, False), _frame(SERVER, "queue.declare-ok", 1, 1.6)]
+    analyzer = LatencyAnalyzer().analyze(messages)
+    assert 0.1 == round(analyzer.by_method["queue.declare", "queue.declare-ok"].max, 6)
+    assert {} == analyzer.unanswered
+
+
+def test_connection_analyzers_merge_for_the_capture():
+    first = LatencyAnalyzer().analyze([_frame(CLIENT, "queue.declare", 1, 1.0),
+                                       _frame(SERVER, "queue.declare-ok", 1, 1.1),
+                                       _frame(CLIENT, "tx.commit", 1, 2.0)])
+    second = LatencyAnalyzer().analyze([_frame(CLIENT, "queue.declare", 1, 1.0),
+                                        _frame(SERVER, "queue.declare-ok", 1, 1.3)])
+    capture = LatencyAnalyzer().merge(first).merge(second)
+
+    declare = capture.by_method["queue.declare", "queue.declare-ok"]
+    assert (2, 0.1, 0.3) == (declare.count, round(declare.min, 6), round(declare.max, 6))
+    assert 0.2 == round(declare.mean, 6)
+    assert {"tx.commit": 1} == capture.unanswered
+    assert {} == capture.by_channel
+    assert "latency per channel (ms)" not in list(format_latency_report(capture))
+    assert 1 == first.by_method["queue.declare", "queue.declare-ok"].count
+
+
+def test_log_histogram_percentiles():
+    histogram = LogHistogram()
+    for value in range(1, 1001):
+        histogram.add(value / 1000.0)
+    assert (1000, 0.001, 1.0) == (histogram.count, histogram.min, histogram.max)
+    assert 0.5005 == round(histogram.mean, 6)
+    for percent in (50, 90, 99):
+        assert abs(histogram.percentile(percent) - percent / 100.0) <= percent / 100.0 * (2 ** 0.125 - 1)
+    assert 1.0 == histogram.percentile(100)
+    assert 1000 == sum(count for _, _, count in histogram)
@@ -0,0 +1,48 @@
+import struct
+
+from amqp_messages import AMQPFrame
+from amqp_method_decoders import *
+
+
+def test_decode_connection_tune_merges_fixed_width_fields():
+    assert ({'channel_max': 2047, 'frame_max': 131072, 'heartbeat': 60}, 8) == \
+        decode_connection_tune(struct.pack("!HLH", 2047, 131072, 60), 0)
+
+
+def test_decode_basic_deliver_bits_and_strings():
+    buffer = (b'\x03ctg'
+              b'\x00\x00\x00\x00\x00\x00\x00\x2a'
+              b'\x01'
+              b'\x02ex'
+              b'\x03key')
+    args, offset = decode_basic_deliver(buffer, 0)
+    assert len(buffer) == offset
+    assert [('consumer_tag', 'ctg'),
+            ('delivery_tag', 42),
+            ('redelivered', True),
+            ('exchange', 'ex'),
+            ('routing_key', 'key')] == list(args.items())
+
+
+def test_decode_queue_declare_skips_reserved_fields():
+    buffer = b'\x00\x00\x01q\x0a\x00\x00\x00\x00'
+    assert ({'queue': 'q', 'passive': False, 'durable': True, 'exclusive': False, 'auto_delete': True,
+             'no_wait': False, 'arguments': {}}, len(buffer)) == decode_queue_declare(buffer, 0)
+
+
+def test_frame_arguments_are_decoded_by_method():
+    frame = AMQPFrame("CLIENT", 1, 1, b'\x00\x3c\x00\x28\x00\x00\x02ex\x03key\x00')
+    assert {'exchange': 'ex', 'routing_key': 'key', 'mandatory': False, 'immediate': False} == frame.args
+    assert "basic.publish(exchange='ex', routing_key='key', mandatory=False, immediate=False)" == frame.parsed_payload
+
+
+def test_frame_arguments_that_do_not_decode_stay_raw():
+    frame = AMQPFrame("CLIENT", 1, 1, b'\x00\x3c\x00\x28\x00\x00\x09ex')
+    assert b'\x00\x00\x09ex' == frame.args
+
+
+def test_frame_arguments_with_unknown_table_value_type_stay_raw():
+    frame = AMQPFrame("CLIENT", 1, 0, b'\x00\x0a\x00\x0b\x00\x00\x00\x07\x01kx\x00\x00\x00\x00'
+                                      b'\x05PLAIN\x00\x00\x00\x00\x05en_US')
+    assert b'\x00\x00\x00\x07\x01kx\x00\x00\x00\x00\x05PLAIN\x00\x00\x00\x00\x05en_US' == frame.args
+    assert "connection.start-ok" in str(frame)
@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+import struct
+import sys
+
+from collections import OrderedDict
+
+import amqp_constants as const
+import amqp_output
+import main
+
+from amqp_content import ContentAssembler
+from amqp_data_types import decode_lazy_field_table
+from amqp_messages import AMQPFrame, AMQPProtocolHeader
+from amqp_output import *
+from amqp_protocol_parser import CLIENT
+from test.test_pcap import CLIENT_DUMP, SERVER_DUMP
+
+
+class RecordingStream(io.StringIO):
+    def __init__(self):
+        super(RecordingStream, self).__init__()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super(RecordingStream, self).write(data)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_messages_are_written_in_batches():
+    stream = RecordingStream()
+    writer = MessageWriter(stream, batch_size=100)
+    writer.write_all(range(250))
+    assert (2, 0) == (stream.writes, stream.flushes)
+    writer.end_connection()
+    assert (3, 1) == (stream.writes, stream.flushes)
+    assert [str(i) for i in range(250)] == stream.getvalue().splitlines()
+    assert stream.getvalue().endswith("249\n")
+
+
+def test_flush_every_n_messages():
+    stream = RecordingStream()
+    writer = MessageWriter(stream, flush_every=10)
+    writer.write_all(range(25))
+    assert 2 == stream.flushes
+    writer.flush()
+    assert 3 == stream.flushes
+    assert 25 == len(stream.getvalue().splitlines())
+    writer.close()
+    assert stream.closed
+
+
+def test_output_file_is_written(tmpdir):
+    output_file = str(tmpdir.join("output.txt"))
+    with MessageWriter(open_output(output_file)) as writer:
+        writer.write("first")
+        writer.write_line("second")
+    assert "first\nsecond\n" == tmpdir.join("output.txt").read()
+    MessageWriter(open_output(None)).close()
+    assert not sys.stdout.closed
+
+
+def test_main_writes_the_output_file(tmpdir, monkeypatch):
+    tmpdir.join("client").write_binary(CLIENT_DUMP)
+    tmpdir.join("server").write_binary(SERVER_DUMP)
+    monkeypatch.setattr(sys, 'argv', ["main.py", str(tmpdir.join("client")), str(tmpdir.join("server")),
+                                      str(tmpdir.join("output.txt"))])
+    main.main()
+    output = tmpdir.join("output.txt").read().splitlines()
+    assert 9 == len(output)
+    assert output[-1].startswith("SERVER: |METHOD|0|4|connection.close-ok")
+
+
+def _record_messages():
+    qos = AMQPFrame(CLIENT, const.FRAME_METHOD, 1, struct.pack("!HHLHB", 60, 10, 0, 10, 0))
+    qos.out_of_order = True
+    header = AMQPFrame(CLIENT, const.FRAME_HEADER, 1, struct.pack("!HHQHB", 60, 0, 2, 0x8000, 4) + b'text')
+    return [AMQPProtocolHeader(0, 0, 9, 1), qos, header, AMQPFrame(CLIENT, const.FRAME_BODY, 1, b'hi')]
+
+
+def test_json_lines_records():
+    stream = io.StringIO()
+    writer = JSONLinesWriter(stream)
+    writer.start_connection("10.0.0.1:40000 -> 10.0.0.2:5672")
+    writer.write_all(_record_messages())
+    writer.flush()
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    assert list(RECORD_FIELDS) == list(records[0])
+    assert ["10.0.0.1:40000 -> 10.0.0.2:5672"] == list(set(record['connection'] for record in records))
+    assert {'proto_id': 0, 'major': 0, 'minor': 9, 'revision': 1} == records[0]['arguments']
+    assert ("METHOD", "basic.qos", 1, 11, True, {'prefetch_size': 0, 'prefetch_count': 10, 'global': False}) == \
+        tuple(records[1][field] for field in ('frame_type', 'method', 'channel', 'payload_length', 'out_of_order',
+                                              'arguments'))
+    assert {'content_type': 'text'} == records[2]['properties']
+    assert ("BODY", 2, None) == (records[3]['frame_type'], records[3]['payload_length'], records[3]['arguments'])
+
+
+def test_json_encodes_lazy_tables_and_raw_bytes():
+    table, _ = decode_lazy_field_table(struct.pack("!LB1sBB", 4, 1, b'a', ord('b'), 7), 0)
+    assert '{"table":{"a":7},"raw":"00ff"}' == \
+        amqp_output._to_json(OrderedDict((('table', table), ('raw', memoryview(b'\x00\xff')))))
+
+
+def test_csv_records():
+    stream = io.StringIO()
+    messages = _record_messages()
+    messages[2:] = ContentAssembler().assemble([AMQPFrame(CLIENT, const.FRAME_METHOD, 1, struct.pack("!HH", 60, 40))]
+                                               + messages[2:])
+    with CSVWriter(stream) as writer:
+        writer.write_all(messages)
+        writer.flush()
+        rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+
+    assert 3 == len(rows)
+    assert ("PROTOCOL_HEADER", "CLIENT", "") == (rows[0]['frame_type'], rows[0]['source'], rows[0]['connection'])
+    assert ("basic.qos", "True") == (rows[1]['method'], rows[1]['out_of_order'])
+    assert {'prefetch_size': 0, 'prefetch_count': 10, 'global': False} == json.loads(rows[1]['arguments'])
+    assert ("CONTENT", "basic.publish", "2", {'content_type': 'text'}) == \
+        (rows[2]['frame_type'], rows[2]['method'], rows[2]['payload_length'], json.loads(rows[2]['properties']))
@@ -0,0 +1,167 @@
+import struct
+
+import amqp_constants as const
+
+from amqp_pcap import *
+from amqp_protocol import ProtocolDetective
+from test.test_protocol import _get_class_and_method
+
+CLIENT_ADDRESS = bytes([10, 0, 0, 1])
+SERVER_ADDRESS = bytes([10, 0, 0, 2])
+
+
+def _method_frame(method_type, channel=0):
+    payload = _get_class_and_method(method_type)
+    return struct.pack("!BHL", const.FRAME_METHOD, channel, len(payload)) + payload + b'\xce'
+
+
+CLIENT_DUMP = b'AMQP\x00\x00\x09\x01' + b''.join(_method_frame(method) for method in (
+    "connection.start-ok", "connection.tune-ok", "connection.open", "connection.close"))
+SERVER_DUMP = b''.join(_method_frame(method) for method in (
+    "connection.start", "connection.tune", "connection.open-ok", "connection.close-ok"))
+
+
+def _tcp(source_port, destination_port, sequence, flags, payload=b''):
+    return struct.pack("!HHLLHHHH", source_port, destination_port, sequence, 0, (5 << 12) | flags, 0, 0, 0) + payload
+
+
+def _ipv4(source, destination, tcp_segment):
+    return struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(tcp_segment), 0, 0, 64, 6, 0, source, destination) + \
+        tcp_segment
+
+
+def _ipv6(source, destination, tcp_segment):
+    return struct.pack("!LHBB16s16s", 6 << 28, len(tcp_segment), 6, 64, source, destination) + tcp_segment
+
+
+def _ethernet(ip_packet):
+    return b'\x00' * 12 + b'\x08\x00' + ip_packet + b'\x00' * 4  # with trailing padding
+
+
+def _pcap(packets, link_type=LINKTYPE_ETHERNET):
+    data = struct.pack("<LHHlLLL", PCAP_MAGIC, 2, 4, 0, 0, 65535, link_type)
+    for timestamp, packet in packets:
+        data += struct.pack("<LLLL", int(timestamp), int(round(timestamp % 1 * 1e6)), len(packet), len(packet)) + packet
+    return data
+
+
+def _pcapng(packets, link_type):
+    def block(block_type, body):
+        body += b'\x00' * (-len(body) % 4)
+        return struct.pack("<LL", block_type, len(body) + 12) + body + struct.pack("<L", len(body) + 12)
+    data = block(PCAPNG_SECTION_HEADER, struct.pack("<LHHq", PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1))
+    data += block(PCAPNG_INTERFACE_DESCRIPTION, struct.pack("<HHL", link_type, 0, 65535) +
+                  struct.pack("<HHB3x", PCAPNG_OPTION_TSRESOL, 1, 9) + struct.pack("<HH", PCAPNG_OPTION_END, 0))
+    for timestamp, packet in packets:
+        nanoseconds = int(round(timestamp * 1e9))
+        data += block(PCAPNG_ENHANCED_PACKET, struct.pack("<LLLLL", 0, nanoseconds >> 32, nanoseconds & 0xffffffff,
+                                                          len(packet), len(packet)) + packet)
+    return data
+
+
+def _connection_segments(client_port, client_isn=1000, server_isn=0xfffffff0, start=1.0):
+    """Segments of a whole connection, some are split, reordered or retransmitted"""
+    c, s = client_isn + 1, server_isn + 1
+    segments = [(start, CLIENT, client_isn, TCP_SYN, b''),
+                (start + 0.001, SERVER, server_isn, TCP_SYN | TCP_ACK, b''),
+                (start + 0.002, CLIENT, c, TCP_ACK, CLIENT_DUMP[:5]),
+                (start + 0.003, CLIENT, c, TCP_ACK, CLIENT_DUMP[:8]),  # retransmission with more data
+                (start + 0.004, SERVER, s, TCP_ACK, SERVER_DUMP[:12]),
+                (start + 0.005, CLIENT, c + 14, TCP_ACK, CLIENT_DUMP[14:20]),  # before the segment in front of it
+                (start + 0.006, CLIENT, c + 8, TCP_ACK, CLIENT_DUMP[8:16]),
+                (start + 0.007, SERVER, s + 12, TCP_ACK, SERVER_DUMP[12:24]),  # the server sequence wraps around
+                (start + 0.008, CLIENT, c + 20, TCP_ACK, CLIENT_DUMP[20:44]),
+                (start + 0.009, SERVER, s + 24, TCP_ACK, SERVER_DUMP[24:36]),
+                (start + 0.010, CLIENT, c + 44, TCP_ACK | TCP_FIN, CLIENT_DUMP[44:]),
+                (start + 0.011, SERVER, s + 36, TCP_ACK | TCP_FIN, SERVER_DUMP[36:])]
+    packets = []
+    for timestamp, source, sequence, flags, payload in segments:
+        sequence &= 0xffffffff
+        if source == CLIENT:
+            tcp_segment = _tcp(client_port, AMQP_PORT, sequence, flags, payload)
+        else:
+            tcp_segment = _tcp(AMQP_PORT, client_port, sequence, flags, payload)
+        packets.append((timestamp, source, tcp_segment))
+    return packets
+
+
+def _write_capture(tmpdir, data):
+    capture_file = tmpdir.join("capture")
+    capture_file.write_binary(data)
+    return str(capture_file)
+
+
+def test_tcp_stream_reassembly():
+    stream = TCPStream()
+    stream.start(0xfffffffe)
+    assert [] == stream.add(2, b'defg', 2.0)  # after the sequence number wrapped around
+    assert [(b'abc', 1.0), (b'defg', 2.0)] == stream.add(0xffffffff, b'abc', 1.0)
+    assert [] == stream.add(0xffffffff, b'abcd', 3.0)
+    assert [(b'hi', 3.0)] == stream.add(5, b'ghi', 3.0)
+
+
+def test_tcp_stream_skips_holes_at_the_end():
+    stream = TCPStream()
+    stream.start(0)
+    assert [] == stream.add(5, b'xyz', 1.0)
+    assert [(b'xyz', 1.0)] == stream.flush()
+    assert 4 == stream.skipped
+
+
+def _ethernet_packets(client_port, delay=0.0):
+    return [(timestamp + delay, _ethernet(_ipv4(*addresses, tcp_segment)))
+            for timestamp, source, tcp_segment in _connection_segments(client_port)
+            for addresses in [(CLIENT_ADDRESS, SERVER_ADDRESS) if source == CLIENT
+                              else (SERVER_ADDRESS, CLIENT_ADDRESS)]]
+
+
+def test_read_pcap_connections(tmpdir):
+    packets = _ethernet_packets(40000) + _ethernet_packets(40001, delay=0.0005)
+    packets.sort(key=lambda packet: packet[0])
+    connections = list(iter_capture_connections(_write_capture(tmpdir, _pcap(packets))))
+
+    assert ["10.0.0.1:40000 -> 10.0.0.2:5672", "10.0.0.1:40001 -> 10.0.0.2:5672"] == \
+        [str(connection) for connection in connections]
+    for connection in connections:
+        assert connection.error is None
+        result = list(ProtocolDetective.validator(connection.messages).iter_messages())
+        assert ["protocol-header", "connection.start", "connection.start-ok", "connection.tune",
+                "connection.tune-ok", "connection.open", "connection.open-ok", "connection.close",
+                "connection.close-ok"] == [message.method for message in result]
+        assert not any(message.out_of_order for message in result)
+        assert 5 == len(connection.client_messages)
+        start = 1.0 + (connection.client[1] - 40000) * 0.0005
+        assert [0.003, 0.004, 0.005, 0.007, 0.008, 0.008, 0.009, 0.010, 0.011] == \
+            [round(message.timestamp - start, 6) for message in result]
+
+
+def test_retransmitted_syn_does_not_restart_the_connection(tmpdir):
+    syn = _ethernet_packets(40000)[0]
+    packets = [syn, (syn[0] + 0.0005, syn[1])] + _ethernet_packets(40000)[1:]
+    packets.insert(4, (1.0025, syn[1]))  # after the first data
+    packets += [(timestamp + 1.0, packet) for timestamp, packet in _ethernet_packets(40000)]  # the port is reused
+    connections = list(iter_capture_connections(_write_capture(tmpdir, _pcap(packets))))
+
+    assert ["10.0.0.1:40000 -> 10.0.0.2:5672"] * 2 == [str(connection) for connection in connections]
+    assert [9, 9] == [len(connection.messages) for connection in connections]
+    assert [None, None] == [connection.error for connection in connections]
+
+
+def test_read_pcapng_ipv6_connection(tmpdir):
+    client_address, server_address = b'\xfe\x80' + b'\x00' * 13 + b'\x01', b'\xfe\x80' + b'\x00' * 13 + b'\x02'
+    sll2_header = struct.pack("!HHLHBB8s", ETHERTYPE_IPV6, 0, 1, 1, 0, 6, b'')
+    packets = [(timestamp, sll2_header + _ipv6(*addresses, tcp_segment))
+               for timestamp, source, tcp_segment in _connection_segments(40000)
+               for addresses in [(client_address, server_address) if source == CLIENT
+                                 else (server_address, client_address)]]
+    connections = list(iter_capture_connections(_write_capture(tmpdir, _pcapng(packets, LINKTYPE_LINUX_SLL2))))
+
+    assert ["[fe80::1]:40000 -> [fe80::2]:5672"] == [str(connection) for connection in connections]
+    assert 9 == len(connections[0].messages)
+    assert 1.011 == round(connections[0].messages[-1].timestamp, 6)
+
+
+def test_capture_ports_are_configurable(tmpdir):
+    capture = _write_capture(tmpdir, _pcap(_ethernet_packets(40000)))
+    assert [] == list(iter_capture_connections(capture, ports=[5671]))
+    assert 1 == len(list(iter_capture_connections(capture, ports=[5671, AMQP_PORT])))
@@ -0,0 +1,51 @@
+from amqp_messages import AMQPFrame
+from amqp_properties import *
+
+
+def test_get_property_decoders_follows_flag_order():
+    names = [name for name, _ in get_property_decoders(60, (0b1011000000000000,))]
+    assert ['content_type', 'headers', 'delivery_mode'] == names
+    assert get_property_decoders(60, (0b1011000000000000,)) is get_property_decoders(60, (0b1011000000000000,))
+
+
+def test_decode_properties():
+    buffer = (b'\xb0\x00'
+              b'\x0atext/plain'
+              b'\x00\x00\x00\x08\x01kb\x01\x01kb\x02'
+              b'\x02')
+    properties, offset = decode_properties(60, buffer, 0)
+    assert len(buffer) == offset
+    assert [('content_type', 'text/plain'),
+            ('headers', {'k': 2}),
+            ('delivery_mode', 2)] == list(properties.items())
+
+
+def test_decode_properties_with_continuation_flags():
+    properties, offset = decode_properties(60, b'\x00\x01\x00\x00', 0)
+    assert {} == properties
+    assert 4 == offset
+
+
+def test_header_frame_properties():
+    frame = AMQPFrame("CLIENT", 2, 1,
+                      b'\x00\x3c\x00\x00\x00\x00\x00\x00\x00\x00\x00\x03'
+                      b'\x10\x00\x01')
+    assert {'delivery_mode': 1} == frame.properties
+    assert "basic.HEADER(weight=0, frame_body_size=3, delivery_mode=1)" == frame.parsed_payload
+
+
+def test_header_frame_with_unknown_header_type_keeps_raw_properties():
+    # RabbitMQ's 'x' byte array is not an AMQP 0-9-1 field type
+    frame = AMQPFrame("CLIENT", 2, 1,
+                      b'\x00\x3c\x00\x00\x00\x00\x00\x00\x00\x00\x00\x03'
+                      b'\x20\x00\x00\x00\x00\x07\x01kx\x00\x00\x00\x00')
+    assert frame.property_flags == frame.properties
+    assert str(frame)
+
+
+def test_header_values_that_do_not_decode_stay_raw():
+    frame = AMQPFrame("CLIENT", 2, 1,
+                      b'\x00\x3c\x00\x00\x00\x00\x00\x00\x00\x00\x00\x03'
+                      b'\x20\x00\x00\x00\x00\x0e\x01kS\x00\x00\x00\x01\xff\x01lS\x00\x00\x00\x00')
+    assert {'k': b'\x00\x00\x00\x01\xff', 'l': ''} == dict(frame.properties['headers'])  # raw encoded value
+    assert "headers={'k': b'\\x00\\x00\\x00\\x01\\xff', 'l': ''}" in str(frame)
@@ -7,7 +7,8 @@ import time
 import amqp_constants as const
 import amqp_protocol_parser as parser
 
-from amqp_protocol import _get_array_name, ProtocolDetective
+from amqp_protocol import _get_array_name, ProtocolDetective, ProtocolMismatch
+from amqp_protocol_grammar import compile_step
 from amqp_messages import AMQPProtocolHeader, AMQPFrame
 
 
@@ -288,3 +289,200 @@ def test_atomic_rule_matching_SINGLE_CHALLENGE_EXCHANGE_ignore_heartbeats():
     assert result.index(server_request) < result.index(client_response), \
         "Server request should have been before client response: %s" % result
     assert all([not message.out_of_order for message in result])
+
+
+@timeout(1)
+def test_analysis_reads_messages_without_consuming_them():
+    client_messages = make_messages("C:basic.publish", "C:HEADER", "C:BODY")
+    server_messages = make_messages("S:basic.ack")
+    protocol_analyzer = ProtocolDetective(client_messages, server_messages)
+
+    protocol_analyzer._analyze_protocol_part("publish")
+
+    assert 3 == len(client_messages)
+    assert 1 == len(server_messages)
+    assert 3 == protocol_analyzer.client_messages.position
+    assert 1 == protocol_analyzer.server_messages.position
+    assert protocol_analyzer.processed_messages == make_messages("C:basic.publish", "S:basic.ack",
+                                                                 "C:HEADER", "C:BODY")
+
+
+@timeout(5)
+def test_long_stream_analysis_is_linear():
+    client_messages = make_messages("C:channel.open", *(["C:basic.publish", "C:HEADER", "C:BODY"] * 5000))
+    server_messages = make_messages("S:channel.open-ok")
+    protocol_analyzer = ProtocolDetective(client_messages, server_messages)
+
+    protocol_analyzer._analyze_protocol_part("open-channel")
+    protocol_analyzer._analyze_protocol_part("*use-channel")
+
+    assert 15002 == len(protocol_analyzer.processed_messages)
+
+
+@timeout(1)
+def test_alternative_rule_matching_backtracks_GET():
+    client_messages = make_messages("C:basic.get", "C:basic.get")
+    server_messages = make_messages("S:basic.get-empty", "S:basic.get-ok", "S:BODY")
+    protocol_analyzer = ProtocolDetective(client_messages, server_messages)
+
+    protocol_analyzer._analyze_protocol_part("get")
+    protocol_analyzer._analyze_protocol_part("get")
+    result = protocol_analyzer.processed_messages
+
+    assert result == make_messages("C:basic.get", "S:basic.get-empty",
+                                   "C:basic.get", "S:basic.get-ok", "S:BODY")
+
+
+@timeout(1)
+def test_failed_rule_restores_stream_positions():
+    client_messages = make_messages("C:HEARTBEAT", "C:channel.open")
+    server_messages = make_messages("S:channel.close")
+    protocol_analyzer = ProtocolDetective(client_messages, server_messages)
+
+    with pytest.raises(ProtocolMismatch):
+        protocol_analyzer._analyze_protocol_part("open-channel")
+
+    assert [] == protocol_analyzer.processed_messages
+    assert 0 == protocol_analyzer.client_messages.position
+    assert 0 == protocol_analyzer.server_messages.position
+
+
+@timeout(1)
+def test_rule_results_are_memoized():
+    protocol_analyzer = ProtocolDetective(make_messages("C:basic.get"), make_messages("S:basic.get-empty"))
+
+    protocol_analyzer._analyze_protocol_part("get-empty")
+    get, get_empty = protocol_analyzer.processed_messages
+    assert (1, 1, (get, get_empty)) == protocol_analyzer._memo[compile_step("get-empty"), 0, 0]
+    protocol_analyzer.client_messages.position = protocol_analyzer.server_messages.position = 0
+    protocol_analyzer.processed_messages = []
+    # a replayed result does not read the messages again
+    protocol_analyzer.client_messages.messages = []
+    protocol_analyzer.server_messages.messages = []
+    protocol_analyzer._analyze_protocol_part("get-empty")
+
+    assert [get, get_empty] == protocol_analyzer.processed_messages
+
+
+@timeout(1)
+def test_repetitions_only_forget_the_results_of_their_iterations():
+    protocol_analyzer = ProtocolDetective(make_messages("C:channel.open", "C:basic.qos", "C:basic.qos"),
+                                          make_messages("S:channel.open-ok", "S:basic.qos-ok", "S:basic.qos-ok"))
+
+    protocol_analyzer._analyze_protocol_part("open-channel")
+    protocol_analyzer._analyze_protocol_part("*use-channel")
+
+    assert 6 == len(protocol_analyzer.processed_messages)
+    memoized = [(node.name, client_position, server_position)
+                for node, client_position, server_position in protocol_analyzer._memo]
+    # the finished iterations started at 1 and 2, the failed attempt of a third one at the end is kept
+    assert ("open-channel", 0, 0) == memoized[0]
+    assert ("*use-channel", 1, 1) == memoized[-1]
+    assert {3} == set(client_position for _, client_position, _ in memoized[1:-1])
+
+
+def _make_connection_messages(publishes):
+    client_messages = make_messages("C:protocol-header",
+                                    "C:connection.start-ok",
+                                    "C:connection.tune-ok",
+                                    "C:connection.open",
+                                    "C:channel.open",
+                                    *(["C:basic.publish", "C:HEADER", "C:BODY"] * publishes +
+                                      ["C:channel.close", "C:connection.close"]))
+    server_messages = make_messages("S:connection.start",
+                                    "S:connection.tune",
+                                    "S:connection.open-ok",
+                                    "S:channel.open-ok",
+                                    "S:channel.close-ok",
+                                    "S:connection.close-ok")
+    return client_messages, server_messages
+
+
+@timeout(2)
+def test_online_analysis_of_message_iterators():
+    client_messages, server_messages = _make_connection_messages(1000)
+    pulled = []
+
+    def iterate(messages):
+        for message in messages:
+            pulled.append(message)
+            yield message
+
+    protocol_analyzer = ProtocolDetective(iterate(client_messages), iterate(server_messages))
+    result = protocol_analyzer.iter_messages()
+
+    online_messages = [next(result)]
+    assert get_message("C:protocol-header") == online_messages[0]
+    assert len(pulled) < 10
+    pending = []  # frames pulled from the streams but not handed out yet, the whole connection is a single channel
+    for message in result:
+        online_messages.append(message)
+        pending.append(len(pulled) - len(online_messages))
+    assert max(pending) < 10
+    assert len(client_messages) + len(server_messages) == len(pulled)
+    assert ProtocolDetective(client_messages, server_messages).analyze() == online_messages
+    assert not any(message.out_of_order for message in online_messages)
+
+
+@timeout(1)
+def test_online_analysis_marks_leftover_messages_out_of_order():
+    client_messages, server_messages = _make_connection_messages(1)
+    client_messages += make_messages("C:basic.publish")
+
+    result = list(ProtocolDetective(iter(client_messages), iter(server_messages)).iter_messages())
+
+    assert len(client_messages) + len(server_messages) == len(result)
+    assert result[-1].out_of_order
+    assert not any(message.out_of_order for message in result[:-1])
+
+
+@timeout(1)
+def test_rejections_blocking_and_server_channel_close():
+    client_messages = make_messages("C:protocol-header", "C:connection.start-ok", "C:connection.tune-ok",
+                                    "C:connection.open", "C:channel.open", "C:basic.reject", "C:basic.nack",
+                                    "C:channel.close-ok", "C:connection.close")
+    server_messages = make_messages("S:connection.start", "S:connection.tune", "S:connection.open-ok",
+                                    "S:connection.blocked", "S:connection.unblocked", "S:channel.open-ok",
+                                    "S:basic.nack", "S:channel.close", "S:connection.close-ok")
+
+    result = ProtocolDetective(client_messages, server_messages).analyze()
+
+    assert len(client_messages) + len(server_messages) == len(result)
+    assert not any(message.out_of_order for message in result)
+    assert result.index(server_messages[-2]) < result.index(client_messages[-2])
+
+
+@timeout(2)
+def test_analysis_recovers_from_an_unexpected_message():
+    client_messages, server_messages = _make_connection_messages(1000)
+    expected = ProtocolDetective(client_messages, server_messages).analyze()
+    unexpected = get_message("C:basic.qos-ok")
+    client_messages.insert(500, unexpected)
+
+    result = ProtocolDetective(client_messages, server_messages, recover=True).analyze()
+
+    assert [message for message in result if message.out_of_order] == [unexpected]
+    assert expected == [message for message in result if message is not unexpected]
+
+
+@timeout(1)
+def test_analysis_recovers_from_a_lost_frame():
+    client_messages, server_messages = _make_connection_messages(3)
+    del client_messages[9]  # the HEADER of the second publish
+
+    result = ProtocolDetective(client_messages, server_messages, recover=True).analyze()
+
+    # the publish already started when its header went missing, only its body is left over
+    assert ["BODY"] == [message.method for message in result if message.out_of_order]
+    assert result[-4:] == make_messages("C:channel.close", "S:channel.close-ok",
+                                        "C:connection.close", "S:connection.close-ok")
+
+
+@timeout(1)
+def test_analysis_without_recovery_alternates_the_remaining_messages():
+    client_messages, server_messages = _make_connection_messages(3)
+    client_messages.insert(5, get_message("C:basic.qos-ok"))
+
+    result = ProtocolDetective(client_messages, server_messages, recover=False).analyze()
+
+    assert 14 == len([message for message in result if message.out_of_order])  # all after the channel opening
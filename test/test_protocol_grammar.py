@@ -0,0 +1,51 @@
+import pytest
+
+from amqp_protocol_grammar import *
+
+
+def test_atomic_step_compilation():
+    node = compile_step("C:basic.publish")
+    assert ATOMIC == node.kind
+    assert CLIENT == node.source
+    assert "basic.publish" == node.method
+
+
+def test_quantifier_compilation():
+    node = compile_step("?S:basic.ack")
+    assert OPTIONAL == node.kind
+    assert SERVER == node.children[0].source
+    node = compile_step("*challenge")
+    assert REPEAT == node.kind
+    assert SEQUENCE == node.children[0].kind
+    assert ["S:connection.secure", "C:connection.secure-ok"] == [child.name for child in node.children[0].children]
+
+
+def test_alternative_compilation():
+    node = compile_step("close-connection").children[0]
+    assert ALTERNATIVE == node.kind
+    assert ["client-close", "server-close"] == [child.name for child in node.children]
+
+
+def test_rules_are_compiled_once():
+    assert compile_step("publish") is compile_step("publish")
+    assert compile_step("?publish").children[0] is compile_step("*publish").children[0]
+
+
+def test_invalid_grammar():
+    with pytest.raises(GrammarError):
+        compile_step("?C:basic.ack | S:basic.ack")
+    with pytest.raises(GrammarError):
+        compile_step("no-such-rule")
+
+
+def test_first_messages():
+    assert {(SERVER, "basic.deliver")} == compile_step("deliver").first
+    assert {(CLIENT, "basic.get")} == compile_step("get").first
+    assert {(CLIENT, "channel.close"), (SERVER, "channel.close")} == compile_step("close-channel").first
+    assert (SERVER, "connection.close") in compile_step("resync").first
+
+
+def test_predictive_alternatives():
+    assert compile_step("connection-activity").children[0].predictive
+    assert not compile_step("get").children[0].predictive  # both alternatives start with C:basic.get
+    assert not compile_step("channel").predictive
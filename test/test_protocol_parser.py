@@ -1,7 +1,11 @@
 import pytest
 import sys
 
+import main
+
+from amqp_messages import LAZY_ATTRIBUTES
 from amqp_protocol_parser import *
+from test.test_pcap import CLIENT_DUMP
 
 
 def test_frame_extraction_from_empty_stream():
@@ -27,4 +31,143 @@ def test_single_frame_extraction():
     for message in parser:
         messages.append(message)
     assert len(messages) == 1
-    assert AMQPFrame("CLIENT", 1, 0, b'\x00\x0a\x00\x1f\xff\xff\x00\x02\x00\x00\x00\x05') == messages[0]
\ No newline at end of file
+    assert AMQPFrame("CLIENT", 1, 0, b'\x00\x0a\x00\x1f\xff\xff\x00\x02\x00\x00\x00\x05') == messages[0]
+
+
+def test_multiple_frame_extraction():
+    parser = AMQPStreamParser(b'AMQP\x00\x00\x09\x01'
+                              b'\x08\x00\x00\x00\x00\x00\x00\xce'
+                              b'\x03\x00\x01\x00\x00\x00\x03END\xce', "CLIENT")
+    messages = [message for message in parser]
+    assert len(messages) == 3
+    assert AMQPProtocolHeader(0, 0, 9, 1) == messages[0]
+    assert AMQPFrame("CLIENT", 8, 0, b'') == messages[1]
+    assert AMQPFrame("CLIENT", 3, 1, b'END') == messages[2]
+
+
+def test_zero_copy_frame_extraction():
+    dump = bytearray(b'\x03\x00\x01\x00\x00\x00\x03END\xce')
+    parser = AMQPStreamParser(dump, "SERVER", zero_copy=True)
+    messages = [message for message in parser]
+    assert len(messages) == 1
+    assert isinstance(messages[0].payload, memoryview)
+    dump[7:10] = b'end'
+    assert b'end' == messages[0].payload.tobytes()
+
+
+def test_truncated_frame_extraction():
+    parser = AMQPStreamParser(b'\x03\x00\x01\x00\x00\x00\x03EN', "SERVER")
+    with pytest.raises(MalformedMessage):
+        next(parser)
+
+
+def test_incremental_frame_extraction_byte_by_byte():
+    dump = (b'AMQP\x00\x00\x09\x01'
+            b'\x08\x00\x00\x00\x00\x00\x00\xce'
+            b'\x03\x00\x01\x00\x00\x00\x03END\xce')
+    parser = AMQPIncrementalParser("CLIENT")
+    messages = []
+    for i in range(len(dump)):
+        messages.extend(parser.feed(dump[i:i + 1]))
+    parser.close()
+    assert [AMQPProtocolHeader(0, 0, 9, 1),
+            AMQPFrame("CLIENT", 8, 0, b''),
+            AMQPFrame("CLIENT", 3, 1, b'END')] == messages
+    assert len(dump) == parser.offset
+
+
+def test_incremental_parser_keeps_only_partial_frame():
+    parser = AMQPIncrementalParser("SERVER")
+    messages = parser.feed(b'\x08\x00\x00\x00\x00\x00\x00\xce\x03\x00\x01\x00\x00\x00\x03E')
+    assert [AMQPFrame("SERVER", 8, 0, b'')] == messages
+    assert b'\x03\x00\x01\x00\x00\x00\x03E' == parser.buffer
+    with pytest.raises(MalformedMessage):
+        parser.close()
+
+
+def _get_decoded_attributes(frame):
+    """The lazy attributes set on the frame, read from the slots so nothing gets decoded"""
+    decoded = []
+    for name in LAZY_ATTRIBUTES:
+        try:
+            getattr(AMQPFrame, name).__get__(frame, AMQPFrame)
+            decoded.append(name)
+        except AttributeError:
+            pass
+    return decoded
+
+
+def test_frame_payload_is_decoded_on_first_access():
+    frame = AMQPFrame("CLIENT", 2, 1, b'\x00\x3c\x00\x00\x00\x00\x00\x00\x00\x00\x00\x03\x80\x00')
+    assert [] == _get_decoded_attributes(frame)
+    assert frame._parsed_payload is None
+    assert 60 == frame.class_id
+    assert 3 == frame.frame_body_size
+    assert b'\x80\x00' == frame.property_flags
+    assert "HEADER" == frame.method
+    assert "CLIENT: |HEADER|1|14|basic.HEADER(weight=0, frame_body_size=3, property_flags=b'\\x80\\x00')|END|" == \
+        str(frame)
+
+
+DAMAGED_DUMP = (b'\x00\x01\x02\xce'  # tail of a frame, the capture started mid-connection
+                b'\x08\x00\x00\x00\x00\x00\x00\xce'
+                b'\x03\x00\x01\x00\x00\x00\x04EN\xce'  # wrong size
+                b'\x03\x00\x01\x00\x00\x00\x03END\xce'
+                b'\x03\x00\x01\x00\x00\x00\x03EN')  # truncated
+
+
+def test_recover_from_malformed_frames():
+    parser = AMQPStreamParser(DAMAGED_DUMP, "SERVER", recover=True)
+    messages = [message for message in parser]
+    assert [AMQPFrame("SERVER", 8, 0, b''), AMQPFrame("SERVER", 3, 1, b'END')] == messages
+    assert [ParseGap(0, 4, "Unknown frame type: 0"),
+            ParseGap(12, 10, "Invalid frame end marker: 0x0"),
+            ParseGap(33, 9, "Truncated frame")] == parser.gaps
+
+
+def test_incremental_recover_from_malformed_frames():
+    parser = AMQPIncrementalParser("SERVER", recover=True)
+    messages = []
+    for i in range(len(DAMAGED_DUMP)):
+        messages.extend(parser.feed(DAMAGED_DUMP[i:i + 1]))
+    parser.close()
+    assert [AMQPFrame("SERVER", 8, 0, b''), AMQPFrame("SERVER", 3, 1, b'END')] == messages
+    assert [ParseGap(0, 4, "Unknown frame type: 0"),
+            ParseGap(12, 10, "Invalid frame end marker: 0x0"),
+            ParseGap(33, 9, "Truncated frame")] == parser.gaps
+
+
+def test_malformed_frame_without_recovery():
+    with pytest.raises(MalformedMessage):
+        list(AMQPStreamParser(DAMAGED_DUMP, "SERVER"))
+
+
+TIMESTAMPED_DUMP = (b'AMQP\x00\x00\x09\x01'
+                    b'\x08\x00\x00\x00\x00\x00\x00\xce'
+                    b'\x03\x00\x01\x00\x00\x00\x03END\xce')
+SEGMENT_TIMESTAMPS = [(0, 1.0), (10, 2.0), (20, 3.0)]  # the second frame is split over the last 2 segments
+
+
+def test_frames_get_the_timestamp_of_their_last_segment():
+    parser = AMQPStreamParser(TIMESTAMPED_DUMP, "CLIENT", timestamps=SEGMENT_TIMESTAMPS)
+    assert [1.0, 2.0, 3.0] == [message.timestamp for message in parser]
+    assert [None, None, None] == [message.timestamp for message in AMQPStreamParser(TIMESTAMPED_DUMP, "CLIENT")]
+
+
+def test_incremental_frames_get_the_timestamp_of_their_last_segment(tmpdir):
+    dump_file = tmpdir.join("dump")
+    dump_file.write_binary(TIMESTAMPED_DUMP)
+    messages = list(feed_file(AMQPIncrementalParser("CLIENT"), str(dump_file), chunk_size=4,
+                              timestamps=SEGMENT_TIMESTAMPS))
+    assert [1.0, 2.0, 3.0] == [message.timestamp for message in messages]
+
+
+def test_iter_messages_from_memory_mapped_dump(tmpdir, capsys):
+    tmpdir.join("client").write_binary(CLIENT_DUMP + CLIENT_DUMP[8:12])  # ends with a truncated frame
+    arguments = main._parse_arguments([str(tmpdir.join("client")), str(tmpdir.join("server")), "--mmap",
+                                       "--recover"])
+    messages = list(main._iter_messages(str(tmpdir.join("client")), CLIENT, arguments))
+    assert ["protocol-header", "connection.start-ok", "connection.tune-ok", "connection.open",
+            "connection.close"] == [message.method for message in messages]
+    assert isinstance(messages[1].payload, memoryview)
+    assert "CLIENT: skipped 4 bytes at offset %d: Truncated frame\n" % len(CLIENT_DUMP) == capsys.readouterr().err
@@ -0,0 +1,47 @@
+import json
+
+import amqp_constants as const
+
+from amqp_messages import AMQPFrame
+from amqp_protocol_parser import AMQPStreamParser, CLIENT, SERVER
+from amqp_stats import *
+from test.test_latency import _frame
+from test.test_pcap import CLIENT_DUMP, SERVER_DUMP
+
+
+def test_totals_count_the_wire_bytes():
+    collector = StatsCollector()
+    collector.add_all(AMQPStreamParser(CLIENT_DUMP, CLIENT))
+    collector.add_all(AMQPStreamParser(SERVER_DUMP, SERVER))
+    collector.add(AMQPFrame(SERVER, const.FRAME_HEARTBEAT, 0, b''))
+
+    assert [((CLIENT,), [5, len(CLIENT_DUMP)]), ((SERVER,), [5, len(SERVER_DUMP) + 8])] == \
+        collector.get_totals("source")
+    assert ((SERVER, "HEARTBEAT"), [1, 8]) in collector.get_totals("source", "method")
+    assert ((CLIENT, 0, "protocol-header"), [1, 8]) in collector.get_totals("source", "channel", "method")
+    assert [] == list(collector.get_rates())
+
+
+def test_rates_per_window():
+    collector = StatsCollector(window=0.5)
+    collector.add_all([_frame(CLIENT, "basic.publish", 1, 10.1), _frame(CLIENT, "basic.publish", 1, 10.2),
+                       _frame(SERVER, "basic.ack", 1, 10.3), _frame(SERVER, "basic.deliver", 2, 10.4),
+                       _frame(CLIENT, "basic.ack", 2, 11.2), _frame(CLIENT, "queue.declare", 2, 11.3)])
+
+    assert [(10.0, [4.0, 2.0, 0.0, 2.0, 0.0]), (11.0, [0.0, 0.0, 2.0, 0.0, 0.0])] == \
+        [(start, list(rates.values())) for start, _, rates in collector.get_rates()]
+    assert [(10.0, (CLIENT, 1), [4.0, 0.0, 0.0, 0.0, 0.0]), (10.0, (SERVER, 1), [0.0, 0.0, 0.0, 2.0, 0.0]),
+            (10.0, (SERVER, 2), [0.0, 2.0, 0.0, 0.0, 0.0]), (11.0, (CLIENT, 2), [0.0, 0.0, 2.0, 0.0, 0.0])] == \
+        [(start, group, list(rates.values())) for start, group, rates in collector.get_rates("source", "channel")]
+    assert (10.1, 11.3) == (collector.first_timestamp, collector.last_timestamp)
+    assert [((1,), [3, 36]), ((2,), [3, 36])] == collector.get_totals("channel")
+
+    record = json.loads(json.dumps(get_stats_record(collector)))
+    assert {'start': 11.0, 'publish': 0.0, 'deliver': 0.0, 'ack': 2.0, 'confirm': 0.0, 'reject': 0.0} == \
+        record['rates'][1]
+    assert 5 == len(record['totals'])
+    assert {'start': 10.0, 'source': SERVER, 'channel': 2, 'publish': 0.0, 'deliver': 2.0, 'ack': 0.0,
+            'confirm': 0.0, 'reject': 0.0} == record['channel_rates'][2]
+    table = list(format_stats_table(collector))
+    assert "window start" in table[-5]
+    assert "%-18.3f %-6s %7d" % (11.0, CLIENT, 2) == table[-1][:33]
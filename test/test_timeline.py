@@ -0,0 +1,61 @@
+import pytest
+
+from amqp_timeline import *
+from test.test_protocol import make_messages, _make_connection_messages
+
+
+def _set_timestamps(messages, timestamps):
+    for message, timestamp in zip(messages, timestamps):
+        message.timestamp = timestamp
+    return messages
+
+
+def test_merge_by_timestamp():
+    client_messages = _set_timestamps(make_messages("C:basic.get", "C:basic.get"), [1.0, 3.0])
+    server_messages = _set_timestamps(make_messages("S:basic.get-empty", "S:basic.get-ok", "S:BODY"), [2.0, 4.0, 4.0])
+    merged = list(merge_by_timestamp(client_messages, server_messages))
+    assert merged == make_messages("C:basic.get", "S:basic.get-empty", "C:basic.get", "S:basic.get-ok", "S:BODY")
+
+
+def test_merge_keeps_stream_order_for_equal_timestamps():
+    client_messages = _set_timestamps(make_messages("C:channel.close"), [1.0])
+    server_messages = _set_timestamps(make_messages("S:channel.close-ok"), [1.0])
+    assert make_messages("C:channel.close", "S:channel.close-ok") == \
+        list(merge_by_timestamp(client_messages, server_messages))
+
+
+def test_merge_requires_timestamps():
+    with pytest.raises(ValueError):
+        list(merge_by_timestamp(make_messages("C:basic.get"), make_messages("S:basic.get-empty")))
+
+
+def _make_timestamped_connection():
+    client_messages, server_messages = _make_connection_messages(2)
+    _set_timestamps(client_messages, [0, 2, 4, 5, 7, 9, 10, 11, 12, 13, 14, 15, 17])
+    _set_timestamps(server_messages, [1, 3, 6, 8, 16, 18])
+    return client_messages, server_messages
+
+
+def test_analyze_by_timestamp():
+    client_messages, server_messages = _make_timestamped_connection()
+    result = list(analyze_by_timestamp(iter(client_messages), iter(server_messages)))
+    assert [message.timestamp for message in result] == list(range(19))
+    assert not any(message.out_of_order for message in result)
+
+
+def test_analyze_by_timestamp_marks_protocol_violations():
+    client_messages, server_messages = _make_timestamped_connection()
+    server_messages[1].timestamp = 1.5  # connection.tune before connection.start-ok
+    result = list(analyze_by_timestamp(client_messages, server_messages))
+    assert len(client_messages) + len(server_messages) == len(result)
+    assert [message.timestamp for message in result] == sorted(message.timestamp for message in result)
+    assert [False, False, True] == [message.out_of_order for message in result[:3]]
+
+
+def test_load_timestamp_index(tmpdir):
+    index_file = tmpdir.join("index")
+    index_file.write("# offset timestamp\n0 1500000000.5\n\n1460 1500000000.75\n")
+    assert [(0, 1500000000.5), (1460, 1500000000.75)] == load_timestamp_index(str(index_file))
+    index_file.write("10 1.0\n0 2.0\n")
+    with pytest.raises(ValueError):
+        load_timestamp_index(str(index_file))